@@ -0,0 +1,230 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The alias every agent has on its working draft
+TEST_ALIAS_ID = "TSTALIASID"
+
+
+def _alias(summary):
+    return {
+        "agent_alias_id": summary["agentAliasId"],
+        "agent_alias_name": summary["agentAliasName"],
+        "agent_alias_status": summary.get("agentAliasStatus"),
+        "agent_versions": [route.get("agentVersion") for route in summary.get("routingConfiguration") or []],
+        "updated_at": summary.get("updatedAt"),
+    }
+
+
+def _default_alias(aliases):
+    # The most recently updated prepared alias that is not the test alias, of those
+    # updated together the one on the highest version
+    candidates = [alias for alias in aliases
+                  if alias["agent_alias_id"] != TEST_ALIAS_ID and alias["agent_alias_status"] == "PREPARED"]
+    if not candidates:
+        return None
+
+    def newest(alias):
+        versions = [int(version) for version in alias["agent_versions"] if str(version).isdigit()]
+        return str(alias["updated_at"] or ""), max(versions, default=-1)
+
+    return max(candidates, key=newest)["agent_alias_id"]
+
+
+class AgentRegistry():
+    """
+    Keeps the agents of the account and their aliases in memory, indexed by agent
+    name and by agent id, so the request path looks agents up without calling the
+    bedrock-agent api. A refresh follows every page of list_agents and of
+    list_agent_aliases for each agent, builds new indexes and swaps them in at once,
+    so readers never see a half built registry and take no lock. The first lookup
+    loads the registry, a background thread reloads it every ttl_seconds. When a
+    refresh fails the last registry is kept and the refresh is tried again after
+    retry_seconds.
+    """
+
+    def __init__(self,
+                 client,
+                 ttl_seconds=300,
+                 retry_seconds=30,
+                 page_size=100,
+                 max_workers=4,
+                 background=True):
+        """
+        Initializes the registry, nothing is loaded before the first lookup
+        :param client: A boto3 bedrock-agent client
+        :param ttl_seconds: Seconds between two refreshes
+        :param retry_seconds: Seconds before a failed refresh is tried again
+        :param page_size: maxResults of every list call
+        :param max_workers: The number of agents whose aliases are listed at once
+        :param background: If true a daemon thread refreshes the registry, else a
+        lookup refreshes it when it is older than ttl_seconds
+        """
+        self.module = "AgentRegistry"
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.background = background
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._counts = {"refreshes": 0, "failures": 0, "list_calls": 0, "last_refresh_seconds": None}
+
+    def refresh(self):
+        """
+        Reloads all agents and aliases and swaps the new indexes in
+        :return: The number of agents
+        """
+        started = time.perf_counter()
+        calls = 0
+        agents = []
+        for page in self.client.get_paginator("list_agents").paginate(
+                PaginationConfig={"PageSize": self.page_size}):
+            calls += 1
+            agents.extend(page.get("agentSummaries", []))
+
+        def list_aliases(agent_id):
+            pages = list(self.client.get_paginator("list_agent_aliases").paginate(
+                agentId=agent_id, PaginationConfig={"PageSize": self.page_size}))
+            return len(pages), [_alias(summary) for page in pages
+                                for summary in page.get("agentAliasSummaries", [])]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            alias_lists = list(executor.map(list_aliases, [agent["agentId"] for agent in agents]))
+
+        by_id = {}
+        by_name = {}
+        for summary, (alias_calls, aliases) in zip(agents, alias_lists):
+            calls += alias_calls
+            agent = {
+                "agent_id": summary["agentId"],
+                "agent_name": summary["agentName"],
+                "agent_status": summary.get("agentStatus"),
+                "latest_agent_version": summary.get("latestAgentVersion"),
+                "updated_at": summary.get("updatedAt"),
+                "aliases": {alias["agent_alias_name"]: alias for alias in aliases},
+                "alias_ids": {alias["agent_alias_id"]: alias for alias in aliases},
+                "default_alias_id": _default_alias(aliases),
+            }
+            by_id[agent["agent_id"]] = agent
+            by_name[agent["agent_name"]] = agent
+        # One assignment, a reader has either the old or the new indexes
+        self._snapshot = (by_id, by_name, time.monotonic())
+        with self._counts_lock:
+            self._counts.update(refreshes=self._counts["refreshes"] + 1,
+                                list_calls=self._counts["list_calls"] + calls,
+                                last_refresh_seconds=time.perf_counter() - started)
+        return len(by_id)
+
+    def get_by_name(self, agent_name):
+        """
+        Looks an agent up by name
+        :param agent_name: The agent name
+        :return: dict with agent_id, agent_name, agent_status, latest_agent_version,
+        updated_at, aliases by alias name, alias_ids by alias id and
+        default_alias_id, or None
+        """
+        return self._indexes()[1].get(agent_name)
+
+    def get_by_id(self, agent_id):
+        """
+        Looks an agent up by id
+        :param agent_id: The agent id
+        :return: The agent as in get_by_name, or None
+        """
+        return self._indexes()[0].get(agent_id)
+
+    def resolve(self, agent, alias_name=None):
+        """
+        Returns the ids invoke_agent needs for an agent
+        :param agent: The agent name or id
+        :param alias_name: The alias name, the default alias of the agent if None:
+        the most recently updated prepared alias that is not the test alias, on the
+        highest version if several were updated together
+        :return: (agent id, agent alias id), None when the agent or the alias is not
+        known
+        """
+        by_id, by_name, _ = self._indexes()
+        record = by_name.get(agent) or by_id.get(agent)
+        if record is None:
+            return None
+        if alias_name is None:
+            alias_id = record["default_alias_id"]
+        else:
+            alias = record["aliases"].get(alias_name)
+            alias_id = alias["agent_alias_id"] if alias else None
+        return (record["agent_id"], alias_id) if alias_id else None
+
+    def agent_names(self, statuses=("PREPARED",)):
+        """
+        Returns the names of the agents
+        :param statuses: The agent statuses to keep, None keeps all
+        :return: list of agent names
+        """
+        return [name for name, agent in self._indexes()[1].items()
+                if statuses is None or agent["agent_status"] in statuses]
+
+    def stats(self):
+        """
+        Returns the counters of the registry
+        :return: dict with refreshes, failures, list_calls, last_refresh_seconds,
+        agents and age_seconds
+        """
+        snapshot = self._snapshot
+        with self._counts_lock:
+            counts = dict(self._counts)
+        return dict(counts,
+                    agents=len(snapshot[0]) if snapshot else 0,
+                    age_seconds=time.monotonic() - snapshot[2] if snapshot else None)
+
+    def close(self):
+        """
+        Stops the background refresh
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _indexes(self):
+        snapshot = self._snapshot
+        if snapshot is not None and (self.background or time.monotonic() - snapshot[2] < self.ttl_seconds):
+            return snapshot
+        with self._load_lock:
+            # Another thread may have loaded it while this one waited
+            if self._snapshot is None or (not self.background and
+                                          time.monotonic() - self._snapshot[2] >= self.ttl_seconds):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    self._failed()
+                    print(f"Failed to load the agents: {e}")
+                    if self._snapshot is None:
+                        raise
+                    # Keep the last agents and try again after retry_seconds, not on every lookup
+                    by_id, by_name, _ = self._snapshot
+                    self._snapshot = (by_id, by_name, time.monotonic() - self.ttl_seconds + self.retry_seconds)
+            if self.background and self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name="agent-registry", daemon=True)
+                self._thread.start()
+        return self._snapshot
+
+    def _refresh_loop(self):
+        wait = self.ttl_seconds
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+                wait = self.ttl_seconds
+            except Exception as e:
+                # Whatever went wrong, the thread keeps the last agents and tries again
+                self._failed()
+                print(f"Failed to refresh the agents, keeping the last ones: {e}")
+                wait = self.retry_seconds
+
+    def _failed(self):
+        with self._counts_lock:
+            self._counts["failures"] += 1
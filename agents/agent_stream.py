@@ -0,0 +1,181 @@
+import codecs
+import time
+
+
+class AgentStreamMetrics():
+    """
+    Timing of one streamed invoke_agent call
+    """
+
+    def __init__(self, agent_id, agent_alias_id, session_id, started=None):
+        """
+        Initializes the metrics
+        :param agent_id: The agent id
+        :param agent_alias_id: The agent alias id
+        :param session_id: The session id
+        :param started: perf_counter value when the request was sent
+        """
+        self.module = "AgentStreamMetrics"
+        self.agent_id = agent_id
+        self.agent_alias_id = agent_alias_id
+        self.session_id = session_id
+        self.started = started if started is not None else time.perf_counter()
+        self.first_chunk_at = None
+        self.finished_at = None
+        self.chunks = 0
+        self.traces = 0
+        self.bytes = 0
+
+    @property
+    def time_to_first_chunk(self):
+        """
+        Seconds from sending the request to the first answer chunk, the traces of the
+        steps before the answer are included
+        """
+        if self.first_chunk_at is None:
+            return None
+        return self.first_chunk_at - self.started
+
+    @property
+    def total_time(self):
+        """
+        Seconds from sending the request to the end of the stream
+        """
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started
+
+    def on_chunk(self, size):
+        self.chunks += 1
+        self.bytes += size
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            "agent_id": self.agent_id,
+            "agent_alias_id": self.agent_alias_id,
+            "session_id": self.session_id,
+            "time_to_first_chunk": self.time_to_first_chunk,
+            "total_time": self.total_time,
+            "chunks": self.chunks,
+            "traces": self.traces,
+            "bytes": self.bytes,
+        }
+
+
+class AgentStream():
+    """
+    Iterates over the events of an invoke_agent response as they arrive and yields
+    (event type, payload) pairs: ("chunk", text) for the answer and ("trace", trace)
+    for the trace events, other events such as returnControl as they come. The chunk
+    bytes go through an incremental utf-8 decoder, so a character split over two
+    chunks is decoded once it is complete, and the answer is joined once from the
+    decoded parts. Works as a generator for boto3 responses and as an async iterator
+    for aiobotocore responses. The metrics are complete once the stream is exhausted.
+    """
+
+    def __init__(self, response, agent_id, agent_alias_id, session_id, started=None):
+        """
+        Initializes the stream
+        :param response: The invoke_agent response
+        :param agent_id: The agent id
+        :param agent_alias_id: The agent alias id
+        :param session_id: The session id
+        :param started: perf_counter value when the request was sent
+        """
+        self.module = "AgentStream"
+        self.response = response
+        self.metrics = AgentStreamMetrics(agent_id, agent_alias_id, session_id, started)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parts = []
+
+    @property
+    def completion(self):
+        """
+        The answer text received so far, all of it once the stream is exhausted
+        """
+        if len(self._parts) > 1:
+            self._parts[:] = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def __iter__(self):
+        try:
+            for event in self.response["completion"]:
+                yield from self._on_event(event)
+            yield from self._on_end()
+        finally:
+            self.metrics.finish()
+
+    async def __aiter__(self):
+        try:
+            async for event in self.response["completion"]:
+                for item in self._on_event(event):
+                    yield item
+            for item in self._on_end():
+                yield item
+        finally:
+            self.metrics.finish()
+
+    def _on_event(self, event):
+        items = []
+        for event_type, payload in event.items():
+            if event_type == "chunk":
+                data = payload.get("bytes", b"")
+                self.metrics.on_chunk(len(data))
+                text = self._decoder.decode(data)
+                if text:
+                    self._parts.append(text)
+                    items.append(("chunk", text))
+            else:
+                if event_type == "trace":
+                    self.metrics.traces += 1
+                items.append((event_type, payload))
+        return items
+
+    def _on_end(self):
+        # Bytes of an incomplete character at the very end are replaced
+        text = self._decoder.decode(b"", final=True)
+        if text:
+            self._parts.append(text)
+            return [("chunk", text)]
+        return []
+
+
+def stream_agent(client, agent_id, agent_alias_id, session_id, prompt, enable_trace=False, **kwargs):
+    """
+    Starts a streamed invoke_agent call
+    :param client: A boto3 bedrock-agent-runtime client
+    :param agent_id: The agent id
+    :param agent_alias_id: The agent alias id
+    :param session_id: The session id
+    :param prompt: The input text
+    :param enable_trace: If true the agent sends the trace of every step
+    :param kwargs: Passed on to invoke_agent, for example sessionState
+    :return: AgentStream, iterate it for the events
+    """
+    started = time.perf_counter()
+    response = client.invoke_agent(agentId=agent_id, agentAliasId=agent_alias_id, sessionId=session_id,
+                                   inputText=prompt, enableTrace=enable_trace, **kwargs)
+    return AgentStream(response, agent_id, agent_alias_id, session_id, started)
+
+
+async def astream_agent(client, agent_id, agent_alias_id, session_id, prompt, enable_trace=False, **kwargs):
+    """
+    asyncio version of stream_agent
+    :param client: An aiobotocore bedrock-agent-runtime client
+    :param agent_id: The agent id
+    :param agent_alias_id: The agent alias id
+    :param session_id: The session id
+    :param prompt: The input text
+    :param enable_trace: If true the agent sends the trace of every step
+    :param kwargs: Passed on to invoke_agent, for example sessionState
+    :return: AgentStream, iterate it with async for
+    """
+    started = time.perf_counter()
+    response = await client.invoke_agent(agentId=agent_id, agentAliasId=agent_alias_id, sessionId=session_id,
+                                         inputText=prompt, enableTrace=enable_trace, **kwargs)
+    return AgentStream(response, agent_id, agent_alias_id, session_id, started)
@@ -0,0 +1,238 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from clients.rate_limiter import THROTTLING_ERRORS, is_throttled
+
+ARRIVAL_PROCESSES = ("poisson", "uniform")
+
+# botocore emits it after every attempt of invoke_agent, retried or not
+ATTEMPT_EVENT = "needs-retry.bedrock-agent-runtime.InvokeAgent"
+
+
+def arrival_times(sessions, arrival_rate=None, arrival_process="poisson", seed=None):
+    """
+    Returns when every session starts, in seconds from the start of the run
+    :param sessions: The number of sessions
+    :param arrival_rate: New sessions per second, None starts them all at once
+    :param arrival_process: poisson for exponential gaps between sessions, uniform
+    for equal gaps
+    :param seed: The random seed of the poisson gaps
+    :return: list of offsets
+    """
+    if not arrival_rate:
+        return [0.0] * sessions
+    if arrival_process == "uniform":
+        return [i / arrival_rate for i in range(sessions)]
+    if arrival_process != "poisson":
+        raise ValueError(f"Unknown arrival process {arrival_process}, use one of {ARRIVAL_PROCESSES}")
+    gaps = np.random.default_rng(seed).exponential(1 / arrival_rate, sessions)
+    gaps[0] = 0.0
+    return np.cumsum(gaps).tolist()
+
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    """
+    Returns the percentiles of a list of measurements
+    :param values: The measurements
+    :param points: The percentiles to compute
+    :return: dict of p<point> to the value, None for every point when there are no values
+    """
+    if not values:
+        return {f"p{p}": None for p in points}
+    return {f"p{p}": float(value) for p, value in zip(points, np.percentile(values, points))}
+
+
+class AgentLoadDriver():
+    """
+    Runs many invoke_agent sessions at once against one agent alias. Every session
+    has its own session id and plays one scripted conversation, turn after turn, on
+    the shared client of the agent client. Sessions arrive at arrival_rate per second
+    and run on a pool of max_concurrency threads, a session that finds the pool busy
+    waits and its queue delay is reported. Every turn is streamed to the end, so the
+    latency is the time of the whole answer. Throttles are counted on every attempt
+    the client makes, so those that botocore retried away count as well.
+    """
+
+    def __init__(self,
+                 agent_client,
+                 agent_id,
+                 agent_alias_id,
+                 conversations,
+                 max_concurrency=64,
+                 arrival_rate=None,
+                 arrival_process="poisson",
+                 think_time=0.0,
+                 enable_trace=False,
+                 seed=None):
+        """
+        Initializes the driver
+        :param agent_client: The BedRockClient of example 04, or any object with its
+        stream_bedrock_agent
+        :param agent_id: The agent id
+        :param agent_alias_id: The agent alias id
+        :param conversations: The scripted conversations, lists of prompts. Session i
+        plays conversation i modulo their number
+        :param max_concurrency: The most sessions in flight at once
+        :param arrival_rate: New sessions per second, None starts them all at once
+        :param arrival_process: poisson or uniform gaps between the sessions
+        :param think_time: Seconds between the turns of a session
+        :param enable_trace: If true the agent sends the trace of every step
+        :param seed: The random seed of the arrivals and the think times
+        """
+        if not conversations or not all(conversations):
+            raise ValueError("Every conversation needs at least one prompt")
+        self.module = "AgentLoadDriver"
+        self.agent_client = agent_client
+        self.agent_id = agent_id
+        self.agent_alias_id = agent_alias_id
+        self.conversations = conversations
+        self.max_concurrency = max_concurrency
+        self.arrival_rate = arrival_rate
+        self.arrival_process = arrival_process
+        self.think_time = think_time
+        self.enable_trace = enable_trace
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def run(self, sessions):
+        """
+        Runs the sessions and waits for all of them
+        :param sessions: The number of sessions
+        :return: dict report, see report
+        """
+        run_id = uuid.uuid4().hex[:8]
+        offsets = arrival_times(sessions, self.arrival_rate, self.arrival_process, self.seed)
+        results = []
+        attempts = Counter()
+        attempts_lock = threading.Lock()
+
+        def count_attempt(response=None, **kwargs):
+            with attempts_lock:
+                attempts["attempts"] += 1
+                attempts["throttled"] += response is not None and is_throttled(*response)
+
+        # Clients of the same factory are shared, this is the one the sessions use
+        client = self.agent_client.return_runtime_client() \
+            if hasattr(self.agent_client, "return_runtime_client") else None
+        if client is not None:
+            client.meta.events.register(ATTEMPT_EVENT, count_attempt)
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = []
+                for i, offset in enumerate(offsets):
+                    delay = started + offset - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(executor.submit(self.run_session, f"load-{run_id}-{i:05d}",
+                                                   self.conversations[i % len(self.conversations)],
+                                                   started + offset))
+                for future in futures:
+                    results.extend(future.result())
+        finally:
+            if client is not None:
+                client.meta.events.unregister(ATTEMPT_EVENT, count_attempt)
+        return self.report(results, time.perf_counter() - started, sessions,
+                           attempts if client is not None else None)
+
+    def run_session(self, session_id, prompts, scheduled_at=None):
+        """
+        Plays one conversation in one session
+        :param session_id: The session id
+        :param prompts: The prompts of the turns
+        :param scheduled_at: perf_counter value the session was due to start
+        :return: list of turn results
+        """
+        queue_delay = time.perf_counter() - scheduled_at if scheduled_at is not None else 0.0
+        results = []
+        for turn, prompt in enumerate(prompts):
+            if turn and self.think_time:
+                with self._random_lock:
+                    # Exponential think times around the mean, like people reading the answer
+                    think_time = self._random.expovariate(1 / self.think_time)
+                time.sleep(think_time)
+            result = self.run_turn(session_id, turn, prompt)
+            result["queue_delay"] = queue_delay if turn == 0 else 0.0
+            results.append(result)
+        return results
+
+    def run_turn(self, session_id, turn, prompt):
+        """
+        Sends one prompt and reads the answer stream to the end
+        :param session_id: The session id
+        :param turn: The number of the turn in the session
+        :param prompt: The prompt
+        :return: dict with the latency, time to first chunk, chunks, bytes and the
+        error code if the turn failed
+        """
+        result = {"session_id": session_id, "turn": turn, "latency": None, "time_to_first_chunk": None,
+                  "chunks": 0, "bytes": 0, "error": None}
+        started = time.perf_counter()
+        try:
+            stream = self.agent_client.stream_bedrock_agent(self.agent_id, self.agent_alias_id, session_id,
+                                                            prompt, enable_trace=self.enable_trace)
+            for _ in stream:
+                pass
+        except ClientError as e:
+            result["error"] = e.response.get("Error", {}).get("Code") or "ClientError"
+        except Exception as e:
+            result["error"] = type(e).__name__
+        else:
+            metrics = stream.metrics
+            result.update(time_to_first_chunk=metrics.time_to_first_chunk, chunks=metrics.chunks,
+                          bytes=metrics.bytes)
+        result["latency"] = time.perf_counter() - started
+        return result
+
+    @staticmethod
+    def report(results, duration, sessions, attempts=None):
+        """
+        Aggregates turn results
+        :param results: The turn results
+        :param duration: The seconds the run took
+        :param sessions: The number of sessions
+        :param attempts: dict with the number of attempts the client made and of the
+        throttled ones, None if they were not counted
+        :return: dict with the latency and time to first chunk percentiles of the
+        successful turns, error rate, the attempts, throttled attempts and the share
+        of throttled attempts as throttle rate (of the failed turns if the attempts
+        were not counted), turns per second and the stream throughput in bytes and
+        chunks per second
+        """
+        succeeded = [result for result in results if result["error"] is None]
+        errors = Counter(result["error"] for result in results if result["error"] is not None)
+        if attempts is None:
+            throttled = sum(count for code, count in errors.items() if code in THROTTLING_ERRORS)
+            attempts = {"attempts": len(results), "throttled": throttled}
+        # Bytes per second of every answer after its first chunk
+        stream_rates = [result["bytes"] / (result["latency"] - result["time_to_first_chunk"])
+                        for result in succeeded
+                        if result["time_to_first_chunk"] is not None
+                        and result["latency"] > result["time_to_first_chunk"]]
+        turns = len(results)
+        return {
+            "sessions": sessions,
+            "turns": turns,
+            "duration": duration,
+            "turns_per_second": turns / duration if duration > 0 else None,
+            "latency": percentiles([result["latency"] for result in succeeded]),
+            "time_to_first_chunk": percentiles([result["time_to_first_chunk"] for result in succeeded
+                                                if result["time_to_first_chunk"] is not None]),
+            "queue_delay": percentiles([result["queue_delay"] for result in results if result["turn"] == 0]),
+            "error_rate": (turns - len(succeeded)) / turns if turns else 0.0,
+            "attempts": attempts["attempts"],
+            "throttled_attempts": attempts["throttled"],
+            "throttle_rate": attempts["throttled"] / attempts["attempts"] if attempts["attempts"] else 0.0,
+            "errors": dict(errors),
+            "bytes_per_second": sum(result["bytes"] for result in succeeded) / duration if duration > 0 else None,
+            "chunks_per_second": sum(result["chunks"] for result in succeeded) / duration if duration > 0 else None,
+            "stream_bytes_per_second": percentiles(stream_rates, (50,))["p50"],
+        }
@@ -0,0 +1,284 @@
+import argparse
+from collections import Counter, defaultdict
+
+from agents.load_driver import percentiles
+from agents.trace_recorder import flatten_trace, read_trace_records
+
+# The invocation types of a tool step and the frame they are shown as
+TOOL_STEPS = {
+    "ACTION_GROUP": "action_group",
+    "KNOWLEDGE_BASE": "knowledge_base",
+    "ACTION_GROUP_CODE_INTERPRETER": "code_interpreter",
+    "AGENT_COLLABORATOR": "agent_collaborator",
+}
+
+
+def _record(event):
+    # Recorder records are flat already, stream payloads have the trace under trace
+    if "phase" in event and "step" in event:
+        return event
+    if "trace" in event:
+        return flatten_trace(event)
+    return flatten_trace({"trace": event})
+
+
+def _step(phase, kind, name, opened, closing, time, previous):
+    # The service times of the closing event first, then the event times
+    opened_record, opened_time = opened if opened else (None, None)
+    end = closing["end_time"] if closing["end_time"] is not None else time
+    if closing["latency"] is not None:
+        duration = closing["latency"]
+    elif opened_time is not None and time is not None:
+        duration = time - opened_time
+    elif previous is not None and time is not None:
+        duration = time - previous
+    else:
+        duration = None
+    start = closing["start_time"]
+    if start is None and end is not None and duration is not None:
+        start = end - duration
+    return {
+        "phase": phase,
+        "step": kind,
+        "name": name,
+        "trace_id": closing["trace_id"] or (opened_record["trace_id"] if opened_record else None),
+        "start": start,
+        "end": end,
+        "duration": duration,
+        "input_tokens": closing["input_tokens"],
+        "output_tokens": closing["output_tokens"],
+    }
+
+
+def reconstruct_timeline(events):
+    """
+    Rebuilds the steps of one invoke_agent call from its trace events. A model step
+    runs from a modelInvocationInput to the next modelInvocationOutput of the phase,
+    a tool step from an invocationInput (action group, knowledge base, code
+    interpreter or collaborator) to the next observation. A step takes the start,
+    end and total time the service puts in the metadata of its output, or else the
+    time between the event times of its first and last event
+    :param events: The trace events of one call in the order they arrived: the
+    traces invoke_bedrock_agent returns, the payloads of the trace events of the
+    stream or the records of one invocation an AgentTraceRecorder wrote
+    :return: dict with the steps, each with phase, step (model or the tool kind),
+    name (the foundation model or the tool), trace_id, start and end in seconds from
+    the start of the call, duration, input_tokens and output_tokens; the phases with
+    their start, end and duration; and the duration of the call. Times are None if
+    the events carry none
+    """
+    steps = []
+    phases = {}
+    open_models = {}
+    open_tool = None
+    previous = None
+    for record in map(_record, events):
+        phase = record["phase"]
+        time = record["event_time"] if record["event_time"] is not None else record.get("received_at")
+        if record["step"] == "modelInvocationInput":
+            open_models[phase] = (record, time)
+        elif record["step"] == "modelInvocationOutput":
+            opened = open_models.pop(phase, None)
+            steps.append(_step(phase, "model", opened[0]["tool"] if opened else None, opened, record, time,
+                               previous))
+        elif record["step"] == "invocationInput" and record["step_type"] in TOOL_STEPS:
+            open_tool = (record, time)
+        elif record["step"] == "observation" and open_tool is not None:
+            # The observation that follows an invocation is its result
+            steps.append(_step(phase, TOOL_STEPS[open_tool[0]["step_type"]], open_tool[0]["tool"], open_tool,
+                               record, time, previous))
+            open_tool = None
+
+        times = phases.setdefault(phase, [])
+        if time is not None:
+            times.append(time)
+            previous = time
+
+    for step in steps:
+        if step["start"] is not None:
+            phases[step["phase"]] += [step["start"], step["end"]]
+    known = [time for times in phases.values() for time in times]
+    origin = min(known) if known else None
+    for step in steps:
+        if origin is not None and step["start"] is not None:
+            step["start"] -= origin
+            step["end"] -= origin
+    return {
+        "steps": steps,
+        "phases": {phase: {"start": min(times) - origin if times else None,
+                           "end": max(times) - origin if times else None,
+                           "duration": max(times) - min(times) if times else None}
+                   for phase, times in phases.items()},
+        "duration": max(known) - origin if known else None,
+    }
+
+
+def _frame(step):
+    return f"{step['step']}:{step['name']}" if step["name"] else step["step"]
+
+
+class AgentTraceAnalyzer():
+    """
+    Breaks the time of invoke_agent calls down by step. Every call added is rebuilt
+    into its timeline of model and tool steps with reconstruct_timeline. The
+    breakdown aggregates the steps of all calls by phase, step and name into
+    duration and token percentiles, sorted by the time they take in total, and the
+    folded stacks (agent;phase;step count, one line per stack) feed flame graph tools
+    such as flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, percentiles=(50, 90, 95, 99)):
+        """
+        Initializes the analyzer
+        :param percentiles: The percentiles of the breakdown
+        """
+        self.module = "AgentTraceAnalyzer"
+        self.percentiles = percentiles
+        self.timelines = []
+
+    def add_invocation(self, events):
+        """
+        Adds one invoke_agent call
+        :param events: Its trace events in the order they arrived, see
+        reconstruct_timeline
+        :return: The timeline of the call
+        """
+        timeline = reconstruct_timeline(events)
+        self.timelines.append(timeline)
+        return timeline
+
+    def add_records(self, records):
+        """
+        Adds the calls an AgentTraceRecorder wrote
+        :param records: Records of any number of calls, for example from
+        read_trace_records
+        :return: The number of calls added
+        """
+        invocations = defaultdict(list)
+        for record in records:
+            invocations[record["invocation_id"]].append(record)
+        for events in invocations.values():
+            self.add_invocation(events)
+        return len(invocations)
+
+    def breakdown(self):
+        """
+        Aggregates the steps of all calls
+        :return: dict with the number of invocations, the percentiles of their
+        duration and of the duration of every phase, and steps: one entry per phase,
+        step and name with count, count per invocation, duration percentiles, total
+        seconds, share of the time of all steps and the input and output token
+        percentiles, the slowest in total first
+        """
+        groups = defaultdict(list)
+        phases = defaultdict(list)
+        for timeline in self.timelines:
+            for step in timeline["steps"]:
+                groups[(step["phase"], step["step"], step["name"])].append(step)
+            for phase, times in timeline["phases"].items():
+                if times["duration"] is not None:
+                    phases[phase].append(times["duration"])
+
+        invocations = len(self.timelines)
+        step_time = sum(step["duration"] or 0.0 for steps in groups.values() for step in steps)
+        rows = []
+        for (phase, kind, name), steps in groups.items():
+            durations = [step["duration"] for step in steps if step["duration"] is not None]
+            rows.append({
+                "phase": phase,
+                "step": kind,
+                "name": name,
+                "count": len(steps),
+                "per_invocation": len(steps) / invocations,
+                "duration": percentiles(durations, self.percentiles),
+                "total": sum(durations),
+                "share": sum(durations) / step_time if step_time else None,
+                "input_tokens": percentiles([step["input_tokens"] for step in steps
+                                             if step["input_tokens"] is not None], self.percentiles),
+                "output_tokens": percentiles([step["output_tokens"] for step in steps
+                                              if step["output_tokens"] is not None], self.percentiles),
+            })
+        rows.sort(key=lambda row: row["total"], reverse=True)
+        return {
+            "invocations": invocations,
+            "duration": percentiles([timeline["duration"] for timeline in self.timelines
+                                     if timeline["duration"] is not None], self.percentiles),
+            "phases": {phase: percentiles(durations, self.percentiles) for phase, durations in phases.items()},
+            "steps": rows,
+        }
+
+    def folded_stacks(self, root="invoke_agent"):
+        """
+        Returns the time of all calls as folded stacks, root;phase;step:name followed
+        by the microseconds spent there. The time of a phase outside its steps is
+        counted on the phase, the time of a call outside its phases on the root
+        :param root: The name of the bottom frame
+        :return: list of lines
+        """
+        stacks = Counter()
+        for timeline in self.timelines:
+            phase_time = 0.0
+            for phase, times in timeline["phases"].items():
+                steps = [step for step in timeline["steps"] if step["phase"] == phase and step["duration"]]
+                for step in steps:
+                    stacks[f"{root};{phase};{_frame(step)}"] += step["duration"]
+                inside = sum(step["duration"] for step in steps)
+                duration = max(times["duration"] or 0.0, inside)
+                stacks[f"{root};{phase}"] += duration - inside
+                phase_time += duration
+            stacks[root] += max(0.0, (timeline["duration"] or 0.0) - phase_time)
+        return [f"{stack} {round(seconds * 1e6)}" for stack, seconds in sorted(stacks.items())
+                if round(seconds * 1e6) > 0]
+
+    def write_folded(self, path, root="invoke_agent"):
+        """
+        Writes the folded stacks to a file
+        :param path: The file
+        :param root: The name of the bottom frame
+        :return: The number of lines written
+        """
+        lines = self.folded_stacks(root)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        return len(lines)
+
+
+def print_breakdown(breakdown):
+    """
+    Prints a breakdown as a table, durations in milliseconds. It has a column per
+    percentile of the breakdown, the token counts are those of the first percentile
+    :param breakdown: The result of AgentTraceAnalyzer.breakdown
+    :return: None
+    """
+    def ms(value):
+        return f"{value * 1000:.1f}" if value is not None else "-"
+
+    def tokens(value):
+        return f"{value:.0f}" if value is not None else "-"
+
+    points = list(breakdown["duration"])
+    print(f"{breakdown['invocations']} invocations, "
+          + ", ".join(f"{point} {ms(value)} ms" for point, value in breakdown["duration"].items()))
+    for phase, durations in breakdown["phases"].items():
+        print(f"  {phase:22}" + "  ".join(f"{point} {ms(durations[point]):>8} ms" for point in points))
+    print(f"{'phase':22}{'step':60}{'per call':>9}" + "".join(f"{point + ' ms':>9}" for point in points)
+          + f"{'share':>8}{'in tok':>8}{'out tok':>8}")
+    for row in breakdown["steps"]:
+        frame = f"{row['step']}:{row['name']}" if row["name"] else row["step"]
+        print(f"{row['phase']:22}{frame[:59]:60}{row['per_invocation']:9.2f}"
+              + "".join(f"{ms(row['duration'][point]):>9}" for point in points)
+              + f"{row['share'] if row['share'] is not None else 0:8.1%}"
+              f"{tokens(row['input_tokens'][points[0]]):>8}{tokens(row['output_tokens'][points[0]]):>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per step latency of agent calls from AgentTraceRecorder files")
+    parser.add_argument("paths", nargs="+", help="JSON lines or .parquet files of an AgentTraceRecorder")
+    parser.add_argument("--folded", default=None, help="Writes the folded stacks for a flame graph to this file")
+    args = parser.parse_args()
+
+    analyzer = AgentTraceAnalyzer()
+    for path in args.paths:
+        analyzer.add_records(read_trace_records(path))
+    print_breakdown(analyzer.breakdown())
+    if args.folded:
+        print(f"{analyzer.write_folded(args.folded)} stacks written to {args.folded}")
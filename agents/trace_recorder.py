@@ -0,0 +1,354 @@
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+# The phases of an agent trace and the column value they are recorded under
+PHASES = {
+    "preProcessingTrace": "PRE_PROCESSING",
+    "orchestrationTrace": "ORCHESTRATION",
+    "postProcessingTrace": "POST_PROCESSING",
+    "routingClassifierTrace": "ROUTING_CLASSIFIER",
+    "customOrchestrationTrace": "CUSTOM_ORCHESTRATION",
+    "guardrailTrace": "GUARDRAIL",
+    "failureTrace": "FAILURE",
+}
+
+# One row per trace event, in this column order
+COLUMNS = ("invocation_id", "session_id", "agent_id", "agent_alias_id", "agent_version", "event_time",
+           "received_at", "phase", "step", "trace_id", "step_type", "tool", "input_tokens", "output_tokens",
+           "start_time", "end_time", "latency")
+
+# The outputs of an observation, they carry the metadata of the call observed
+_OUTPUTS = ("actionGroupInvocationOutput", "knowledgeBaseLookupOutput", "codeInterpreterInvocationOutput",
+            "agentCollaboratorInvocationOutput", "finalResponse")
+
+
+def _timestamp(value):
+    # eventTime is a datetime from boto3 and an iso string in raw or stored events
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def _tool(part):
+    # The model, action group, function or knowledge base a step calls or observes
+    if part.get("foundationModel"):
+        return part["foundationModel"]
+    action_group = part.get("actionGroupInvocationInput") or part.get("actionGroupInvocationOutput")
+    if action_group:
+        name = action_group.get("actionGroupName")
+        operation = action_group.get("function") or action_group.get("apiPath")
+        return "/".join(value for value in (name, operation) if value) or "ACTION_GROUP"
+    knowledge_base = part.get("knowledgeBaseLookupInput")
+    if knowledge_base:
+        return knowledge_base.get("knowledgeBaseId")
+    collaborator = part.get("agentCollaboratorInvocationInput") or part.get("agentCollaboratorInvocationOutput")
+    if collaborator:
+        return collaborator.get("agentCollaboratorName")
+    if part.get("codeInterpreterInvocationInput"):
+        return "CODE_INTERPRETER"
+    return None
+
+
+def flatten_trace(event):
+    """
+    Flattens one trace event of an invoke_agent stream into a flat record
+    :param event: The payload of a trace event, with agentId, sessionId, eventTime
+    and the trace itself under trace
+    :return: dict with session_id, agent_id, agent_alias_id, agent_version,
+    event_time (epoch seconds), phase, step, trace_id, step_type, tool,
+    input_tokens, output_tokens, the start_time and end_time (epoch seconds) and
+    the duration in seconds as latency of the step as the service reports them in
+    the metadata, None where the event has no value
+    """
+    trace = event.get("trace", {})
+    phase_key = next(iter(trace), None)
+    body = trace.get(phase_key) or {}
+    step = next((key for key, value in body.items() if isinstance(value, dict)), None)
+    part = body.get(step, {}) if step else body
+
+    metadata = part.get("metadata") or next(
+        (part[name]["metadata"] for name in _OUTPUTS if part.get(name, {}).get("metadata")), {})
+    usage = metadata.get("usage") or {}
+    start_time = _timestamp(metadata.get("startTime"))
+    end_time = _timestamp(metadata.get("endTime"))
+    total_time_ms = metadata.get("totalTimeMs")
+    # totalTimeMs is whole milliseconds, the start and end times are finer
+    if start_time is not None and end_time is not None:
+        latency = end_time - start_time
+    elif total_time_ms is not None:
+        latency = total_time_ms / 1000
+    else:
+        latency = None
+    return {
+        "session_id": event.get("sessionId"),
+        "agent_id": event.get("agentId"),
+        "agent_alias_id": event.get("agentAliasId"),
+        "agent_version": event.get("agentVersion"),
+        "event_time": _timestamp(event.get("eventTime")),
+        "phase": PHASES.get(phase_key, phase_key),
+        "step": step or ("failure" if phase_key == "failureTrace" else None),
+        "trace_id": part.get("traceId") or body.get("traceId"),
+        "step_type": part.get("type") or part.get("invocationType"),
+        "tool": _tool(part),
+        "input_tokens": usage.get("inputTokens"),
+        "output_tokens": usage.get("outputTokens"),
+        "start_time": start_time,
+        "end_time": end_time,
+        "latency": latency,
+    }
+
+
+class _JsonLinesSink():
+    # One line per batch holding a list per column, like a row group of the Parquet
+    # sink. Encoding the lists takes a third of the time of a dict per row
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+        self.encode = json.JSONEncoder(separators=(",", ":"), check_circular=False).encode
+
+    def write(self, columns, rows):
+        self.file.write(self.encode(columns) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetSink():
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        string, number, integer = pa.string(), pa.float64(), pa.int64()
+        types = {"event_time": number, "received_at": number, "start_time": number, "end_time": number,
+                 "latency": number, "input_tokens": integer, "output_tokens": integer}
+        self.pa = pa
+        self.schema = pa.schema([(name, types.get(name, string)) for name in COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, columns, rows):
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def read_trace_records(path):
+    """
+    Reads the records an AgentTraceRecorder wrote
+    :param path: A .parquet file or a JSON lines file
+    :return: generator of dicts with the COLUMNS of one trace event each
+    """
+    if str(path).endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        batches = (batch.to_pydict() for batch in pq.ParquetFile(path).iter_batches())
+    else:
+        batches = (json.loads(line) for line in open(path, encoding="utf-8") if line.strip())
+    for columns in batches:
+        names = list(columns)
+        for row in zip(*(columns[name] for name in names)):
+            yield dict(zip(names, row))
+
+
+class InvocationTrace():
+    """
+    Records the trace events of one invoke_agent call. Only an append to the pending
+    events happens on the calling thread, everything else is done by the writer
+    thread of the recorder
+    """
+
+    def __init__(self, recorder, invocation_id, sampled):
+        self.module = "InvocationTrace"
+        self.recorder = recorder
+        self.invocation_id = invocation_id
+        self.sampled = sampled
+
+    def record(self, event):
+        """
+        Records a trace event, does nothing if the invocation is not sampled
+        :param event: The payload of a trace event of the stream
+        :return: None
+        """
+        if self.sampled:
+            self.recorder._put((self.invocation_id, time.time(), event))
+
+    def finish(self):
+        """
+        Ends the invocation, the writer forgets its state
+        :return: None
+        """
+        if self.sampled:
+            self.recorder._put((self.invocation_id, None, None))
+
+
+class AgentTraceRecorder():
+    """
+    Samples invoke_agent calls and writes their trace events as compact records, one
+    row of COLUMNS per event, to a JSON lines or Parquet file. The request thread only
+    decides the sampling and appends the raw event to a bounded deque, without a lock
+    or waking anyone. A writer thread takes the pending events every poll_interval
+    seconds, flattens them into columns and writes them in batches of batch_size, or
+    every flush_interval seconds. When max_pending events wait, new ones are dropped
+    and counted instead of slowing the request down.
+
+    The latency of an event is the step duration the service reports, or else the
+    time since the previous event of the same invocation.
+    """
+
+    def __init__(self,
+                 path,
+                 sink="jsonl",
+                 sample_rate=1.0,
+                 batch_size=1000,
+                 flush_interval=1.0,
+                 poll_interval=0.05,
+                 max_pending=10000,
+                 seed=None):
+        """
+        Initializes the recorder and starts its writer thread
+        :param path: The file the records are written to, read it back with
+        read_trace_records. Batches are appended as JSON lines of one list per column,
+        a Parquet file is written anew with one row group per batch
+        :param sink: jsonl or parquet, parquet needs pyarrow
+        :param sample_rate: The share of invocations recorded, whole invocations are
+        sampled so their timelines stay complete
+        :param batch_size: The number of records written at a time
+        :param flush_interval: The most seconds a record waits to be written
+        :param poll_interval: Seconds between two looks of the writer at the pending
+        events, a raw event is held about this long
+        :param max_pending: The most events waiting for the writer
+        :param seed: The random seed of the sampling
+        """
+        if sink == "jsonl":
+            self.sink = _JsonLinesSink(path)
+        elif sink == "parquet":
+            self.sink = _ParquetSink(path)
+        else:
+            raise ValueError(f"Unknown sink {sink}, use jsonl or parquet")
+        self.module = "AgentTraceRecorder"
+        self.path = path
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.max_pending = max_pending
+        self._random = random.Random(seed)
+        # deque appends and pops are atomic, the request thread takes no lock
+        self._pending = deque()
+        self._counts = {"invocations": 0, "sampled_invocations": 0, "events": 0, "dropped_events": 0,
+                        "failed_events": 0, "written_records": 0, "batches": 0, "write_seconds": 0.0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name="agent-trace-recorder", daemon=True)
+        self._writer.start()
+
+    def start_invocation(self, agent_id=None, agent_alias_id=None, session_id=None):
+        """
+        Starts recording an invoke_agent call, if it is sampled
+        :param agent_id: The agent id, for the record only
+        :param agent_alias_id: The agent alias id, for the record only
+        :param session_id: The session id, for the record only
+        :return: InvocationTrace, record every trace event on it and finish it
+        """
+        with self._lock:
+            sampled = self._random.random() < self.sample_rate
+            self._counts["invocations"] += 1
+            self._counts["sampled_invocations"] += sampled
+        return InvocationTrace(self, uuid.uuid4().hex if sampled else None, sampled)
+
+    def stats(self):
+        """
+        Returns the counters of the recorder
+        :return: dict with invocations, sampled_invocations, events, dropped_events,
+        failed_events, written_records, batches and write_seconds
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def close(self):
+        """
+        Writes the pending events, stops the writer thread and closes the file
+        :return: None
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        try:
+            self._writer.join()
+        finally:
+            self.sink.close()
+
+    def _put(self, item):
+        # The length check races with other request threads, max_pending is a soft bound
+        if len(self._pending) >= self.max_pending and item[2] is not None:
+            with self._lock:
+                self._counts["dropped_events"] += 1
+        else:
+            self._pending.append(item)
+
+    def _write_loop(self):
+        columns = {name: [] for name in COLUMNS}
+        pending = 0
+        last_times = {}
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            stopping = self._stop.wait(self.poll_interval)
+            events = 0
+            failed = 0
+            while self._pending:
+                invocation_id, received_at, event = self._pending.popleft()
+                if event is None:
+                    last_times.pop(invocation_id, None)
+                    continue
+                try:
+                    record = flatten_trace(event)
+                except Exception as e:
+                    # One malformed event must not stop the writer, it is counted and skipped
+                    print(f"Failed to flatten an agent trace event of {invocation_id}: {e}")
+                    failed += 1
+                    continue
+                event_time = record["event_time"] if record["event_time"] is not None else received_at
+                if record["latency"] is None and invocation_id in last_times:
+                    record["latency"] = max(0.0, event_time - last_times[invocation_id])
+                last_times[invocation_id] = event_time
+                record["invocation_id"] = invocation_id
+                record["received_at"] = received_at
+                for name in COLUMNS:
+                    columns[name].append(record[name])
+                pending += 1
+                events += 1
+                if pending >= self.batch_size:
+                    self._flush(columns, pending)
+                    columns = {name: [] for name in COLUMNS}
+                    pending = 0
+            if events or failed:
+                with self._lock:
+                    self._counts["events"] += events
+                    self._counts["failed_events"] += failed
+
+            if pending and (stopping or time.monotonic() >= deadline):
+                self._flush(columns, pending)
+                columns = {name: [] for name in COLUMNS}
+                pending = 0
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, columns, rows):
+        started = time.perf_counter()
+        try:
+            self.sink.write(columns, rows)
+        except Exception as e:
+            print(f"Failed to write {rows} agent trace records to {self.path}: {e}")
+            return
+        with self._lock:
+            self._counts["written_records"] += rows
+            self._counts["batches"] += 1
+            self._counts["write_seconds"] += time.perf_counter() - started
@@ -0,0 +1,74 @@
+# How many concurrent invoke_agent sessions an agent alias sustains. Drives the
+# BedRockClient of example 04 with agents.load_driver.AgentLoadDriver against the
+# local stub of bedrock-agent-runtime: every session plays a scripted three turn
+# conversation under its own session id, all over one pooled client. For every level
+# of concurrency it reports latency and time to first chunk percentiles, the error
+# rate, the share of attempts that were throttled, retried ones included, and the
+# stream throughput. Give the stub a --quota-rps or a --throttle-rate to see where
+# throttling starts. Every level starts with fresh rate limiters.
+#
+# python -m benchmarks.bench_agent_load --sessions 200 --concurrency 1 10 50 --latency 0.05 --step-latency 0.02
+import argparse
+import importlib
+
+from agents.load_driver import ARRIVAL_PROCESSES, AgentLoadDriver
+from benchmarks.bench_suite import offline_environment
+from local_bedrock.stub_server import start_stub_process
+
+CONVERSATION = ["What is the interest rate?",
+                "What is the loan amount?",
+                "How is the monthly payment calculated?"]
+
+
+def milliseconds(value):
+    return f"{value * 1000:.1f}" if value is not None else "-"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 10, 50])
+    parser.add_argument("--arrival-rate", type=float, default=None, help="New sessions per second, all at once if unset")
+    parser.add_argument("--arrival-process", choices=ARRIVAL_PROCESSES, default="poisson")
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--step-latency", type=float, default=0.02)
+    parser.add_argument("--chunk-interval", type=float, default=0.005)
+    parser.add_argument("--quota-rps", type=float, default=None)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--trace", action="store_true")
+    args = parser.parse_args()
+
+    stub, endpoint_url = start_stub_process(latency=args.latency, step_latency=args.step_latency,
+                                            chunk_interval=args.chunk_interval, quota_rps=args.quota_rps,
+                                            throttle_rate=args.throttle_rate)
+    offline_environment(endpoint_url)
+    from clients.bedrock_client_factory import BedrockClientFactory
+    from clients.rate_limiter import get_rate_limiter_stats, reset_rate_limiters
+
+    agent_example = importlib.import_module("examples.04_how_to_call_bedrock_agent")
+    try:
+        print(f"{'sessions':>9}{'concurrency':>12}{'turns/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'ttfc p50':>9}{'queue p95':>10}{'errors':>8}{'throttled':>10}{'KB/s':>8}")
+        for concurrency in args.concurrency:
+            # The limiters are process wide, a level must not start at the rate the last one backed off to
+            reset_rate_limiters()
+            # One pooled client per level, with a connection for every session in flight
+            factory = BedrockClientFactory(max_pool_connections=concurrency)
+            agent_client = agent_example.BedRockClient(client_factory=factory)
+            driver = AgentLoadDriver(agent_client, "STUBAGENT1", "STUBALIAS1", [CONVERSATION],
+                                     max_concurrency=concurrency, arrival_rate=args.arrival_rate,
+                                     arrival_process=args.arrival_process, think_time=args.think_time,
+                                     enable_trace=args.trace, seed=0)
+            report = driver.run(args.sessions)
+            print(f"{report['sessions']:9}{concurrency:12}{report['turns_per_second']:9.1f}"
+                  f"{milliseconds(report['latency']['p50']):>9}{milliseconds(report['latency']['p95']):>9}"
+                  f"{milliseconds(report['latency']['p99']):>9}{milliseconds(report['time_to_first_chunk']['p50']):>9}"
+                  f"{milliseconds(report['queue_delay']['p95']):>10}{report['error_rate']:8.1%}"
+                  f"{report['throttle_rate']:10.1%}{report['bytes_per_second'] / 1024:8.1f}")
+            if report["errors"]:
+                print(f"{'':9}errors: {report['errors']}")
+            print(f"{'':9}rate limiter: {get_rate_limiter_stats().get('agent/STUBAGENT1/STUBALIAS1')}")
+            factory.close()
+    finally:
+        stub.terminate()
@@ -0,0 +1,66 @@
+# Looking agents up by name on the request path: the list_agents of example 04 as it
+# was, a new bedrock-agent client and the first page of list_agents for every lookup,
+# against agents.agent_registry.AgentRegistry, loaded once with every page and the
+# aliases and then read from memory. Runs against the local stub with --agents agents
+# and --latency per control plane call. Reports the time per lookup, the share of the
+# agents found and for the registry the time and the list calls of a full load.
+#
+# python -m benchmarks.bench_agent_registry --agents 250 --lookups 200 --latency 0.02
+import argparse
+import random
+import time
+
+import boto3
+
+from agents.agent_registry import AgentRegistry
+from benchmarks.bench_suite import offline_environment
+from local_bedrock.stub_server import start_stub_process
+
+
+def first_page_lookup(agent_name):
+    # What example 04 did: a client per call, one page, a scan by name
+    client = boto3.client("bedrock-agent", region_name="us-east-1")
+    for agent in client.list_agents()["agentSummaries"]:
+        if agent["agentStatus"] == "PREPARED" and agent["agentName"] == agent_name:
+            return agent["agentId"]
+    return None
+
+
+def measure(lookup, names):
+    started = time.perf_counter()
+    found = sum(lookup(name) is not None for name in names)
+    return (time.perf_counter() - started) / len(names), found / len(names)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agents", type=int, default=250)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    stub, endpoint_url = start_stub_process(latency=args.latency, agents=args.agents)
+    offline_environment(endpoint_url)
+    from clients.bedrock_client_factory import get_bedrock_client
+
+    # Prepared agents only, list_agents of example 04 skips the others
+    names = [f"stub-agent-{i}" for i in random.Random(0).choices(
+        [i for i in range(1, args.agents + 1) if i % 4], k=args.lookups)]
+    try:
+        print(f"{'lookup':24}{'us/lookup':>14}{'found':>8}")
+        per_lookup, found = measure(first_page_lookup, names[:max(1, args.lookups // 10)])
+        print(f"{'first page per call':24}{per_lookup * 1e6:14.1f}{found:8.1%}")
+
+        registry = AgentRegistry(get_bedrock_client(service_name="bedrock-agent", region_name="us-east-1"),
+                                 page_size=args.page_size)
+        started = time.perf_counter()
+        registry.get_by_name(names[0])
+        load = time.perf_counter() - started
+        per_lookup, found = measure(lambda name: registry.resolve(name), names * 100)
+        print(f"{'registry':24}{per_lookup * 1e6:14.3f}{found:8.1%}")
+        stats = registry.stats()
+        print(f"registry load: {load * 1000:.0f} ms, {stats['list_calls']} list calls, {stats['agents']} agents")
+        registry.close()
+    finally:
+        stub.terminate()
@@ -0,0 +1,51 @@
+# Where the time of an agent call goes. Calls invoke_bedrock_agent of example 04 with
+# tracing on against the local stub of bedrock-agent-runtime, whose trace steps take
+# --step-latency each with the --latency-distribution, and feeds the returned traces
+# to agents.trace_analyzer.AgentTraceAnalyzer. Prints the per phase and per step
+# latency and token percentiles, how fast the analyzer rebuilds the timelines, and
+# writes the folded stacks for a flame graph (flamegraph.pl agent.folded > agent.svg).
+#
+# python -m benchmarks.bench_agent_steps --invocations 200 --step-latency 0.02 --latency-distribution lognormal --folded agent.folded
+import argparse
+import importlib
+import time
+
+from agents.trace_analyzer import AgentTraceAnalyzer, print_breakdown
+from benchmarks.bench_suite import offline_environment
+from local_bedrock.latency import DISTRIBUTIONS
+from local_bedrock.stub_server import start_stub_process
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--step-latency", type=float, default=0.02)
+    parser.add_argument("--latency-distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--folded", default=None)
+    args = parser.parse_args()
+
+    stub, endpoint_url = start_stub_process(latency=args.latency, latency_distribution=args.latency_distribution,
+                                            step_latency=args.step_latency)
+    offline_environment(endpoint_url)
+    agent_example = importlib.import_module("examples.04_how_to_call_bedrock_agent")
+    try:
+        agent_client = agent_example.BedRockClient()
+        invocations = []
+        for i in range(args.invocations):
+            _, traces = agent_client.invoke_bedrock_agent("STUBAGENT1", "STUBALIAS1", f"steps-{i:05d}",
+                                                          "What is the interest rate?", enable_trace=True)
+            invocations.append(traces)
+    finally:
+        stub.terminate()
+
+    analyzer = AgentTraceAnalyzer()
+    started = time.perf_counter()
+    for traces in invocations:
+        analyzer.add_invocation(traces)
+    breakdown = analyzer.breakdown()
+    elapsed = time.perf_counter() - started
+    events = sum(len(traces) for traces in invocations)
+    print_breakdown(breakdown)
+    print(f"analyzed {events} trace events in {elapsed * 1000:.1f} ms, {events / elapsed:,.0f} events/s")
+    if args.folded:
+        print(f"{analyzer.write_folded(args.folded)} stacks written to {args.folded}")
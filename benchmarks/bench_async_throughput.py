@@ -0,0 +1,89 @@
+# Compares invoke_model throughput of the thread per request boto3 client against the
+# asyncio aiobotocore client at increasing concurrency. The stub endpoint runs in its
+# own process so it does not compete with the clients for the GIL.
+#
+# python -m benchmarks.bench_async_throughput --latency 0.05 --concurrency 1 10 100 500
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clients.async_bedrock_client_factory import AsyncBedrockClientFactory
+from clients.bedrock_client_factory import BedrockClientFactory
+from local_bedrock.stub_server import start_stub_process
+
+MODEL_ID = "amazon.titan-embed-text-v1"
+
+
+def _request(i):
+    return {
+        "body": json.dumps({"inputText": f"benchmark text {i}"}),
+        "modelId": MODEL_ID,
+        "accept": "application/json",
+        "contentType": "application/json",
+    }
+
+
+def run_sync(concurrency, requests):
+    factory = BedrockClientFactory(max_pool_connections=concurrency)
+    client = factory.get_client()
+
+    def invoke(i):
+        response = client.invoke_model(**_request(i))
+        return json.loads(response["body"].read())
+
+    invoke(0)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(invoke, range(requests)))
+    elapsed = time.perf_counter() - start
+    factory.close()
+
+    return requests / elapsed
+
+
+async def run_async(concurrency, requests):
+    factory = AsyncBedrockClientFactory(max_pool_connections=concurrency)
+    client = await factory.get_client()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def invoke(i):
+        async with semaphore:
+            response = await client.invoke_model(**_request(i))
+            return json.loads(await response["body"].read())
+
+    await invoke(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(invoke(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    await factory.close()
+
+    return requests / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Simulated model latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--rounds", type=int, default=4,
+                        help="Requests per unit of concurrency")
+    args = parser.parse_args()
+
+    stub, endpoint_url = start_stub_process(latency=args.latency)
+    os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = endpoint_url
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stub")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stub")
+
+    try:
+        print(f"{'concurrency':>12}{'sync req/s':>14}{'async req/s':>14}")
+        for concurrency in args.concurrency:
+            requests = max(concurrency * args.rounds, 20)
+            sync_throughput = run_sync(concurrency, requests)
+            async_throughput = asyncio.run(run_async(concurrency, requests))
+            print(f"{concurrency:12}{sync_throughput:14.1f}{async_throughput:14.1f}")
+    finally:
+        stub.terminate()
@@ -0,0 +1,62 @@
+# Throughput in MB/s of ingestion.token_chunker.TokenChunker against the
+# CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n") of example
+# 08, on the page texts of examples/data/impact_of_covid.pdf repeated to the wanted
+# size. Pages are split one at a time, the way the ingestion pipeline does. For both
+# the spread of the tokens per chunk and the share of chunks that end a sentence are
+# reported, measured with the same token counter.
+#
+# python -m benchmarks.bench_chunker --megabytes 20 --chunk-tokens 128 --overlap-tokens 16
+import argparse
+import os
+import statistics
+import time
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters import CharacterTextSplitter
+
+from ingestion.token_chunker import TokenChunker, get_token_counter
+
+PDF_PATH = os.path.join(os.path.dirname(__file__), "..", "examples", "data", "impact_of_covid.pdf")
+
+
+def measure(split_text, pages, repeat):
+    """
+    Splits every page
+    :return: MB/s of the best run, list of chunks
+    """
+    size = sum(len(page.encode()) for page in pages) / 2 ** 20
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [chunk for page in pages for chunk in split_text(page)]
+        best = min(best, time.perf_counter() - start)
+    return size / best, chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=float, default=20)
+    parser.add_argument("--chunk-tokens", type=int, default=128)
+    parser.add_argument("--overlap-tokens", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pdf_pages = [page.page_content for page in PyPDFLoader(PDF_PATH).load()]
+    pdf_size = sum(len(page.encode()) for page in pdf_pages)
+    pages = pdf_pages * max(1, int(args.megabytes * 2 ** 20 / pdf_size))
+
+    print(f"{len(pages)} pages, {sum(len(page.encode()) for page in pages) / 2 ** 20:.1f} MB")
+    print(f"{'splitter':28}{'MB/s':>8}{'chunks':>9}{'tokens mean':>13}{'min':>6}{'max':>6}{'stdev':>8}"
+          f"{'end sentence':>14}")
+    character_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n")
+    token_chunker = TokenChunker(chunk_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens)
+    count_tokens = get_token_counter(token_chunker.encoding)
+    for name, split_text in [("CharacterTextSplitter 500", character_splitter.split_text),
+                             (f"TokenChunker {args.chunk_tokens}", token_chunker.split_text)]:
+        throughput, chunks = measure(split_text, pages, args.repeat)
+        # The chunks of one copy of the pdf, all copies are the same
+        sample = chunks[:len(chunks) * len(pdf_pages) // len(pages)]
+        tokens = [count_tokens(chunk)([(0, len(chunk))])[0] for chunk in sample]
+        ends = sum(chunk.rstrip("\"')]").endswith((".", "!", "?")) for chunk in sample) / len(sample)
+        print(f"{name:28}{throughput:8.1f}{len(chunks):9}{statistics.mean(tokens):13.1f}{min(tokens):6}"
+              f"{max(tokens):6}{statistics.pstdev(tokens):8.1f}{ends:14.1%}")
@@ -0,0 +1,126 @@
+# Compares the per request overhead of building a session, assuming the role and
+# creating a bedrock-runtime client on every call against the shared client factory.
+# STS and Bedrock are stubbed with botocore before-call hooks, so client construction,
+# endpoint resolution and model loading are real while no request leaves the process.
+#
+# python -m benchmarks.bench_client_factory --requests 200 --sts-latency 0.02
+import argparse
+import io
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.response import StreamingBody
+
+from clients.bedrock_client_factory import BedrockClientFactory
+
+ROLE_ARN = "arn:aws:iam::123456789012:role/bedrock-benchmark"
+MODEL_ID = "amazon.titan-embed-text-v1"
+
+
+def _http_response():
+    return AWSResponse("https://stub", 200, {}, None)
+
+
+class StubbedSession(boto3.Session):
+    """
+    boto3 session whose STS and bedrock-runtime calls are answered locally
+    """
+    sts_latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.events.register("before-call.sts.AssumeRole", self._assume_role)
+        self.events.register("before-call.bedrock-runtime.InvokeModel", self._invoke_model)
+
+    def _assume_role(self, **kwargs):
+        time.sleep(self.sts_latency)
+        return _http_response(), {
+            "Credentials": {
+                "AccessKeyId": "ASIASTUB",
+                "SecretAccessKey": "stub-secret",
+                "SessionToken": "stub-token",
+                "Expiration": datetime.now(timezone.utc) + timedelta(hours=1),
+            }
+        }
+
+    def _invoke_model(self, **kwargs):
+        payload = json.dumps({"embedding": [0.0] * 8}).encode()
+        return _http_response(), {"body": StreamingBody(io.BytesIO(payload), len(payload))}
+
+
+def legacy_get_bedrock_client(assume_role, profile_name=None):
+    """
+    The per call client construction the generation and example clients used to do
+    """
+    session = boto3.Session(profile_name=profile_name)
+    sts = session.client("sts")
+    response = sts.assume_role(
+        RoleArn=str(assume_role),
+        RoleSessionName="bedrock-session"
+    )
+    retry_config = Config(
+        retries={
+            "max_attempts": 10,
+            "mode": "standard",
+        },
+    )
+    return session.client(
+        service_name="bedrock-runtime",
+        config=retry_config,
+        aws_access_key_id=response["Credentials"]["AccessKeyId"],
+        aws_secret_access_key=response["Credentials"]["SecretAccessKey"],
+        aws_session_token=response["Credentials"]["SessionToken"],
+    )
+
+
+def _invoke(client):
+    response = client.invoke_model(body=json.dumps({"inputText": "benchmark"}),
+                                   modelId=MODEL_ID,
+                                   accept="application/json",
+                                   contentType="application/json")
+    return json.loads(response["body"].read())
+
+
+def run(get_client, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        _invoke(get_client())
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    return {
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--sts-latency", type=float, default=0.02,
+                        help="Simulated STS round trip in seconds")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stub")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stub")
+    StubbedSession.sts_latency = args.sts_latency
+    boto3.Session = StubbedSession
+
+    factory = BedrockClientFactory()
+    results = {
+        "per call assume_role": run(lambda: legacy_get_bedrock_client(ROLE_ARN), args.requests),
+        "shared client factory": run(lambda: factory.get_client(assume_role=ROLE_ARN), args.requests),
+    }
+    factory.close()
+
+    print(f"{'':24}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, stats in results.items():
+        print(f"{name:24}{stats['mean_ms']:10.3f}{stats['p50_ms']:10.3f}{stats['p99_ms']:10.3f}")
@@ -0,0 +1,53 @@
+# Embeds the chunks of examples/data/impact_of_covid.pdf against the local stub with
+# an increasing number of workers. With a fixed model latency the ingestion time
+# should fall in proportion to the number of workers.
+#
+# python -m benchmarks.bench_embedding_batch --latency 0.05 --workers 1 4 16
+import argparse
+import os
+import time
+
+from langchain_text_splitters import CharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+
+from clients.bedrock_client_factory import BedrockClientFactory
+from embeddings.titan_embedding import TitanEmbedding
+from local_bedrock.stub_server import BedrockStubServer
+
+PDF_PATH = os.path.join(os.path.dirname(__file__), "..", "examples", "data", "impact_of_covid.pdf")
+
+
+def load_chunks():
+    documents = PyPDFLoader(PDF_PATH).load()
+    text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n")
+    return [doc.page_content for doc in text_splitter.split_documents(documents=documents)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Simulated model latency in seconds")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    stub = BedrockStubServer(latency=args.latency).start()
+    os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = stub.endpoint_url
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stub")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stub")
+
+    chunks = load_chunks()
+    factory = BedrockClientFactory(max_pool_connections=max(args.workers))
+    client = factory.get_client()
+    print(f"{len(chunks)} chunks")
+    print(f"{'workers':>8}{'seconds':>10}{'chunks/s':>10}{'speedup':>10}")
+    baseline = None
+    for workers in args.workers:
+        engine = TitanEmbedding(client=client)
+        start = time.perf_counter()
+        embeddings = engine.get_embeddings_batch(chunks, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers:8}{elapsed:10.2f}{len(chunks) / elapsed:10.1f}{baseline / elapsed:10.1f}x")
+
+    stub.shutdown()
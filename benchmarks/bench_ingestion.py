@@ -0,0 +1,75 @@
+# Compares the load-everything ingestion of example 08 with the streaming
+# PdfIngestionPipeline on a directory holding copies of examples/data/impact_of_covid.pdf.
+# Each run is a fresh process so its peak RSS is its own. Embeddings come from the
+# local stub, which runs in another process.
+#
+# python -m benchmarks.bench_ingestion --copies 50 --latency 0.05
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from local_bedrock.stub_server import start_stub_process
+
+PDF_PATH = os.path.join(os.path.dirname(__file__), "..", "examples", "data", "impact_of_covid.pdf")
+
+
+def _embeddings():
+    from clients.bedrock_client_factory import get_bedrock_client
+    from embeddings.langchain_embedding import BatchedBedrockEmbeddings
+
+    return BatchedBedrockEmbeddings(client=get_bedrock_client(), region_name="us-east-1", max_workers=8)
+
+
+def ingest_eagerly(directory, index_store):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.vectorstores.faiss import FAISS
+    from langchain_text_splitters import CharacterTextSplitter
+
+    from ingestion.pdf_pipeline import iter_pdf_paths, peak_rss_mb
+
+    start = time.perf_counter()
+    documents = [page for path in iter_pdf_paths(directory) for page in PyPDFLoader(path).load()]
+    text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n")
+    docs = text_splitter.split_documents(documents=documents)
+    FAISS.from_documents(docs, _embeddings()).save_local(index_store)
+    seconds = time.perf_counter() - start
+    return {"pages": len(documents), "chunks": len(docs), "seconds": seconds,
+            "pages_per_second": len(documents) / seconds, "peak_rss_mb": peak_rss_mb()}
+
+
+def ingest_streaming(directory, index_store):
+    from ingestion.pdf_pipeline import PdfIngestionPipeline
+
+    return PdfIngestionPipeline(_embeddings(), index_store).run(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub, endpoint_url = start_stub_process(latency=args.latency)
+    os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = endpoint_url
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stub")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stub")
+
+    directory = tempfile.mkdtemp(prefix="bench-ingestion-")
+    for i in range(args.copies):
+        shutil.copy(PDF_PATH, os.path.join(directory, f"document_{i:05d}.pdf"))
+
+    print(f"{'':12}{'pages':>7}{'chunks':>8}{'seconds':>9}{'pages/s':>9}{'peak RSS MB':>13}")
+    try:
+        for name, ingest in [("eager", ingest_eagerly), ("streaming", ingest_streaming)]:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(ingest, directory, os.path.join(directory, f"index_{name}")).result()
+            print(f"{name:12}{result['pages']:7}{result['chunks']:8}{result['seconds']:9.2f}"
+                  f"{result['pages_per_second']:9.1f}{result['peak_rss_mb']:13.1f}")
+    finally:
+        stub.terminate()
+        shutil.rmtree(directory)
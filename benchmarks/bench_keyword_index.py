@@ -0,0 +1,79 @@
+# Build time, size and lookup latency of the BM25Index of HybridRetrieval on a
+# synthetic corpus. Every chunk is about 40 words drawn from a Zipf distribution over
+# a 50,000 word vocabulary, the way words of natural text are spread, plus a unique
+# loan id. Queries are single loan ids, the exact-term lookups vector search misses,
+# and three word natural language queries whose common words have long postings.
+#
+# python -m benchmarks.bench_keyword_index --chunks 1000000
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from retrieval.bm25_index import BM25Index
+
+
+def corpus(count, words_per_chunk=40, vocabulary=50_000, seed=0):
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    texts = []
+    for start in range(0, count, 100_000):
+        size = min(100_000, count - start)
+        drawn = words[np.minimum(rng.zipf(1.2, (size, words_per_chunk)) - 1, vocabulary - 1)]
+        texts.extend(f"Loan LN-{start + i:07d} " + " ".join(row) for i, row in enumerate(drawn))
+    return texts
+
+
+def measure(index, queries, k, accept=None):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k, accept=accept)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    texts = corpus(args.chunks)
+    ids = [f"chunk-{i}" for i in range(args.chunks)]
+    directory = tempfile.mkdtemp(prefix="bench-keyword-index-")
+    try:
+        # Added in several updates like an incrementally built corpus
+        index = BM25Index(directory, max_segments=args.segments)
+        step = -(-args.chunks // args.segments)
+        start = time.perf_counter()
+        for offset in range(0, args.chunks, step):
+            index.add(ids[offset:offset + step], texts[offset:offset + step])
+        build_time = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(folder, name))
+                   for folder, _, names in os.walk(directory) for name in names)
+
+        start = time.perf_counter()
+        index = BM25Index(directory)
+        load_time = time.perf_counter() - start
+
+        rng = np.random.default_rng(1)
+        id_queries = [f"LN-{i:07d}" for i in rng.integers(0, args.chunks, args.queries)]
+        word_queries = [" ".join(f"w{i}" for i in rng.integers(0, 2000, 3)) for _ in range(args.queries)]
+
+        print(f"{args.chunks} chunks in {len(index.segments)} segments, built in {build_time:.1f} s, "
+              f"{size / 2 ** 20:.0f} MB on disk, loaded in {load_time * 1000:.0f} ms")
+        print(f"{'query':28}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, queries, accept in [("loan id", id_queries, None),
+                                      ("loan id, filtered", id_queries, lambda id_: id_.endswith("7")),
+                                      ("three words", word_queries, None)]:
+            p50, p95 = measure(index, queries, args.k, accept)
+            print(f"{name:28}{p50:9.3f}{p95:9.3f}")
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,96 @@
+# Ingestion and retrieval throughput of the knowledge base emulator of the stub
+# server, through the boto3 bedrock-agent and bedrock-agent-runtime clients. A bucket
+# folder is filled with copies of examples/data/impact_of_covid.pdf, a knowledge base
+# and data source are created, and an ingestion job is run and polled to COMPLETE.
+# Then retrieve is called with a growing number of concurrent clients.
+#
+# python -m benchmarks.bench_knowledge_base --documents 20 --queries 400 --concurrency 1 8 32
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from local_bedrock.stub_server import start_stub_process
+
+PDF_PATH = os.path.join(os.path.dirname(__file__), "..", "examples", "data", "impact_of_covid.pdf")
+QUERIES = ["How many students were surveyed?", "impact of covid on graduation",
+           "expected earnings after college", "students who lost their job"]
+
+
+def ingest(agent, bucket):
+    knowledge_base_id = agent.create_knowledge_base(
+        name="benchmark", roleArn="arn:aws:iam::123456789012:role/benchmark",
+        knowledgeBaseConfiguration={"type": "VECTOR", "vectorKnowledgeBaseConfiguration": {
+            "embeddingModelArn": "arn:aws:bedrock:us-east-1::foundation-model/amazon.titan-embed-text-v1"}},
+    )["knowledgeBase"]["knowledgeBaseId"]
+    data_source_id = agent.create_data_source(
+        knowledgeBaseId=knowledge_base_id, name="benchmark",
+        dataSourceConfiguration={"type": "S3", "s3Configuration": {"bucketArn": f"arn:aws:s3:::{bucket}"}},
+        vectorIngestionConfiguration={"chunkingConfiguration": {
+            "chunkingStrategy": "FIXED_SIZE",
+            "fixedSizeChunkingConfiguration": {"maxTokens": 200, "overlapPercentage": 20}}},
+    )["dataSource"]["dataSourceId"]
+
+    start = time.perf_counter()
+    job_id = agent.start_ingestion_job(knowledgeBaseId=knowledge_base_id,
+                                       dataSourceId=data_source_id)["ingestionJob"]["ingestionJobId"]
+    statuses = []
+    while True:
+        job = agent.get_ingestion_job(knowledgeBaseId=knowledge_base_id, dataSourceId=data_source_id,
+                                      ingestionJobId=job_id)["ingestionJob"]
+        if not statuses or statuses[-1] != job["status"]:
+            statuses.append(job["status"])
+        if job["status"] in ("COMPLETE", "FAILED"):
+            return knowledge_base_id, time.perf_counter() - start, job, statuses
+        time.sleep(0.05)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    bucket_root = tempfile.mkdtemp(prefix="bench-knowledge-base-")
+    os.makedirs(os.path.join(bucket_root, "benchmark-bucket"))
+    for i in range(args.documents):
+        shutil.copy(PDF_PATH, os.path.join(bucket_root, "benchmark-bucket", f"document_{i:05d}.pdf"))
+
+    stub, endpoint_url = start_stub_process(bucket_root=bucket_root, ingestion_step_latency=0.1)
+    os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stub")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stub")
+
+    from clients.bedrock_client_factory import get_bedrock_client
+
+    try:
+        agent = get_bedrock_client(service_name="bedrock-agent", region_name="us-east-1")
+        runtime = get_bedrock_client(service_name="bedrock-agent-runtime", region_name="us-east-1")
+        knowledge_base_id, seconds, job, statuses = ingest(agent, "benchmark-bucket")
+        statistics = job["statistics"]
+        print(f"ingestion {' -> '.join(statuses)} in {seconds:.2f} s, "
+              f"{statistics['numberOfNewDocumentsIndexed']} documents, "
+              f"{statistics['numberOfNewDocumentsIndexed'] / seconds:.1f} documents/s")
+
+        def retrieve(i):
+            start = time.perf_counter()
+            runtime.retrieve(knowledgeBaseId=knowledge_base_id,
+                             retrievalQuery={"text": QUERIES[i % len(QUERIES)]},
+                             retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": 5}})
+            return time.perf_counter() - start
+
+        print(f"{'concurrency':>11}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as executor:
+                latencies = sorted(executor.map(retrieve, range(args.queries)))
+            elapsed = time.perf_counter() - start
+            print(f"{concurrency:11}{args.queries / elapsed:9.1f}{latencies[len(latencies) // 2] * 1000:9.2f}"
+                  f"{latencies[int(len(latencies) * 0.95)] * 1000:9.2f}")
+    finally:
+        stub.terminate()
+        shutil.rmtree(bucket_root)
@@ -0,0 +1,55 @@
+# Cost of the vectorized MMR of retrieval.post_processing against the maximal
+# marginal relevance of langchain_community, which loops over the candidates in
+# python and recomputes the similarities to all selected candidates every step.
+# Candidates are seeded random unit vectors around the query, a tenth of them near
+# duplicates of others, spread over 50 sources.
+#
+# python -m benchmarks.bench_mmr --candidates 100 1000 10000 --k 10
+import argparse
+import time
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from retrieval.post_processing import select_diverse
+
+
+def candidates(count, dimensions, seed=0):
+    rng = np.random.default_rng(seed)
+    query = rng.standard_normal(dimensions).astype(np.float32)
+    vectors = query + 1.5 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    duplicates = rng.choice(count, count // 10, replace=False)
+    vectors[duplicates] = vectors[rng.integers(0, count, len(duplicates))] \
+        + 0.01 * rng.standard_normal((len(duplicates), dimensions)).astype(np.float32)
+    sources = [f"doc-{i % 50}" for i in range(count)]
+    return query, vectors, sources
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, nargs="*", default=[100, 1000, 10000])
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'candidates':>10}{'mmr ms':>10}{'+ filters ms':>14}{'langchain ms':>14}{'speedup':>9}")
+    for count in args.candidates:
+        query, vectors, sources = candidates(count, args.dimensions)
+        ours = timed(lambda: select_diverse(query, vectors, k=args.k), args.repeat)
+        filtered = timed(lambda: select_diverse(query, vectors, k=args.k, score_threshold=0.2,
+                                                duplicate_threshold=0.95, sources=sources,
+                                                max_per_source=2), args.repeat)
+        theirs = timed(lambda: maximal_marginal_relevance(query, vectors, k=args.k), args.repeat)
+        # Same selection as langchain when no filter is set
+        assert select_diverse(query, vectors, k=args.k) == maximal_marginal_relevance(query, vectors, k=args.k)
+        print(f"{count:10}{ours:10.2f}{filtered:14.2f}{theirs:14.2f}{theirs / ours:9.1f}")
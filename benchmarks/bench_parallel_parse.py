@@ -0,0 +1,76 @@
+# Parse and chunk throughput of ParallelPdfParser against the single threaded
+# PyPDFLoader + CharacterTextSplitter path, on a directory holding copies of
+# examples/data/impact_of_covid.pdf. No embedding is done, so this measures the
+# cpu bound front end only. The chunks of every run are checked against the
+# sequential ones, and the bytes a worker sends back per pdf are compared with the
+# size of the pickled langchain Documents of that pdf.
+#
+# python -m benchmarks.bench_parallel_parse --copies 40 --workers 1 2 4 8
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+from langchain_text_splitters import CharacterTextSplitter
+
+from ingestion.parallel_parse import ParallelPdfParser, _init_worker, parse_pdf
+from ingestion.pdf_pipeline import iter_chunks, iter_pages, iter_pdf_paths
+
+PDF_PATH = os.path.join(os.path.dirname(__file__), "..", "examples", "data", "impact_of_covid.pdf")
+
+
+def parse_sequentially(directory):
+    text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n")
+    stats = {"pdfs": 0, "failed_pdfs": 0, "pages": 0}
+    chunks = [(doc.metadata["source"], doc.metadata["page"], doc.page_content)
+              for doc in iter_chunks(iter_pages(iter_pdf_paths(directory), stats), text_splitter)]
+    return chunks, stats["pages"]
+
+
+def parse_in_parallel(directory, workers):
+    stats = {"pdfs": 0, "failed_pdfs": 0, "pages": 0}
+    chunks = [(doc.metadata["source"], doc.metadata["page"], doc.page_content)
+              for doc in ParallelPdfParser(max_workers=workers).iter_chunks(directory, stats)]
+    return chunks, stats["pages"]
+
+
+def record_sizes(path):
+    # What crosses the process boundary for one pdf, compact record against Documents
+    text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n")
+    documents = list(iter_chunks(iter_pages([path]), text_splitter))
+    _init_worker(500, 50)
+    return len(pickle.dumps(parse_pdf(path))), len(pickle.dumps(documents))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench-parallel-parse-")
+    for i in range(args.copies):
+        shutil.copy(PDF_PATH, os.path.join(directory, f"document_{i:05d}.pdf"))
+
+    try:
+        compact, documents = record_sizes(PDF_PATH)
+        print(f"{os.cpu_count()} cores, per pdf the workers send {compact / 1024:.0f} KB "
+              f"instead of {documents / 1024:.0f} KB of pickled Documents")
+
+        print(f"{'':14}{'pages':>7}{'chunks':>8}{'seconds':>9}{'pages/s':>9}{'speedup':>9}")
+        start = time.perf_counter()
+        expected, pages = parse_sequentially(directory)
+        baseline = time.perf_counter() - start
+        print(f"{'sequential':14}{pages:7}{len(expected):8}{baseline:9.2f}{pages / baseline:9.1f}{1.0:9.2f}")
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            chunks, pages = parse_in_parallel(directory, workers)
+            seconds = time.perf_counter() - start
+            assert chunks == expected, "The parallel chunks differ from the sequential ones"
+            print(f"{f'{workers} workers':14}{pages:7}{len(chunks):8}{seconds:9.2f}{pages / seconds:9.1f}"
+                  f"{baseline / seconds:9.2f}")
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,86 @@
+# Memory saved against recall lost by the quantized indexes of vectorstore.mmap_faiss,
+# on the synthetic corpus of bench_vector_index at the 1536 dimensions of Titan
+# embeddings. Every mode is written to disk and memory mapped in a fresh process the
+# way load_vector reads it. "codes MB" is what the search scans and has to stay in
+# RAM, "resident MB" is what the process actually paged in after searching (the
+# codes plus the exact vector rows read by the re-ranking). Recall is measured
+# against exact float32 search.
+#
+# python -m benchmarks.bench_quantization --vectors 50000 --dimensions 1536 --queries 200
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+
+from benchmarks.bench_vector_index import corpus, recall, search_one_by_one
+from vectorstore.mmap_faiss import build_faiss_index, code_size, configure_search, read_mmap_index
+
+
+def resident_memory_mb():
+    # resident pages, private and file backed, from /proc/self/statm
+    return int(open("/proc/self/statm").read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def measure_loaded(path, queries, truth, rerank_factor):
+    """
+    Loads the index memory mapped and searches it query by query. Runs in a fresh
+    process with the file dropped from the page cache, so no page of the index is
+    resident before
+    :return: resident MB, recall, mean ms
+    """
+    faiss.omp_set_num_threads(1)
+    descriptor = os.open(path, os.O_RDONLY)
+    os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+    os.close(descriptor)
+    memory_before = resident_memory_mb()
+    index = configure_search(read_mmap_index(path), rerank_factor=rerank_factor)
+    results, latencies = search_one_by_one(index, queries, truth.shape[1])
+    return resident_memory_mb() - memory_before, recall(results, truth), latencies.mean() * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--pq-m", type=int, default=None)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    vectors, queries = corpus(args.vectors, args.dimensions, args.queries)
+    _, truth = build_faiss_index(vectors, "flat").search(queries, args.k)
+    directory = tempfile.mkdtemp(prefix="bench-quantization-")
+    float32_mb = vectors.nbytes / 2 ** 20
+
+    print(f"{'mode':16}{'build s':>9}{'bytes/vec':>10}{'codes MB':>10}{'saved':>8}{'file MB':>9}"
+          f"{'resident MB':>13}{'recall@' + str(args.k):>11}{'lost':>8}{'mean ms':>9}")
+    spawn = multiprocessing.get_context("spawn")
+    for quantization, rerank in [(None, False), ("fp16", False), ("fp16", True), ("sq8", False),
+                                 ("sq8", True), ("pq", False), ("pq", True)]:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, args.index_type, quantization=quantization, pq_m=args.pq_m,
+                                  rerank=rerank, rerank_factor=args.rerank_factor)
+        build_time = time.perf_counter() - start
+        bytes_per_vector = code_size(index)
+        path = os.path.join(directory, "index.faiss")
+        faiss.write_index(index, path)
+        del index
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            resident_mb, found, mean_ms = executor.submit(measure_loaded, path, queries, truth,
+                                                          args.rerank_factor if rerank else None).result()
+        if quantization is None:
+            baseline = found
+        codes_mb = bytes_per_vector * args.vectors / 2 ** 20
+        name = f"{quantization or 'float32'}{' + rerank' if rerank else ''}"
+        print(f"{name:16}{build_time:9.2f}{bytes_per_vector:10}{codes_mb:10.1f}{1 - codes_mb / float32_mb:8.1%}"
+              f"{os.path.getsize(path) / 2 ** 20:9.1f}{resident_mb:13.1f}{found:11.3f}{baseline - found:8.3f}"
+              f"{mean_ms:9.3f}")
+        os.remove(path)
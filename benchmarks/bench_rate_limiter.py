@@ -0,0 +1,67 @@
+# Sends a burst of invoke_model calls from many threads at a stub that enforces a
+# per model quota. Compares botocore retries on their own (10 attempts, standard mode)
+# with the shared adaptive rate limiter, which is not told the quota and has to find it.
+#
+# python -m benchmarks.bench_rate_limiter --quota-rps 20 --threads 32 --requests 300
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from clients.bedrock_client_factory import BedrockClientFactory
+from clients.rate_limiter import get_rate_limiter
+from local_bedrock.stub_server import BedrockStubServer
+
+MODEL_ID = "meta.llama2-13b-chat-v1"
+
+
+def burst(client, threads, requests):
+    def invoke(i):
+        try:
+            response = client.invoke_model(body=json.dumps({"prompt": f"question {i}"}),
+                                           modelId=MODEL_ID,
+                                           accept="application/json",
+                                           contentType="application/json")
+            response["body"].read()
+            return True
+        except client.exceptions.ThrottlingException:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        succeeded = sum(executor.map(invoke, range(requests)))
+
+    return succeeded, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quota-rps", type=float, default=20)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub = BedrockStubServer(latency=args.latency, quota_rps=args.quota_rps).start()
+    os.environ["AWS_ENDPOINT_URL_BEDROCK_RUNTIME"] = stub.endpoint_url
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stub")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stub")
+
+    retrying_client = boto3.client("bedrock-runtime", config=Config(
+        retries={"max_attempts": 10, "mode": "standard"}, max_pool_connections=args.threads))
+    limited_client = BedrockClientFactory(max_pool_connections=args.threads).get_client()
+
+    print(f"{'':22}{'ok':>6}{'failed':>8}{'throttled':>11}{'seconds':>9}{'req/s':>8}")
+    for name, client in [("botocore retries", retrying_client), ("adaptive limiter", limited_client)]:
+        throttled_before = stub.throttled
+        succeeded, elapsed = burst(client, args.threads, args.requests)
+        print(f"{name:22}{succeeded:6}{args.requests - succeeded:8}{stub.throttled - throttled_before:11}"
+              f"{elapsed:9.2f}{succeeded / elapsed:8.1f}")
+
+    print("limiter state", get_rate_limiter(MODEL_ID).stats())
+    stub.shutdown()
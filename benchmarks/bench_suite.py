@@ -0,0 +1,177 @@
+# End to end benchmarks of the repo's entry points against the local stub, which runs
+# bedrock-runtime, bedrock-agent-runtime and sts in a separate process. Every scenario
+# goes through the real code path (shared clients, assumed role credentials from the
+# stub sts, rate limiter, response parsing) and reports latency percentiles, throughput
+# and the memory allocated per call. Write the results with --json and compare runs to
+# catch regressions.
+#
+# python -m benchmarks.bench_suite --calls 200 --latency 0.02 --latency-distribution lognormal
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from local_bedrock.stub_server import DISTRIBUTIONS, start_stub_process
+
+MODEL_ID = "meta.llama2-13b-chat-v1"
+STUB_ROLE = "arn:aws:iam::000000000000:role/bedrock-stub"
+
+
+def offline_environment(endpoint_url):
+    """
+    Points every client at the stub and gives them a default profile with dummy
+    credentials, since the examples create their clients with profile_name='default'
+    :param endpoint_url: The endpoint of the stub
+    :return: None
+    """
+    directory = tempfile.mkdtemp(prefix="bedrock-stub-")
+    with open(os.path.join(directory, "config"), "w") as f:
+        f.write("[default]\nregion = us-east-1\n")
+    with open(os.path.join(directory, "credentials"), "w") as f:
+        f.write("[default]\naws_access_key_id = stub\naws_secret_access_key = stub\n")
+
+    os.environ["AWS_CONFIG_FILE"] = os.path.join(directory, "config")
+    os.environ["AWS_SHARED_CREDENTIALS_FILE"] = os.path.join(directory, "credentials")
+    os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+    # The generation module reads its role at import, assuming it goes through the stub sts
+    os.environ["LLAMA_ASSUMED_ROLE"] = STUB_ROLE
+
+
+def scenarios():
+    """
+    Returns the benchmarked calls. Imports happen here, after offline_environment
+    :return: dict of name to a function taking the call number
+    """
+    from embeddings.titan_embedding import TitanEmbedding
+    from generation.bedrock_agent import BedrockGeneration
+    from retrieval.context_retrieval import ContextRetrieval
+
+    agent_example = importlib.import_module("examples.04_how_to_call_bedrock_agent")
+    kb_example = importlib.import_module("examples.07_how_to_create_a_knowledge_base")
+
+    generation = BedrockGeneration()
+    retriever = ContextRetrieval()
+    embedding = TitanEmbedding(assume_role=STUB_ROLE)
+    agent = agent_example.BedRockClient()
+    kb = kb_example.BedrockKBAgent()
+
+    return {
+        "generate": lambda i: generation.generate(MODEL_ID, retriever, question=f"Where is tajmahal? {i}"),
+        "get_embeddings": lambda i: embedding.get_embeddings(f"benchmark text {i}"),
+        "invoke_bedrock_agent": lambda i: agent.invoke_bedrock_agent("STUBAGENT1", "STUBALIAS1",
+                                                                     f"session-{i}", "What is the interest rate?"),
+        "retrieve_from_kb": lambda i: kb.retrieve_from_kb("STUBKB0001", f"What is the loan amount? {i}"),
+    }
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure_latency(call, calls, concurrency):
+    """
+    Runs the calls and times each of them
+    :param call: The scenario function
+    :param calls: The number of calls
+    :param concurrency: The number of threads issuing calls
+    :return: list of latencies and the wall time
+    """
+    def timed(i):
+        start = time.perf_counter()
+        call(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, range(calls)))
+    return latencies, time.perf_counter() - start
+
+
+def measure_allocations(call, calls):
+    """
+    Runs the calls one after the other under tracemalloc
+    :param call: The scenario function
+    :param calls: The number of calls
+    :return: The mean peak of memory allocated during a call and the mean memory
+    still held after it, in bytes
+    """
+    peaks, retained = [], []
+    tracemalloc.start()
+    for i in range(calls):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        call(i)
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        retained.append(current - before)
+    tracemalloc.stop()
+    return sum(peaks) / calls, sum(retained) / calls
+
+
+def run(names, calls, concurrency, allocation_calls):
+    results = {}
+    for name, call in scenarios().items():
+        if names and name not in names:
+            continue
+        # Warm up clients, credentials and imports outside of the measurement
+        call(-1)
+        latencies, elapsed = measure_latency(call, calls, concurrency)
+        peak, retained = measure_allocations(call, allocation_calls)
+        results[name] = {
+            "calls": calls,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "throughput_rps": calls / elapsed,
+            "peak_kib_per_call": peak / 1024,
+            "retained_bytes_per_call": retained,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--allocation-calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--latency-distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--chunk-interval", type=float, default=0.002)
+    parser.add_argument("--step-latency", type=float, default=0.005)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--scenario", nargs="*", default=None)
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    args = parser.parse_args()
+
+    stub, endpoint_url = start_stub_process(latency=args.latency,
+                                            latency_distribution=args.latency_distribution,
+                                            chunk_interval=args.chunk_interval,
+                                            step_latency=args.step_latency,
+                                            throttle_rate=args.throttle_rate)
+    offline_environment(endpoint_url)
+    try:
+        # The examples print every response, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = run(args.scenario, args.calls, args.concurrency, args.allocation_calls)
+    finally:
+        stub.terminate()
+
+    print(f"{'':22}{'calls':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}"
+          f"{'peak KiB':>10}{'kept B':>9}")
+    for name, result in results.items():
+        print(f"{name:22}{result['calls']:7}{result['p50_ms']:9.2f}{result['p95_ms']:9.2f}"
+              f"{result['p99_ms']:9.2f}{result['throughput_rps']:9.1f}"
+              f"{result['peak_kib_per_call']:10.1f}{result['retained_bytes_per_call']:9.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
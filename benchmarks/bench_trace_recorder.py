@@ -0,0 +1,101 @@
+# What capturing the agent traces costs a request: collecting every trace in a list,
+# the way invoke_bedrock_agent did, against agents.trace_recorder.AgentTraceRecorder
+# at a few sample rates. The trace events are the ones the local stub sends for an
+# invoke_agent call, made anew for every request like a parsed response. Reports the
+# microseconds spent on the traces in the request path, the trace memory a request
+# still holds when it returns, and for the recorder the records written and the size
+# of the file per invocation. There is no network wait here, so on a single core the
+# writer thread's work shows up in the request path.
+#
+# python -m benchmarks.bench_trace_recorder --requests 5000 --sample-rates 1.0 0.1
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from agents.trace_recorder import AgentTraceRecorder
+from local_bedrock.agent_runtime import agent_events
+
+
+def trace_events(request):
+    # One event at a time, the way they come off the stream
+    for event_type, payload in agent_events("STUBAGENT1", "STUBALIAS1", f"session-{request}",
+                                            "What is the interest rate?"):
+        if event_type == "trace":
+            yield payload
+
+
+def run(requests, recorder=None, keep_traces=True):
+    """
+    Handles the traces of every request
+    :return: microseconds per request in the request path, KB held per request when
+    it returns, with tracemalloc on
+    """
+    busy = 0.0
+    held = 0
+    for request in range(requests):
+        before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        traces = []
+        recording = None
+        for payload in trace_events(request):
+            started = time.perf_counter()
+            if recording is None and recorder is not None:
+                recording = recorder.start_invocation("STUBAGENT1", "STUBALIAS1", payload["sessionId"])
+            if recording is not None:
+                recording.record(payload)
+            if keep_traces:
+                traces.append(payload["trace"])
+            busy += time.perf_counter() - started
+        if recording is not None:
+            recording.finish()
+        if tracemalloc.is_tracing():
+            held += tracemalloc.get_traced_memory()[0] - before
+        del traces
+    return busy / requests * 1e6, held / requests / 1024
+
+
+def measure(requests, recorder_options=None):
+    """
+    Times the request path, then measures the memory in a second run with tracemalloc
+    :return: microseconds per request, KB held per request, recorder stats or None,
+    bytes written per recorded invocation or None
+    """
+    results = []
+    for trace_memory in (False, True):
+        recorder = None
+        if recorder_options is not None:
+            recorder = AgentTraceRecorder(**recorder_options)
+        if trace_memory:
+            tracemalloc.start()
+        busy, held = run(requests, recorder, keep_traces=recorder is None)
+        if trace_memory:
+            tracemalloc.stop()
+        results.append(busy if not trace_memory else held)
+        if recorder is not None:
+            recorder.close()
+            stats = recorder.stats()
+            size = os.path.getsize(recorder.path) / max(1, stats["sampled_invocations"])
+            os.remove(recorder.path)
+    if recorder_options is None:
+        return results[0], results[1], None, None
+    return results[0], results[1], stats, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--sample-rates", type=float, nargs="*", default=[1.0, 0.1])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'capture':16}{'us/request':>12}{'KB held':>9}{'records':>9}{'dropped':>9}{'bytes/invocation':>18}")
+    busy, held, _, _ = measure(args.requests)
+    print(f"{'list':16}{busy:12.1f}{held:9.2f}{'-':>9}{'-':>9}{'-':>18}")
+    with tempfile.TemporaryDirectory() as directory:
+        for sample_rate in args.sample_rates:
+            options = {"path": os.path.join(directory, "traces.jsonl"), "sample_rate": sample_rate,
+                       "batch_size": args.batch_size, "seed": 0}
+            busy, held, stats, size = measure(args.requests, options)
+            print(f"{f'recorder {sample_rate:g}':16}{busy:12.1f}{held:9.2f}{stats['written_records']:9}"
+                  f"{stats['dropped_events']:9}{size:18.0f}")
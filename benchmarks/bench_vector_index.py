@@ -0,0 +1,118 @@
+# Recall against latency of the flat, IVF and HNSW indexes of vectorstore.mmap_faiss
+# on a reproducible synthetic corpus: a seeded mixture of gaussian clusters of unit
+# vectors, which is how sentence embeddings of a document collection spread out.
+# Every index is written to disk and memory mapped the way load_vector reads it, in a
+# fresh process. The report shows the private (not shared) memory of that process
+# after loading and searching, which is what each additional worker would cost.
+#
+# python -m benchmarks.bench_vector_index --vectors 100000 --dimensions 256 --queries 200
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+
+from vectorstore.mmap_faiss import build_faiss_index, configure_search, read_mmap_index
+
+
+def corpus(count, dimensions, queries, clusters=256, seed=0):
+    """
+    Returns the corpus and held out queries from the same distribution
+    :param count: The number of corpus vectors
+    :param dimensions: The vector size
+    :param queries: The number of queries
+    :param clusters: The number of gaussian clusters
+    :param seed: The random seed
+    :return: corpus matrix and query matrix, float32 unit vectors
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, count + queries)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count + queries, dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:count], vectors[count:]
+
+
+def private_memory_mb():
+    # resident minus file backed and shared pages, from /proc/self/statm
+    pages = open("/proc/self/statm").read().split()
+    return (int(pages[1]) - int(pages[2])) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def search_one_by_one(index, queries, k):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies)
+
+
+def recall(results, truth):
+    k = truth.shape[1]
+    return np.mean([len(set(found) & set(expected)) / k for found, expected in zip(results, truth)])
+
+
+def measure_loaded(path, queries, truth, knob, values):
+    """
+    Loads the index memory mapped and searches it with every setting of the knob.
+    Runs in a fresh process, so the memory of building the index is not counted
+    :return: list of (value, load ms, private MB, recall, mean ms, p95 ms)
+    """
+    faiss.omp_set_num_threads(1)
+    memory_before = private_memory_mb()
+    start = time.perf_counter()
+    index = read_mmap_index(path)
+    load_time = time.perf_counter() - start
+
+    rows = []
+    for value in values:
+        configure_search(index, **({knob: value} if knob else {}))
+        results, latencies = search_one_by_one(index, queries, truth.shape[1])
+        rows.append((value, load_time * 1000, private_memory_mb() - memory_before, recall(results, truth),
+                     latencies.mean() * 1000, np.percentile(latencies, 95) * 1000))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="*", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+
+    # Single query latency, one thread like one request of a web worker
+    faiss.omp_set_num_threads(1)
+    vectors, queries = corpus(args.vectors, args.dimensions, args.queries)
+    _, truth = build_faiss_index(vectors, "flat").search(queries, args.k)
+    directory = tempfile.mkdtemp(prefix="bench-vector-index-")
+
+    print(f"{'index':20}{'build s':>9}{'file MB':>9}{'load ms':>9}{'private MB':>12}"
+          f"{'recall@' + str(args.k):>11}{'mean ms':>9}{'p95 ms':>9}")
+    spawn = multiprocessing.get_context("spawn")
+    for index_type, knob, values in [("flat", None, [None]),
+                                     ("ivf", "nprobe", args.nprobe),
+                                     ("hnsw", "ef_search", args.ef_search)]:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, index_type)
+        build_time = time.perf_counter() - start
+        path = os.path.join(directory, f"{index_type}.faiss")
+        faiss.write_index(index, path)
+        del index
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            rows = executor.submit(measure_loaded, path, queries, truth, knob, values).result()
+        for value, load_ms, private_mb, found, mean_ms, p95_ms in rows:
+            name = f"{index_type} {knob}={value}" if knob else index_type
+            print(f"{name:20}{build_time:9.2f}{os.path.getsize(path) / 2 ** 20:9.1f}{load_ms:9.1f}"
+                  f"{private_mb:12.1f}{found:11.3f}{mean_ms:9.3f}{p95_ms:9.3f}")
+        os.remove(path)
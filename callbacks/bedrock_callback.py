@@ -1,17 +1,147 @@
+import functools
+import threading
+from collections import Counter
+
 from langchain_core.callbacks import BaseCallbackHandler
 
 
 class BedRockTokenCounter(BaseCallbackHandler):
-    def __init__(self, llm):
+    """
+    Counts the input and output tokens of bedrock llm calls from the usage bedrock
+    reports, the x-amzn-bedrock-*-token-count headers for invoke_model and the
+    invocation metrics of the last chunk for streamed calls. langchain_aws passes
+    both on in llm_output and generation_info. Only when a call carries no usage are
+    the tokens counted with the tokenizer of the llm, cached per text.
+
+    The totals accumulate over every call, batched and streamed ones included.
+    """
+
+    def __init__(self, llm=None):
+        """
+        Initializes the counter
+        :param llm: The llm whose tokenizer is the fallback. Without it, a missing
+        usage is estimated at four characters per token
+        """
         self.llm = llm
         self.input_tokens = 0
         self.output_tokens = 0
+        self.reported_calls = 0
+        self.tokenized_calls = 0
+        self._lock = threading.Lock()
+        self._prompts = {}
+        # invoke and batch calls report the usage of every prompt from inside the llm
+        # (usage in llm_output), then langchain ends the run of every prompt once more
+        # without usage. The llm reports all prompts of a batch on the run of the first
+        # one, so a report is paired with its end by the generated text, not the run id.
+        # stream ends a run once, with the usage in the generation info, and leaves
+        # nothing to wait for
+        self._pending_reports = Counter()
+        self._tokenizer_failed = False
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs):
+        self._prompts[run_id] = prompts
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        usage = self._get_usage(response)
+        text = "".join(generation.text for generations in response.generations for generation in generations)
+        with self._lock:
+            prompts = self._prompts.pop(run_id, [])
+            if usage is not None:
+                self.input_tokens += usage[0]
+                self.output_tokens += usage[1]
+                self.reported_calls += 1
+                if (response.llm_output or {}).get("usage"):
+                    self._pending_reports[text] += 1
+                return
+            if self._pending_reports[text]:
+                self._pending_reports[text] -= 1
+                if not self._pending_reports[text]:
+                    del self._pending_reports[text]
+                return
+
+        input_tokens = sum(self._count_tokens(prompt) for prompt in prompts)
+        output_tokens = sum(self._count_tokens(generation.text)
+                            for generations in response.generations for generation in generations)
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.tokenized_calls += 1
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        with self._lock:
+            self._prompts.pop(run_id, None)
+
+    def record_response(self, response):
+        """
+        Counts a raw invoke_model response, for calls made without langchain
+        :param response: The boto3 or aiobotocore invoke_model response
+        :return: None
+        """
+        headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        with self._lock:
+            self.input_tokens += int(headers.get("x-amzn-bedrock-input-token-count", 0))
+            self.output_tokens += int(headers.get("x-amzn-bedrock-output-token-count", 0))
+            self.reported_calls += 1
+
+    def record_stream(self, metrics):
+        """
+        Counts a streamed call made with generation.streaming
+        :param metrics: The StreamMetrics of the exhausted stream
+        :return: None
+        """
+        with self._lock:
+            self.input_tokens += metrics.input_tokens or 0
+            self.output_tokens += metrics.output_tokens or 0
+            self.reported_calls += 1
+
+    def _get_usage(self, response):
+        usage = (response.llm_output or {}).get("usage") or {}
+        input_tokens = usage.get("prompt_tokens", 0)
+        output_tokens = usage.get("completion_tokens", 0)
+        if input_tokens or output_tokens:
+            return input_tokens, output_tokens
+
+        # Streamed generations keep the invocation metrics of their last chunk
+        found = False
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                if "usage_metadata" in info:
+                    input_tokens += info["usage_metadata"].get("input_tokens", 0)
+                    output_tokens += info["usage_metadata"].get("output_tokens", 0)
+                    found = True
+                elif "amazon-bedrock-invocationMetrics" in info:
+                    input_tokens += info["amazon-bedrock-invocationMetrics"].get("inputTokenCount", 0)
+                    output_tokens += info["amazon-bedrock-invocationMetrics"].get("outputTokenCount", 0)
+                    found = True
+
+        return (input_tokens, output_tokens) if found else None
+
+    def _count_tokens(self, text):
+        if self.llm is not None and not self._tokenizer_failed:
+            try:
+                return _cached_num_tokens(_TokenizerKey(self.llm), text)
+            except ImportError as e:
+                print(f"Tokenizer unavailable, estimating token counts: {e}")
+                self._tokenizer_failed = True
+
+        return max(1, len(text) // 4) if text else 0
+
+
+class _TokenizerKey():
+    # llms are pydantic models and not hashable. Counters are usually created per
+    # call, so the cache is keyed by the tokenizer the llm uses, not the instance
+    def __init__(self, llm):
+        self.llm = llm
+        self.key = (type(llm), getattr(llm, "model_id", None))
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return self.key == other.key
 
-    def on_llm_start(self, serialized, prompts, **kwargs):
-        for p in prompts:
-            self.input_tokens += self.llm.get_num_tokens(p)
 
-    def on_llm_end(self, response, **kwargs):
-        results = response.flatten()
-        for r in results:
-            self.output_tokens = self.llm.get_num_tokens(r.generations[0][0].text)
\ No newline at end of file
+@functools.lru_cache(maxsize=4096)
+def _cached_num_tokens(tokenizer_key, text):
+    return tokenizer_key.llm.get_num_tokens(text)
@@ -0,0 +1,185 @@
+import asyncio
+
+from aiobotocore.config import AioConfig
+from aiobotocore.credentials import AioCredentialResolver, AioRefreshableCredentials
+from aiobotocore.session import AioSession
+from botocore.credentials import CredentialProvider
+
+from clients.bedrock_client_factory import get_client_factory
+from clients.rate_limiter import RATE_LIMITED_SERVICES, install_rate_limiter
+
+
+class _AssumedRoleProvider(CredentialProvider):
+    # Hands the refreshable credentials to an AioSession through its
+    # credential_provider component
+    METHOD = "sts-assume-role"
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    async def load(self):
+        return self.credentials
+
+
+class AsyncBedrockClientFactory():
+    """
+    asyncio counterpart of BedrockClientFactory. The clients are aiobotocore clients,
+    so the http transport is aiohttp and a single event loop can keep as many requests
+    in flight as the connection pool allows.
+
+    aiohttp connection pools belong to one event loop, so clients are cached per
+    (event loop, assume_role, profile_name, region_name, service_name). The clients of
+    a loop are closed when asyncio.run shuts the loop down, or by close(). Those of a
+    loop that was closed otherwise are dropped the next time a client is created. Assumed role
+    credentials are taken from the process wide BedrockClientFactory, which already
+    keeps them fresh in the background, so the event loop never waits on STS.
+    """
+
+    def __init__(self, max_pool_connections=100, credential_factory=None, rate_limited=True):
+        """
+        Initializes the factory
+        :param max_pool_connections: The size of the connection pool of every client.
+        This is the upper bound of in flight requests per client
+        :param credential_factory: The BedrockClientFactory that owns the assumed role
+        credentials, the process wide factory by default
+        :param rate_limited: Route model and agent calls through the shared per model
+        rate limiters, see clients.rate_limiter. Clients with a limiter leave
+        throttling to it and botocore only retries a few times. A model without a
+        quota set by configure_rate_limiter is not budgeted until the service
+        throttles it.
+        """
+        self.module = "AsyncBedrockClientFactory"
+        self.rate_limited = rate_limited
+        self.config = AioConfig(
+            retries={
+                "max_attempts": 10,
+                "mode": "standard",
+            },
+            max_pool_connections=max_pool_connections,
+        )
+        self.rate_limited_config = self.config.merge(AioConfig(retries={"max_attempts": 3, "mode": "standard"}))
+        self.credential_factory = credential_factory or get_client_factory()
+        self._clients = {}
+        self._contexts = {}
+        self._shutdown_guards = {}
+
+    async def get_client(self,
+                         service_name="bedrock-runtime",
+                         assume_role=None,
+                         profile_name=None,
+                         region_name=None):
+        """
+        Returns the shared client of the running event loop, creating it on first use
+        :param service_name: The boto3 service name, bedrock-runtime by default
+        :param assume_role: The role which has access to bedrock service. When None,
+        the default credential chain of the profile is used
+        :param profile_name: The aws profile to start from
+        :param region_name: The region of the service
+        :return: aiobotocore client
+        """
+        key = (asyncio.get_running_loop(), assume_role, profile_name, region_name, service_name)
+        client = self._clients.get(key)
+        if client is None:
+            self._drop_closed_loops()
+            if key[0] not in self._shutdown_guards:
+                guard = self._close_at_shutdown()
+                # The first step registers it with the loop
+                await guard.__anext__()
+                self._shutdown_guards[key[0]] = guard
+            # Caching the future, not the client, makes concurrent callers share one creation
+            client = asyncio.ensure_future(self._create_client(key))
+            client.add_done_callback(lambda task: self._evict_failed(key, task))
+            self._clients[key] = client
+        # A cancelled caller must not cancel the creation the other callers wait on
+        return await asyncio.shield(client)
+
+    async def close(self):
+        """
+        Closes the clients and connection pools that belong to the running event loop
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        for key in [key for key in self._clients if key[0] is loop]:
+            self._clients.pop(key)
+            context = self._contexts.pop(key, None)
+            if context is not None:
+                await context.__aexit__(None, None, None)
+
+    async def _close_at_shutdown(self):
+        # The loop closes its unfinished async generators before it is closed, in
+        # shutdown_asyncgens of asyncio.run, this one then closes the clients of the loop
+        try:
+            yield
+        finally:
+            self._shutdown_guards.pop(asyncio.get_running_loop(), None)
+            await self.close()
+
+    def _drop_closed_loops(self):
+        # A client can only be closed on its loop, the connections of a closed loop
+        # are released when the client is collected
+        for key in [key for key in self._clients if key[0].is_closed()]:
+            self._clients.pop(key)
+            self._contexts.pop(key, None)
+        for loop in [loop for loop in self._shutdown_guards if loop.is_closed()]:
+            del self._shutdown_guards[loop]
+
+    def _evict_failed(self, key, task):
+        # A failed or cancelled creation is not cached, the next caller tries again
+        if (task.cancelled() or task.exception() is not None) and self._clients.get(key) is task:
+            self._clients.pop(key)
+
+    async def _create_client(self, key):
+        _, assume_role, profile_name, region_name, service_name = key
+        session = AioSession(profile=profile_name)
+
+        if assume_role:
+            def metadata():
+                return asyncio.to_thread(self.credential_factory.get_credential_metadata,
+                                         assume_role, profile_name, region_name)
+
+            credentials = AioRefreshableCredentials.create_from_metadata(
+                metadata=await metadata(),
+                refresh_using=metadata,
+                method="sts-assume-role",
+            )
+            session.register_component("credential_provider",
+                                       AioCredentialResolver([_AssumedRoleProvider(credentials)]))
+
+        rate_limited = self.rate_limited and service_name in RATE_LIMITED_SERVICES
+        context = session.create_client(service_name, region_name=region_name,
+                                        config=self.rate_limited_config if rate_limited else self.config)
+        client = await context.__aenter__()
+        self._contexts[key] = context
+        if rate_limited:
+            install_rate_limiter(client, asynchronous=True)
+
+        return client
+
+
+_default_factory = AsyncBedrockClientFactory()
+
+
+async def get_async_bedrock_client(assume_role=None,
+                                   profile_name=None,
+                                   region_name=None,
+                                   service_name="bedrock-runtime"):
+    """
+    Returns the process wide shared async client of the running event loop
+    :param assume_role: The role which has access to bedrock service
+    :param profile_name: The aws profile to start from
+    :param region_name: The region of the service
+    :param service_name: The boto3 service name, bedrock-runtime by default
+    :return: aiobotocore client
+    """
+    return await _default_factory.get_client(service_name=service_name,
+                                             assume_role=assume_role,
+                                             profile_name=profile_name,
+                                             region_name=region_name)
+
+
+def get_async_client_factory():
+    """
+    Returns the process wide async client factory
+    :return: AsyncBedrockClientFactory
+    """
+    return _default_factory
@@ -0,0 +1,262 @@
+import threading
+from datetime import datetime, timezone
+
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, CredentialResolver, RefreshableCredentials
+
+from clients.rate_limiter import RATE_LIMITED_SERVICES, install_rate_limiter
+
+
+class _AssumedRoleProvider(CredentialProvider):
+    # Hands the shared refreshable credentials to a botocore session through its
+    # credential_provider component
+    METHOD = "sts-assume-role"
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def load(self):
+        return self.credentials
+
+
+class BedrockClientFactory():
+    """
+    Process wide factory for bedrock clients. Clients are created once per
+    (assume_role, profile_name, region_name, service_name) and shared between
+    threads. boto3 clients are thread safe, boto3 sessions are not, so only the
+    factory touches the sessions and it does that under a lock.
+
+    When a role is given, the role is assumed once and the temporary credentials
+    are cached in a botocore RefreshableCredentials object. A daemon thread
+    refreshes them before they expire, so the request path never waits on STS.
+    The first AssumeRole of a role runs under a lock of that role only, so it does
+    not hold up the clients of other roles.
+    """
+
+    def __init__(self,
+                 duration_seconds=3600,
+                 refresh_margin=15 * 60,
+                 max_pool_connections=50,
+                 role_session_name="bedrock-session",
+                 rate_limited=True):
+        """
+        Initializes the factory
+        :param duration_seconds: The lifetime requested for the assumed role credentials
+        :param refresh_margin: Seconds before expiry at which the credentials are refreshed
+        :param max_pool_connections: The size of the connection pool of every client
+        :param role_session_name: The session name used when assuming the role
+        :param rate_limited: Route model and agent calls through the shared per model
+        rate limiters, see clients.rate_limiter. Throttling is then handled by the
+        limiters, so botocore only retries a few times on the clients that have one.
+        A model without a quota set by configure_rate_limiter is not budgeted until
+        the service throttles it.
+        The other clients keep the full retries
+        """
+        self.module = "BedrockClientFactory"
+        self.rate_limited = rate_limited
+        self.duration_seconds = duration_seconds
+        self.refresh_margin = refresh_margin
+        self.role_session_name = role_session_name
+        self.retry_config = Config(
+            retries={
+                "max_attempts": 10,
+                "mode": "standard",
+            },
+            max_pool_connections=max_pool_connections,
+        )
+        self.rate_limited_config = self.retry_config.merge(Config(retries={"max_attempts": 3, "mode": "standard"}))
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sessions = {}
+        self._session_locks = {}
+        self._credentials = {}
+        self._metadata = {}
+        self._clients = {}
+
+    def get_client(self,
+                   service_name="bedrock-runtime",
+                   assume_role=None,
+                   profile_name=None,
+                   region_name=None):
+        """
+        Returns the shared client for the service, creating it on first use
+        :param service_name: The boto3 service name, bedrock-runtime by default
+        :param assume_role: The role which has access to bedrock service. When None,
+        the default credential chain of the profile is used
+        :param profile_name: The aws profile to start from
+        :param region_name: The region of the service
+        :return: Bedrock client
+        """
+        key = (assume_role, profile_name, region_name, service_name)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        session = self._get_session(assume_role, profile_name, region_name)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self.rate_limited and service_name in RATE_LIMITED_SERVICES:
+                    client = session.client(service_name=service_name, config=self.rate_limited_config)
+                    install_rate_limiter(client)
+                else:
+                    client = session.client(service_name=service_name, config=self.retry_config)
+                self._clients[key] = client
+
+        return client
+
+    def get_credential_metadata(self, assume_role, profile_name=None, region_name=None):
+        """
+        Returns the cached assumed role credentials in the metadata format of
+        botocore RefreshableCredentials, so other sessions can share them
+        :param assume_role: The role which has access to bedrock service
+        :param profile_name: The aws profile to start from
+        :param region_name: The region of the service
+        :return: dict with access_key, secret_key, token and expiry_time
+        """
+        if not assume_role:
+            raise ValueError("Credential metadata is only kept for an assume_role, without one "
+                             "the default credential chain of the profile is used")
+
+        key = (assume_role, profile_name, region_name)
+        self._get_session(assume_role, profile_name, region_name)
+        credentials = self._credentials.get(key)
+        if credentials is not None:
+            # Refreshes them if they are about to expire, the metadata of the latest
+            # AssumeRole then holds the keys in use and their expiry together
+            credentials.get_frozen_credentials()
+        metadata = self._metadata.get(key)
+        if credentials is None or metadata is None:
+            raise ValueError(f"The credentials of {assume_role} were dropped by close() while they were read")
+        return dict(metadata)
+
+    def close(self):
+        """
+        Stops the background refresh threads and forgets every cached client. The
+        factory can be used again afterwards, it then assumes the roles anew
+        :return: None
+        """
+        with self._lock:
+            # Only the refresh threads started so far see this event set
+            self._stopped.set()
+            self._stopped = threading.Event()
+            self._clients.clear()
+            self._credentials.clear()
+            self._metadata.clear()
+            self._sessions.clear()
+
+    def _get_session(self, assume_role, profile_name, region_name):
+        key = (assume_role, profile_name, region_name)
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session_lock = self._session_locks.setdefault(key, threading.Lock())
+        # Only callers of the same role and profile wait for its AssumeRole
+        with session_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._create_session(key)
+        return session
+
+    def _create_session(self, key):
+        assume_role, profile_name, region_name = key
+        base_session = boto3.Session(profile_name=profile_name, region_name=region_name)
+        if not assume_role:
+            with self._lock:
+                self._sessions[key] = base_session
+            return base_session
+
+        sts = base_session.client("sts")
+
+        def refresh():
+            response = sts.assume_role(
+                RoleArn=str(assume_role),
+                RoleSessionName=self.role_session_name,
+                DurationSeconds=self.duration_seconds
+            )
+            credentials = response["Credentials"]
+            metadata = {
+                "access_key": credentials["AccessKeyId"],
+                "secret_key": credentials["SecretAccessKey"],
+                "token": credentials["SessionToken"],
+                "expiry_time": credentials["Expiration"].isoformat(),
+            }
+            self._metadata[key] = metadata
+            return metadata
+
+        credentials = RefreshableCredentials.create_from_metadata(
+            metadata=refresh(),
+            refresh_using=refresh,
+            method="sts-assume-role",
+            advisory_timeout=self.refresh_margin,
+        )
+
+        core_session = botocore.session.Session(profile=profile_name)
+        core_session.register_component("credential_provider",
+                                        CredentialResolver([_AssumedRoleProvider(credentials)]))
+        session = boto3.Session(botocore_session=core_session, region_name=region_name)
+
+        with self._lock:
+            self._credentials[key] = session.get_credentials()
+            self._sessions[key] = session
+            stopped = self._stopped
+        refresher = threading.Thread(
+            target=self._refresh_loop,
+            args=(key, stopped),
+            name=f"bedrock-credentials-{assume_role}",
+            daemon=True
+        )
+        refresher.start()
+
+        return session
+
+    def _refresh_loop(self, key, stopped):
+        # Wake up just inside the advisory window. Reading the credentials there makes
+        # botocore refresh them on this thread while request threads keep using the
+        # current ones.
+        credentials = self._credentials.get(key)
+        while credentials is not None and not stopped.is_set():
+            metadata = self._metadata.get(key)
+            if metadata is None:
+                return
+            expiry_time = datetime.fromisoformat(metadata["expiry_time"])
+            wake_up = (expiry_time - datetime.now(timezone.utc)).total_seconds() - self.refresh_margin + 5
+            if stopped.wait(timeout=max(wake_up, 30)):
+                return
+            try:
+                credentials.get_frozen_credentials()
+            except Exception as e:
+                print(f"Failed to refresh bedrock credentials: {e}")
+
+
+_default_factory = BedrockClientFactory()
+
+
+def get_bedrock_client(assume_role=None,
+                       profile_name=None,
+                       region_name=None,
+                       service_name="bedrock-runtime"):
+    """
+    Returns the process wide shared client for the service
+    :param assume_role: The role which has access to bedrock service
+    :param profile_name: The aws profile to start from
+    :param region_name: The region of the service
+    :param service_name: The boto3 service name, bedrock-runtime by default
+    :return: Bedrock client
+    """
+    return _default_factory.get_client(service_name=service_name,
+                                       assume_role=assume_role,
+                                       profile_name=profile_name,
+                                       region_name=region_name)
+
+
+def get_client_factory():
+    """
+    Returns the process wide client factory
+    :return: BedrockClientFactory
+    """
+    return _default_factory
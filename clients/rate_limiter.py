@@ -0,0 +1,364 @@
+import asyncio
+import threading
+import time
+
+THROTTLING_ERRORS = ("ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException")
+
+# The operations that are budgeted, with the function that names the budget they draw from
+RATE_LIMITED_OPERATIONS = {
+    "bedrock-runtime.InvokeModel": lambda params: params.get("modelId"),
+    "bedrock-runtime.InvokeModelWithResponseStream": lambda params: params.get("modelId"),
+    "bedrock-agent-runtime.InvokeAgent":
+        lambda params: f"agent/{params.get('agentId')}/{params.get('agentAliasId')}",
+}
+# The services with budgeted operations, only their clients get a limiter
+RATE_LIMITED_SERVICES = frozenset(operation.split(".")[0] for operation in RATE_LIMITED_OPERATIONS)
+
+
+class AdaptiveRateLimiter():
+    """
+    Client side token bucket for one model. It budgets requests per second and,
+    optionally, tokens per minute. Callers reserve capacity up front and sleep until
+    the reservation is covered, so a burst is spread out instead of hitting the
+    service at once.
+
+    The request rate adapts the way TCP congestion control does: a throttle halves it
+    and every success raises it by a small step, up to the configured quota. Requests
+    that were in flight together tend to be throttled together, so the rate is cut at
+    most once per decrease_interval.
+
+    Without a request quota, the default, requests are not budgeted until the service
+    throttles one. The rate then starts at half of the rate the requests arrived at
+    and has no ceiling.
+    """
+
+    def __init__(self,
+                 requests_per_second=None,
+                 tokens_per_minute=None,
+                 min_requests_per_second=0.2,
+                 decrease_factor=0.5,
+                 increase_step=0.05,
+                 decrease_interval=1.0):
+        """
+        Initializes the limiter
+        :param requests_per_second: The request quota, the rate never goes above it.
+        None for no request budget until the first throttle
+        :param tokens_per_minute: The token quota, None for no token budget
+        :param min_requests_per_second: The floor of the adaptive request rate
+        :param decrease_factor: The rate is multiplied by it on every throttle
+        :param increase_step: Requests per second added back on every success
+        :param decrease_interval: Seconds after a cut during which throttles do not cut again
+        """
+        self.module = "AdaptiveRateLimiter"
+        self.max_requests_per_second = requests_per_second
+        self.min_requests_per_second = min_requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.decrease_interval = decrease_interval
+        self.requests_per_second = requests_per_second
+        self.throttles = 0
+        self._lock = threading.Lock()
+        self._request_tokens = max(requests_per_second or 0.0, 1.0)
+        self._model_tokens = tokens_per_minute or 0.0
+        self._waiting = 0
+        self._last_refill = time.monotonic()
+        self._window_start = self._last_refill
+        self._window_requests = 0
+        self._arrival_rate = 0.0
+        self._last_decrease = float("-inf")
+        self._generation = 0
+
+    @property
+    def queue_depth(self):
+        """
+        The number of callers currently waiting for capacity
+        """
+        return self._waiting
+
+    def acquire(self, tokens=0):
+        """
+        Blocks until the request, and its estimated model tokens, fit in the budget
+        :param tokens: The estimated number of input and output tokens of the request
+        :return: The seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait, generation = self._reserve(tokens)
+            if wait <= 0:
+                return waited
+            try:
+                time.sleep(wait)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            waited += wait
+            if generation == self._generation:
+                return waited
+
+    async def aacquire(self, tokens=0):
+        """
+        asyncio version of acquire
+        :param tokens: The estimated number of input and output tokens of the request
+        :return: The seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            wait, generation = self._reserve(tokens)
+            if wait <= 0:
+                return waited
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            waited += wait
+            if generation == self._generation:
+                return waited
+
+    def on_success(self, estimated_tokens=0, actual_tokens=None):
+        """
+        Raises the request rate a step and settles the token estimate of the request
+        :param estimated_tokens: The tokens that were reserved for the request
+        :param actual_tokens: The tokens the service counted, None when unknown
+        :return: None
+        """
+        with self._lock:
+            if self.requests_per_second is not None:
+                self.requests_per_second = min(self.max_requests_per_second or float("inf"),
+                                               self.requests_per_second + self.increase_step)
+            if self.tokens_per_minute and actual_tokens is not None:
+                self._model_tokens += estimated_tokens - actual_tokens
+
+    def on_throttle(self):
+        """
+        Backs off after the service throttled a request
+        :return: None
+        """
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self._last_decrease < self.decrease_interval:
+                return
+            self._last_decrease = now
+            self._refill()
+            if self.requests_per_second is None:
+                # The first throttle, the requests that got through so far are the
+                # first estimate of the quota
+                rate = max(self._arrival_rate, self._window_requests)
+            else:
+                rate = self.requests_per_second
+            self.requests_per_second = max(self.min_requests_per_second, rate * self.decrease_factor)
+            # Whatever burst was saved up is what got us throttled. Callers that are
+            # waiting reserved at the old rate, they see the new generation when they
+            # wake up and reserve again, so their debt is dropped here
+            self._request_tokens = 0.0
+            self._model_tokens = max(self._model_tokens, 0.0)
+            self._generation += 1
+
+    def stats(self):
+        """
+        Returns the current state of the limiter
+        :return: dict with the current rate, queue depth and throttle count
+        """
+        return {
+            "requests_per_second": self.requests_per_second,
+            "max_requests_per_second": self.max_requests_per_second,
+            "tokens_per_minute": self.tokens_per_minute,
+            "queue_depth": self._waiting,
+            "throttles": self.throttles,
+        }
+
+    def _reserve(self, tokens):
+        with self._lock:
+            self._refill()
+            # Buckets may go negative, the debt is the wait of this caller. That keeps
+            # callers in arrival order without polling
+            if self.requests_per_second is None:
+                self._count_arrival()
+                wait = 0.0
+            else:
+                self._request_tokens -= 1
+                wait = max(0.0, -self._request_tokens / self.requests_per_second)
+            if self.tokens_per_minute:
+                self._model_tokens -= tokens
+                wait = max(wait, -self._model_tokens / (self.tokens_per_minute / 60.0))
+            if wait > 0:
+                self._waiting += 1
+
+        return wait, self._generation
+
+    def _count_arrival(self):
+        # The request rate of the last full second, measured until the first throttle
+        elapsed = self._last_refill - self._window_start
+        if elapsed >= 1.0:
+            self._arrival_rate = self._window_requests / elapsed
+            self._window_start = self._last_refill
+            self._window_requests = 0
+        self._window_requests += 1
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_second is not None:
+            self._request_tokens = min(max(self.requests_per_second, 1.0),
+                                       self._request_tokens + elapsed * self.requests_per_second)
+        if self.tokens_per_minute:
+            self._model_tokens = min(self.tokens_per_minute,
+                                     self._model_tokens + elapsed * self.tokens_per_minute / 60.0)
+
+
+_limiters = {}
+_limits = {}
+_registry_lock = threading.Lock()
+
+
+def configure_rate_limiter(key, requests_per_second=None, tokens_per_minute=None, **kwargs):
+    """
+    Sets the quota of a model id, or of an agent as agent/<agent id>/<alias id>.
+    Must be called before the first request of that model. Models that are not
+    configured get a limiter with no quota, it only budgets requests once the
+    service throttled one
+    :param key: The model id or agent key
+    :param requests_per_second: The request quota, None for no request budget until the first throttle
+    :param tokens_per_minute: The token quota, None for no token budget
+    :return: None
+    """
+    with _registry_lock:
+        _limits[key] = dict(requests_per_second=requests_per_second,
+                            tokens_per_minute=tokens_per_minute,
+                            **kwargs)
+        _limiters.pop(key, None)
+
+
+def get_rate_limiter(key):
+    """
+    Returns the process wide limiter of a model id or agent key
+    :param key: The model id or agent key
+    :return: AdaptiveRateLimiter
+    """
+    limiter = _limiters.get(key)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.get(key)
+            if limiter is None:
+                limiter = AdaptiveRateLimiter(**_limits.get(key, {}))
+                _limiters[key] = limiter
+
+    return limiter
+
+
+def reset_rate_limiters():
+    """
+    Drops every limiter, so the next request of a model starts again at its configured
+    quota with no throttles counted. The configured quotas are kept
+    :return: None
+    """
+    with _registry_lock:
+        _limiters.clear()
+
+
+def get_rate_limiter_stats():
+    """
+    Returns the state of every limiter created so far
+    :return: dict of key to AdaptiveRateLimiter.stats()
+    """
+    return {key: limiter.stats() for key, limiter in list(_limiters.items())}
+
+
+def _estimate_tokens(params):
+    # About four characters per token, the response is settled from the usage headers
+    body = params.get("body") or params.get("inputText") or ""
+    return len(body) // 4
+
+
+def is_throttled(http_response, parsed):
+    """
+    Tells whether a botocore response is a throttle
+    :param http_response: The HTTP response, None when the request failed before it
+    :param parsed: The parsed response body
+    :return: True for the throttling error codes and HTTP 429
+    """
+    error_code = parsed.get("Error", {}).get("Code") if parsed else None
+    return error_code in THROTTLING_ERRORS or (http_response is not None and http_response.status_code == 429)
+
+
+def _used_tokens(parsed):
+    headers = parsed.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    if "x-amzn-bedrock-input-token-count" not in headers:
+        return None
+
+    return (int(headers["x-amzn-bedrock-input-token-count"]) +
+            int(headers.get("x-amzn-bedrock-output-token-count", 0)))
+
+
+def _acquire_handler(limiter_key, asynchronous):
+    def reserve(params, context):
+        limiter = get_rate_limiter(limiter_key(params))
+        tokens = _estimate_tokens(params)
+        context["rate_limiter"] = (limiter, tokens)
+        return limiter, tokens
+
+    if asynchronous:
+        async def before_parameter_build(params, context, **kwargs):
+            limiter, tokens = reserve(params, context)
+            await limiter.aacquire(tokens)
+    else:
+        def before_parameter_build(params, context, **kwargs):
+            limiter, tokens = reserve(params, context)
+            limiter.acquire(tokens)
+
+    return before_parameter_build
+
+
+def install_rate_limiter(client, asynchronous=False):
+    """
+    Registers botocore event handlers on the client, so every rate limited operation
+    first acquires from the limiter of its model and reports throttles and successes
+    back to it. Retries of throttled attempts go through the limiter as well.
+    :param client: A boto3 or aiobotocore client
+    :param asynchronous: True for aiobotocore clients, their handlers must not block
+    :return: The client
+    """
+    service_id = client.meta.service_model.service_id.hyphenize()
+    retries = client.meta.config.retries or {}
+    # botocore turns max_attempts, the retries, into total_max_attempts on the client
+    max_attempts = retries.get("total_max_attempts", retries.get("max_attempts", 0) + 1)
+
+    def throttled_retry(response, attempts, request_dict):
+        # Returns the reservation to repeat when a throttled attempt is going to be retried
+        limiter, tokens = request_dict.get("context", {}).get("rate_limiter", (None, 0))
+        if limiter is None or response is None or not is_throttled(*response):
+            return None
+        limiter.on_throttle()
+        return (limiter, tokens) if attempts < max_attempts else None
+
+    if asynchronous:
+        async def needs_retry(response=None, attempts=0, request_dict=None, **kwargs):
+            retry = throttled_retry(response, attempts, request_dict or {})
+            if retry is not None:
+                await retry[0].aacquire(retry[1])
+    else:
+        def needs_retry(response=None, attempts=0, request_dict=None, **kwargs):
+            retry = throttled_retry(response, attempts, request_dict or {})
+            if retry is not None:
+                retry[0].acquire(retry[1])
+
+    def after_call(http_response, parsed, context, **kwargs):
+        limiter, tokens = context.get("rate_limiter", (None, 0))
+        if limiter is None or is_throttled(http_response, parsed):
+            # Throttled attempts were already reported by needs_retry
+            return
+        if http_response.status_code < 300:
+            limiter.on_success(tokens, _used_tokens(parsed))
+
+    for operation, limiter_key in RATE_LIMITED_OPERATIONS.items():
+        if not operation.startswith(f"{service_id}."):
+            continue
+        client.meta.events.register(f"before-parameter-build.{operation}",
+                                    _acquire_handler(limiter_key, asynchronous))
+        client.meta.events.register(f"needs-retry.{operation}", needs_retry)
+        client.meta.events.register(f"after-call.{operation}", after_call)
+
+    return client
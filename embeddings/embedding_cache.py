@@ -0,0 +1,169 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+
+def normalize_text(text):
+    """
+    Normalizes the text the way it is keyed in the cache, so texts that only
+    differ in unicode form or whitespace share one entry
+    :param text: The text to normalize
+    :return: The normalized text
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache():
+    """
+    Persistent, content addressed embedding cache on top of SQLite. Entries are keyed
+    by sha256(model id, dimensions, normalized text) and the vectors are stored as raw
+    float32 bytes. When there are more than max_entries vectors, the least recently
+    used ones are evicted. SQLite runs in WAL mode, so several processes can share
+    one cache file.
+    """
+
+    def __init__(self, path="./index/embedding_cache.db", max_entries=1_000_000):
+        """
+        Opens or creates the cache
+        :param path: The SQLite file of the cache
+        :param max_entries: The number of vectors kept before evicting
+        """
+        self.module = "EmbeddingCache"
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+        )
+        self._entries = self._count()
+
+    @staticmethod
+    def make_key(model_id, dimensions, text):
+        """
+        Returns the cache key of the text
+        :param model_id: The model id of the embedding
+        :param dimensions: The requested embedding size, None for the model default
+        :param text: The text
+        :return: The 32 byte key
+        """
+        content = f"{model_id}\0{dimensions or 0}\0{normalize_text(text)}"
+        return hashlib.sha256(content.encode()).digest()
+
+    def get_many(self, model_id, dimensions, texts):
+        """
+        Looks up the embeddings of many texts in one query
+        :param model_id: The model id of the embedding
+        :param dimensions: The requested embedding size, None for the model default
+        :param texts: The texts to look up
+        :return: A list with a float32 vector, or None on a miss, per text
+        """
+        keys = [self.make_key(model_id, dimensions, text) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite limits the number of host parameters of one statement
+            for start in range(0, len(keys), 500):
+                chunk = list(set(keys[start:start + 500]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    self._connection.execute(
+                        f"UPDATE embeddings SET last_access = ? WHERE key IN ({placeholders})",
+                        [time.time(), *chunk]
+                    )
+            self.hits += sum(key in found for key in keys)
+            self.misses += sum(key not in found for key in keys)
+
+        return [np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys]
+
+    def get(self, model_id, dimensions, text):
+        """
+        Looks up the embedding of one text
+        :param model_id: The model id of the embedding
+        :param dimensions: The requested embedding size, None for the model default
+        :param text: The text to look up
+        :return: The float32 vector or None
+        """
+        return self.get_many(model_id, dimensions, [text])[0]
+
+    def put_many(self, model_id, dimensions, texts, vectors):
+        """
+        Stores the embeddings of many texts in one transaction
+        :param model_id: The model id of the embedding
+        :param dimensions: The requested embedding size, None for the model default
+        :param texts: The texts
+        :param vectors: One vector per text
+        :return: None
+        """
+        now = time.time()
+        rows = [(self.make_key(model_id, dimensions, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for text, vector in zip(texts, vectors)]
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)", rows
+            )
+            self._connection.execute("COMMIT")
+            self._entries += len(rows)
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def put(self, model_id, dimensions, text, vector):
+        """
+        Stores the embedding of one text
+        :param model_id: The model id of the embedding
+        :param dimensions: The requested embedding size, None for the model default
+        :param text: The text
+        :param vector: The embedding
+        :return: None
+        """
+        self.put_many(model_id, dimensions, [text], [vector])
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of this process
+        :return: dict with hits, misses, hit_rate and entries
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self._entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _count(self):
+        return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _evict(self):
+        # Must be called with self._lock held. The in memory count only grows between
+        # evictions, replaced keys and other processes make it drift, so recount first
+        self._entries = self._count()
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            self._entries -= excess
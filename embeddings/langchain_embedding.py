@@ -0,0 +1,40 @@
+import os
+from typing import Any, List
+
+import numpy as np
+from langchain_community.embeddings import BedrockEmbeddings
+
+from embeddings.titan_embedding import TitanEmbedding
+
+
+class BatchedBedrockEmbeddings(BedrockEmbeddings):
+    """
+    BedrockEmbeddings whose embed_documents fans the texts out over a bounded worker
+    pool instead of embedding them one after another. FAISS.from_documents and
+    add_documents call embed_documents once with every chunk, so ingestion runs
+    max_workers requests at a time.
+    """
+
+    max_workers: int = 8
+    """The number of embedding requests in flight at a time"""
+
+    cache: Any = None
+    """An optional EmbeddingCache, cached chunks are not sent to bedrock again"""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        engine = TitanEmbedding(model_id=self.model_id,
+                                client=self.client,
+                                dimensions=(self.model_kwargs or {}).get("dimensions"),
+                                cache=self.cache)
+        # Same newline handling as BedrockEmbeddings, so both paths give the same vectors
+        embeddings = engine.get_embeddings_batch((text.replace(os.linesep, " ") for text in texts),
+                                                 max_workers=self.max_workers)
+        if embeddings is None:
+            raise ValueError(f"Could not embed the documents with {self.model_id}")
+        if self.normalize and len(embeddings):
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        return embeddings.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,182 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+import numpy as np
+
+from clients.async_bedrock_client_factory import get_async_bedrock_client
+from clients.bedrock_client_factory import get_bedrock_client
+from clients.rate_limiter import THROTTLING_ERRORS
+
+
+class TitanEmbedding():
+    """
+    Embeds text with the Titan embedding model through the shared bedrock clients
+    """
+
+    def __init__(self,
+                 assume_role=None,
+                 model_id="amazon.titan-embed-text-v1",
+                 profile_name='default',
+                 region_name=None,
+                 client=None,
+                 dimensions=None,
+                 cache=None):
+        """
+        Initializes the embedding client
+        :param assume_role: The role which has access to AWS bedrock
+        :param model_id: The model id of the embedding
+        :param profile_name: The aws profile to start from
+        :param region_name: The region of the service
+        :param client: A bedrock-runtime client to use instead of the shared one
+        :param dimensions: The embedding size for models that accept one, such as
+        amazon.titan-embed-text-v2:0. None keeps the model default
+        :param cache: An EmbeddingCache, identical texts are then embedded only once
+        """
+        self.module = "TitanEmbedding"
+        self.assume_role = assume_role
+        self.model_id = model_id
+        self.profile_name = profile_name
+        self.region_name = region_name
+        self.client = client
+        self.dimensions = dimensions
+        self.cache = cache
+
+    def get_embeddings(self, text):
+        """
+        Get the embeddings of a text
+        :param text: the text to embed
+        :return: The embedding vectors
+        """
+        if self.cache is not None:
+            embedding = self.cache.get(self.model_id, self.dimensions, text)
+            if embedding is not None:
+                return embedding.tolist()
+
+        try:
+            embedding = self._invoke(self._get_client(), text)
+
+        except botocore.exceptions.ClientError as error:
+            self._handle_error(error)
+
+        else:
+            if self.cache is not None:
+                self.cache.put(self.model_id, self.dimensions, text, embedding)
+            return embedding
+
+    def get_embeddings_batch(self, texts, max_workers=8, max_retries=6, base_delay=0.2):
+        """
+        Embeds many texts concurrently over one shared client. Every text is its own
+        request, so a throttled text is retried with backoff on its own while the
+        others go on. With a cache only the texts that are not cached are sent.
+        :param texts: An iterable of texts to embed
+        :param max_workers: The number of requests in flight at a time
+        :param max_retries: How many times a throttled text is retried
+        :param base_delay: The first backoff delay in seconds, doubled on every retry
+        :return: A C contiguous float32 matrix with one row per text, in input order.
+        None when the service denied access
+        """
+        texts = list(texts)
+        client = self._get_client()
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        def embed(text):
+            for attempt in range(max_retries + 1):
+                try:
+                    return self._invoke(client, text)
+                except botocore.exceptions.ClientError as error:
+                    if error.response['Error']['Code'] not in THROTTLING_ERRORS or attempt == max_retries:
+                        raise
+                    time.sleep(base_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+        cached = [None] * len(texts)
+        if self.cache is not None:
+            cached = self.cache.get_many(self.model_id, self.dimensions, texts)
+        missing = [row for row, embedding in enumerate(cached) if embedding is None]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                computed = list(executor.map(embed, (texts[row] for row in missing)))
+            except botocore.exceptions.ClientError as error:
+                # The texts that were not sent yet would fail the same way
+                executor.shutdown(cancel_futures=True)
+                self._handle_error(error)
+                return None
+        if any(embedding is None for embedding in computed):
+            raise ValueError(f"{self.model_id} returned a response without an embedding")
+        if self.cache is not None and missing:
+            self.cache.put_many(self.model_id, self.dimensions, [texts[row] for row in missing], computed)
+
+        dimensions = len(computed[0]) if computed else len(cached[0])
+        embeddings = np.empty((len(texts), dimensions), dtype=np.float32)
+        for row, embedding in enumerate(cached):
+            if embedding is not None:
+                embeddings[row] = embedding
+        for row, embedding in zip(missing, computed):
+            embeddings[row] = embedding
+
+        return embeddings
+
+    async def aget_embeddings(self, text):
+        """
+        asyncio version of get_embeddings
+        :param text: the text to embed
+        :return: The embedding vectors
+        """
+        if self.cache is not None:
+            embedding = self.cache.get(self.model_id, self.dimensions, text)
+            if embedding is not None:
+                return embedding.tolist()
+
+        bedrock_runtime_client = await get_async_bedrock_client(assume_role=self.assume_role,
+                                                                profile_name=self.profile_name,
+                                                                region_name=self.region_name)
+        try:
+            response = await bedrock_runtime_client.invoke_model(**self._request(text))
+            response_body = json.loads(await response["body"].read())
+            embedding = response_body.get("embedding")
+
+        except botocore.exceptions.ClientError as error:
+            self._handle_error(error)
+
+        else:
+            if self.cache is not None:
+                self.cache.put(self.model_id, self.dimensions, text, embedding)
+            return embedding
+
+    def _get_client(self):
+        if self.client is not None:
+            return self.client
+
+        return get_bedrock_client(assume_role=self.assume_role,
+                                  profile_name=self.profile_name,
+                                  region_name=self.region_name)
+
+    def _invoke(self, client, text):
+        response = client.invoke_model(**self._request(text))
+        response_body = json.loads(response.get("body").read())
+
+        return response_body.get("embedding")
+
+    def _request(self, text):
+        body = {"inputText": text}
+        if self.dimensions:
+            body["dimensions"] = self.dimensions
+        return {
+            "body": json.dumps(body),
+            "modelId": self.model_id,
+            "accept": "application/json",
+            "contentType": "application/json",
+        }
+
+    def _handle_error(self, error):
+        if error.response['Error']['Code'] == 'AccessDeniedException':
+            print(f"\x1b[41m{error.response['Error']['Message']}\
+                    \nTo troubeshoot this issue please refer to the following resources.\
+                     \nhttps://docs.aws.amazon.com/IAM/latest/UserGuide/troubleshoot_access-denied.html\
+                     \nhttps://docs.aws.amazon.com/bedrock/latest/userguide/security-iam.html\x1b[0m\n")
+        else:
+            raise error
@@ -1,68 +1,46 @@
 # Author: Rajib Deb
 # Date : 18-Oct-2023
-import json
 import os
 
-import boto3
-import botocore
-from botocore.config import Config
 from dotenv import load_dotenv
 
+from clients.bedrock_client_factory import get_bedrock_client
+from embeddings.titan_embedding import TitanEmbedding
+
 load_dotenv()
 assumed_role = os.environ.get('ASSUMED_ROLE')
 
 
 class BedRockClient():
-    def __init__(self):
+    def __init__(self, embedding_cache=None):
+        """
+        Initializes the client
+        :param embedding_cache: An optional EmbeddingCache, identical texts are then embedded once
+        """
         self.module = "AWS Bedrock"
+        self.embedding_cache = embedding_cache
 
     def _get_bedrock_client(self, assume_role, profile_name='default', runtime=True):
         """
-        Get the runtime client
+        Get the runtime client. The client is shared by the whole process and the
+        assumed role credentials are cached and refreshed in the background
         :param assume_role: The role which has access to bedrock service
         :param profile_name: default
         :param runtime: True is default
         :return: Bedrock client
         """
 
-        client_kwargs = {}
-        session_kwargs = {}
-
-        if profile_name:
-            print(f"  Using profile: {profile_name}")
-            session_kwargs["profile_name"] = profile_name
-
-        session = boto3.Session(**session_kwargs)
-        print("profile used is ", profile_name)
-        sts = session.client("sts")
-        response = sts.assume_role(
-            RoleArn=str(assume_role),
-            RoleSessionName="bedrock-session"
-        )
-
-        retry_config = Config(
-            retries={
-                "max_attempts": 10,
-                "mode": "standard",
-            },
-        )
-
-        client_kwargs["aws_access_key_id"] = response["Credentials"]["AccessKeyId"]
-        client_kwargs["aws_secret_access_key"] = response["Credentials"]["SecretAccessKey"]
-        client_kwargs["aws_session_token"] = response["Credentials"]["SessionToken"]
-
         if runtime:
             service_name = 'bedrock-runtime'
         else:
             service_name = 'bedrock'
 
-        bedrock_client = session.client(
-            service_name=service_name,
-            config=retry_config,
-            **client_kwargs
-        )
+        return get_bedrock_client(assume_role=assume_role,
+                                  profile_name=profile_name,
+                                  service_name=service_name)
 
-        return bedrock_client
+    def _embedding_engine(self, assumed_role, modelId):
+        return TitanEmbedding(assume_role=assumed_role, model_id=modelId, cache=self.embedding_cache)
 
     def get_embeddings(self, text, assumed_role, modelId="amazon.titan-embed-text-v1"):
         """
@@ -72,32 +50,29 @@ class BedRockClient():
         :param modelId: the model id of the embedding
         :return: The embedding vectors
         """
-        bedrock_runtime_client = self._get_bedrock_client(assumed_role)
-        body = json.dumps({"inputText": text})
-        accept = "application/json"
-        contentType = "application/json"
-        try:
-
-            response = bedrock_runtime_client.invoke_model(
-                body=body, modelId=modelId, accept=accept, contentType=contentType
-            )
-            response_body = json.loads(response.get("body").read())
-
-            embedding = response_body.get("embedding")
-
-            return embedding
-
+        return self._embedding_engine(assumed_role, modelId).get_embeddings(text)
 
-        except botocore.exceptions.ClientError as error:
-
-            if error.response['Error']['Code'] == 'AccessDeniedException':
-                print(f"\x1b[41m{error.response['Error']['Message']}\
-                        \nTo troubeshoot this issue please refer to the following resources.\
-                         \nhttps://docs.aws.amazon.com/IAM/latest/UserGuide/troubleshoot_access-denied.html\
-                         \nhttps://docs.aws.amazon.com/bedrock/latest/userguide/security-iam.html\x1b[0m\n")
+    async def aget_embeddings(self, text, assumed_role, modelId="amazon.titan-embed-text-v1"):
+        """
+        asyncio version of get_embeddings
+        :param text: the text to embed
+        :param assumed_role: the role which has access to AWS bedrock
+        :param modelId: the model id of the embedding
+        :return: The embedding vectors
+        """
+        return await self._embedding_engine(assumed_role, modelId).aget_embeddings(text)
 
-            else:
-                raise error
+    def get_embeddings_batch(self, texts, assumed_role, modelId="amazon.titan-embed-text-v1", max_workers=8):
+        """
+        Get the embeddings of many texts, max_workers of them at a time
+        :param texts: the texts to embed
+        :param assumed_role: the role which has access to AWS bedrock
+        :param modelId: the model id of the embedding
+        :param max_workers: the number of requests in flight at a time
+        :return: float32 matrix with one embedding per row, in the order of the texts
+        """
+        return self._embedding_engine(assumed_role, modelId).get_embeddings_batch(
+            texts, max_workers=max_workers)
 
 
 if __name__ == "__main__":
@@ -3,9 +3,7 @@
 import json
 import os
 
-import boto3
 import botocore
-from botocore.config import Config
 from dotenv import load_dotenv
 from langchain.chains.question_answering import load_qa_chain
 from langchain.chat_models import ChatOpenAI
@@ -13,6 +11,9 @@ from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 import openai
 
+from clients.bedrock_client_factory import get_bedrock_client
+from generation.streaming import stream_model_response
+
 load_dotenv()
 llama_assumed_role = os.environ.get('LLAMA_ASSUMED_ROLE')
 claude_assumed_role = os.environ.get('CLAUDE_ASSUMED_ROLE')
@@ -25,51 +26,22 @@ class BedRockClient():
 
     def _get_bedrock_client(self, assume_role, profile_name='default', runtime=True):
         """
-        Get the runtime client
+        Get the runtime client. The client is shared by the whole process and the
+        assumed role credentials are cached and refreshed in the background
         :param assume_role: The role which has access to bedrock service
         :param profile_name: default
         :param runtime: True is default
         :return: Bedrock client
         """
 
-        client_kwargs = {}
-        session_kwargs = {}
-
-        if profile_name:
-            print(f"  Using profile: {profile_name}")
-            session_kwargs["profile_name"] = profile_name
-
-        session = boto3.Session(**session_kwargs)
-        print("profile used is ", profile_name)
-        sts = session.client("sts")
-        response = sts.assume_role(
-            RoleArn=str(assume_role),
-            RoleSessionName="bedrock-session"
-        )
-
-        retry_config = Config(
-            retries={
-                "max_attempts": 10,
-                "mode": "standard",
-            },
-        )
-
-        client_kwargs["aws_access_key_id"] = response["Credentials"]["AccessKeyId"]
-        client_kwargs["aws_secret_access_key"] = response["Credentials"]["SecretAccessKey"]
-        client_kwargs["aws_session_token"] = response["Credentials"]["SessionToken"]
-
         if runtime:
             service_name = 'bedrock-runtime'
         else:
             service_name = 'bedrock'
 
-        bedrock_client = session.client(
-            service_name=service_name,
-            config=retry_config,
-            **client_kwargs
-        )
-
-        return bedrock_client
+        return get_bedrock_client(assume_role=assume_role,
+                                  profile_name=profile_name,
+                                  service_name=service_name)
 
     def get_bedrok_model_response(self, prompt, assumed_role, model="llama"):
         """
@@ -79,14 +51,7 @@ class BedRockClient():
         :param modelId: the model id of the embedding
         :return: The embedding vectors
         """
-        modelId = ""
-        body = {}
-        if "llama" in model:
-            modelId = "meta.llama2-13b-chat-v1"
-            body = json.dumps({"prompt": prompt, "max_gen_len": 512, "temperature": 0.2, "top_p": 0.9})
-        elif "anthropic" in model:
-            modelId = "anthropic.claude-v2"
-            body = json.dumps({"prompt": prompt, "max_tokens_to_sample": 512, "temperature": 0.2, "top_p": 0.9})
+        modelId, body = self._get_model_request(prompt, model)
 
         bedrock_runtime_client = self._get_bedrock_client(assumed_role)
 
@@ -113,6 +78,54 @@ class BedRockClient():
             else:
                 raise error
 
+    def stream_bedrok_model_response(self, prompt, assumed_role, model="llama"):
+        """
+        Streams the model response, yielding the text as it is generated. The time to
+        first token and tokens per second of the call are printed at the end
+        :param prompt: the prompt to send
+        :param assumed_role: the role which has access to AWS bedrock
+        :param model: llama, anthropic or mistral
+        :return: generator of text deltas
+        """
+        modelId, body = self._get_model_request(prompt, model)
+
+        bedrock_runtime_client = self._get_bedrock_client(assumed_role)
+
+        try:
+            stream = stream_model_response(bedrock_runtime_client, modelId, body)
+            yield from stream
+            # No text delta, an empty completion, leaves no time to first token
+            time_to_first_token = stream.metrics.time_to_first_token
+            first_token = f"{time_to_first_token:.3f}s" if time_to_first_token is not None else "-"
+            print(f"\ntime to first token: {first_token}, "
+                  f"tokens/sec: {stream.metrics.tokens_per_second or 0:.1f}")
+
+        except botocore.exceptions.ClientError as error:
+
+            if error.response['Error']['Code'] == 'AccessDeniedException':
+                print(f"\x1b[41m{error.response['Error']['Message']}\
+                        \nTo troubeshoot this issue please refer to the following resources.\
+                         \nhttps://docs.aws.amazon.com/IAM/latest/UserGuide/troubleshoot_access-denied.html\
+                         \nhttps://docs.aws.amazon.com/bedrock/latest/userguide/security-iam.html\x1b[0m\n")
+
+            else:
+                raise error
+
+    def _get_model_request(self, prompt, model):
+        modelId = ""
+        body = {}
+        if "llama" in model:
+            modelId = "meta.llama2-13b-chat-v1"
+            body = json.dumps({"prompt": prompt, "max_gen_len": 512, "temperature": 0.2, "top_p": 0.9})
+        elif "anthropic" in model:
+            modelId = "anthropic.claude-v2"
+            body = json.dumps({"prompt": prompt, "max_tokens_to_sample": 512, "temperature": 0.2, "top_p": 0.9})
+        elif "mistral" in model:
+            modelId = "mistral.mixtral-8x7b-instruct-v0:1"
+            body = json.dumps({"prompt": prompt, "max_tokens": 512, "temperature": 0.2, "top_p": 0.9})
+
+        return modelId, body
+
     def return_context(self):
         ## Content taken from https://www.rocketmortgage.com/learn/how-to-calculate-mortgage ##
         context = """
@@ -221,6 +234,11 @@ if __name__ == "__main__":
     print(response["generation"])
     print("------------------------")
 
+    print("Streamed response from llama....")
+    for text in bd_client.stream_bedrok_model_response(PROMPT.text, llama_assumed_role, model="llama"):
+        print(text, end="", flush=True)
+    print("------------------------")
+
     model = "gpt-4"
     CHAT_PROMPT = bd_client.craft_the_prompt(model)
 
@@ -1,7 +1,12 @@
-import boto3
+import threading
+
 from botocore.client import BaseClient
 from botocore.exceptions import ClientError
 
+from agents.agent_registry import AgentRegistry
+from agents.agent_stream import stream_agent
+from clients.bedrock_client_factory import get_bedrock_client
+
 
 # load_dotenv()
 # agent_role = os.environ.get('AGENT_ROLE')
@@ -13,88 +18,144 @@ class BedRockClient():
     """
 
     def __init__(self,
-                 region_name="us-east-1"):
+                 region_name="us-east-1",
+                 client_factory=None,
+                 trace_recorder=None,
+                 agent_registry_ttl=300):
         """
         Initializes the region of the service
         :param region_name: The region name of the service
+        :param client_factory: The BedrockClientFactory the clients come from, the
+        process wide one by default. Give one with a larger max_pool_connections to
+        run many sessions at once
+        :param trace_recorder: An agents.trace_recorder.AgentTraceRecorder the traces
+        of invoke_bedrock_agent are written to, sampled and in the background
+        :param agent_registry_ttl: Seconds between two reloads of the agents list_agents
+        and resolve_agent look up
         """
 
         self.region_name = region_name
+        self.client_factory = client_factory
+        self.trace_recorder = trace_recorder
+        self.agent_registry_ttl = agent_registry_ttl
+        self._agent_registry = None
+        self._agent_registry_lock = threading.Lock()
 
     def return_runtime_client(self, run_time=True) -> BaseClient:
         """
-        This funtion returns the appropriate bedrock client
+        This funtion returns the appropriate bedrock client. The clients are shared by the
+        process, and invoke_agent calls go through the per agent rate limiter
         :param run_time: If true, returns the run time client, else the normal client
         :return: Returns the bedrock client
         """
         if run_time:
-            bedrock_client = boto3.client(
-                service_name="bedrock-agent-runtime",
-                region_name=self.region_name)
+            service_name = "bedrock-agent-runtime"
         else:
-            bedrock_client = boto3.client(
-                service_name="bedrock-agent",
-                region_name=self.region_name)
+            service_name = "bedrock-agent"
+
+        if self.client_factory is not None:
+            return self.client_factory.get_client(service_name=service_name, region_name=self.region_name)
+        return get_bedrock_client(service_name=service_name, region_name=self.region_name)
 
-        return bedrock_client
+    def agent_registry(self) -> AgentRegistry:
+        """
+        Returns the registry of the agents and their aliases, created on the first call.
+        It loads every page of agents once and reloads them in the background
+        :return: AgentRegistry
+        """
+        if self._agent_registry is None:
+            with self._agent_registry_lock:
+                if self._agent_registry is None:
+                    self._agent_registry = AgentRegistry(self.return_runtime_client(run_time=False),
+                                                         ttl_seconds=self.agent_registry_ttl)
+        return self._agent_registry
 
     def list_agents(self):
         """
-        This module calls the list agents and returns all the available agents
+        This module returns all the available agents from the agent registry
         :return: All the currently deployed agents
         """
         try:
-            available_agents = []
-            bedrock_client = self.return_runtime_client(run_time=False)
-            agents = bedrock_client.list_agents()
-            for agent in agents["agentSummaries"]:
-                agent_status = agent["agentStatus"]
-                if agent_status == "PREPARED":
-                    agent_name = agent["agentName"]
-                    available_agents.append(agent_name)
+            available_agents = self.agent_registry().agent_names(statuses=("PREPARED",))
         except ClientError as e:
             print(e)
             raise
         else:
             return available_agents
 
+    def resolve_agent(self, agent_name, alias_name=None):
+        """
+        Looks up the ids of an agent by its name, from memory
+        :param agent_name: The name (or id) of the agent
+        :param alias_name: The alias name, the newest alias on the highest version if None
+        :return: (agent id, agent alias id), None if the agent or alias is not known
+        """
+        return self.agent_registry().resolve(agent_name, alias_name)
+
+    def stream_bedrock_agent(self,
+                             agent_id,
+                             agent_alias_id,
+                             session_id,
+                             prompt=None,
+                             enable_trace=False):
+        """
+        Streams the answer of the agent. Iterate the returned stream for ("chunk", text)
+        and ("trace", trace) events as they arrive. Its completion holds the answer and
+        its metrics the time to first chunk and the total stream time once the stream
+        is exhausted
+        :param agent_id: The agent id of the agent
+        :param agent_alias_id: The agent alias id of the agent
+        :param session_id: A unique id that identifies the chat session
+        :param prompt: The prompt or the question that needs to be answered
+        :param enable_trace: If true the agent sends the trace of every step
+        :return: AgentStream
+        """
+        bedrock_client = self.return_runtime_client(run_time=True)
+        return stream_agent(bedrock_client, agent_id, agent_alias_id, session_id, prompt,
+                            enable_trace=enable_trace)
+
     def invoke_bedrock_agent(self,
                              agent_id,
                              agent_alias_id,
                              session_id,
-                             prompt=None):
+                             prompt=None,
+                             enable_trace=False,
+                             keep_traces=None):
         """
         This function will be interacting with the agent
         :param agent_id: The agent id of the agent
         :param agent_alias_id: The agent alias id of the agent
         :param session_id: A unique id that identifies the chat session
         :param prompt: The prompt or the question that needs to be answered
-        :return: Returns the response
+        :param enable_trace: If true the agent sends the trace of every step
+        :param keep_traces: If true the traces are returned. By default they are only
+        returned when there is no trace recorder, which writes them instead
+        :return: Returns the response and the traces
         """
+        if keep_traces is None:
+            keep_traces = self.trace_recorder is None
 
         completion = ""
-        traces =[]
+        traces = []
+        recording = None
+        if enable_trace and self.trace_recorder is not None:
+            recording = self.trace_recorder.start_invocation(agent_id, agent_alias_id, session_id)
         try:
-            bedrock_client = self.return_runtime_client(run_time=True)
-            response = bedrock_client.invoke_agent(
-                agentId=agent_id,
-                agentAliasId=agent_alias_id,
-                sessionId=session_id,
-                inputText=prompt,
-            )
-            for event in response.get("completion"):
-                print(event)
-                try:
-                    trace = event["trace"]
-                    traces.append(trace['trace'])
-                except KeyError:
-                    chunk = event["chunk"]
-                    completion = completion + chunk["bytes"].decode()
-                except Exception as e:
-                    print(e)
+            stream = self.stream_bedrock_agent(agent_id, agent_alias_id, session_id, prompt,
+                                               enable_trace=enable_trace)
+            for event_type, payload in stream:
+                if event_type == "trace":
+                    if recording is not None:
+                        recording.record(payload)
+                    if keep_traces:
+                        traces.append(payload["trace"])
+            completion = stream.completion
 
         except ClientError as e:
             print(e)
+        finally:
+            if recording is not None:
+                recording.finish()
 
         return completion, traces
 
@@ -105,11 +166,24 @@ if __name__ == "__main__":
 
     # agents = bedrock_client.list_agents()
     # print(agents)
+    # agent_id, agent_alias_id = bedrock_client.resolve_agent("my-agent")
 
     response,traces = bedrock_client.invoke_bedrock_agent(agent_id="QGNVWR64AS",
                                                    agent_alias_id="O1VQBAWZQY",
                                                    session_id="session_01",
-                                                   prompt="What is the interest rate?")
+                                                   prompt="What is the interest rate?",
+                                                   enable_trace=True)
     print(response)
     print("-------")
     print(traces)
+
+    # Or print the answer while it arrives
+    stream = bedrock_client.stream_bedrock_agent(agent_id="QGNVWR64AS",
+                                                 agent_alias_id="O1VQBAWZQY",
+                                                 session_id="session_01",
+                                                 prompt="What is the interest rate?")
+    for event_type, payload in stream:
+        if event_type == "chunk":
+            print(payload, end="", flush=True)
+    print()
+    print(stream.metrics.to_dict())
@@ -2,10 +2,14 @@
 # is provided in the readme
 import logging
 import time
+from itertools import islice
 
 import boto3
 from botocore.client import BaseClient
 
+from clients.bedrock_client_factory import get_bedrock_client
+from retrieval.knowledge_base_retrieval import KnowledgeBaseRetrieval
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,10 +20,12 @@ class BedrockKBAgent():
         :param region_name: The region name of the service. Defaulted to us-east-1
         """
         self.region_name = region_name
+        self.kb_retrievals = {}
 
     def _return_aws_service_client(self, resource_name='bedrock', run_time=True) -> BaseClient:
         """
-        This funtion returns the appropriate aws service client
+        This funtion returns the appropriate aws service client. The bedrock clients
+        are shared by the process
         :param resource_name: the resource name for which the client needs to be created
         :param run_time: If resource is 'bedrock' and the value is true, returns the
         run time client, else the normal client
@@ -27,11 +33,11 @@ class BedrockKBAgent():
         """
         if resource_name == "bedrock":
             if run_time:
-                service_client = boto3.client(
+                service_client = get_bedrock_client(
                     service_name="bedrock-agent-runtime",
                     region_name=self.region_name)
             else:
-                service_client = boto3.client(
+                service_client = get_bedrock_client(
                     service_name="bedrock-agent",
                     region_name=self.region_name)
         elif resource_name == "iam":
@@ -144,20 +150,45 @@ class BedrockKBAgent():
                 break
             else:
                 time.sleep(2)
-    def retrieve_from_kb(self,kb_id,query):
-        client = self._return_aws_service_client(run_time=True)
-        response = client.retrieve(
-            knowledgeBaseId=kb_id,
-            retrievalQuery={
-                'text': query
-            },
-            retrievalConfiguration={
-                'vectorSearchConfiguration': {
-                    'numberOfResults': 2
-                }
-            },
-            nextToken='loan'
-        )
+    def get_kb_retrieval(self, kb_id):
+        """
+        Returns the retrieval of the knowledge base. It is kept per knowledge base, so
+        repeated queries are answered from its cache
+        :param kb_id: The id of the knowledge base
+        :return: KnowledgeBaseRetrieval
+        """
+        if kb_id not in self.kb_retrievals:
+            self.kb_retrievals[kb_id] = KnowledgeBaseRetrieval(
+                kb_id, client=self._return_aws_service_client(run_time=True))
+        return self.kb_retrievals[kb_id]
+
+    def iter_kb_results(self, kb_id, query, page_size=10, filters=None, search_type=None):
+        """
+        Pages through all results of the query. The next page is only requested when
+        the results of the current one have been read
+        :param kb_id: The id of the knowledge base
+        :param query: The query
+        :param page_size: The number of results per request
+        :param filters: A RetrievalFilter, or a dict of metadata key to value
+        :param search_type: HYBRID or SEMANTIC
+        :return: generator of retrieval results
+        """
+        return self.get_kb_retrieval(kb_id).iter_results(query, page_size=page_size, filters=filters,
+                                                         search_type=search_type)
+
+    def retrieve_from_kb(self, kb_id, query, k=5, filters=None, search_type=None):
+        """
+        Retrieves the k best results of the query
+        :param kb_id: The id of the knowledge base
+        :param query: The query
+        :param k: The number of results
+        :param filters: A RetrievalFilter, or a dict of metadata key to value
+        :param search_type: HYBRID or SEMANTIC
+        :return: dict with the retrievalResults
+        """
+        results = islice(self.iter_kb_results(kb_id, query, page_size=k, filters=filters,
+                                              search_type=search_type), k)
+        response = {"retrievalResults": list(results)}
 
         print(response)
 
@@ -3,15 +3,19 @@
 # to embed and query from a pdf
 import os
 
-import boto3
-from botocore.config import Config
 from dotenv import load_dotenv
 from langchain.indexes.vectorstore import VectorStoreIndexWrapper
-from langchain.text_splitter import CharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.embeddings import BedrockEmbeddings
 from langchain_community.llms.bedrock import Bedrock
-from langchain_community.vectorstores.faiss import FAISS
+
+from clients.bedrock_client_factory import get_bedrock_client
+from embeddings.embedding_cache import EmbeddingCache
+from embeddings.langchain_embedding import BatchedBedrockEmbeddings
+from ingestion.parallel_parse import ParallelPdfParser
+from ingestion.pdf_pipeline import PdfIngestionPipeline
+from ingestion.token_chunker import TokenChunker
+from vectorstore.incremental_faiss import IncrementalFaissIndex
+from vectorstore.mmap_faiss import build_vector_store, load_mmap_vector_store
 
 load_dotenv()
 # First ensure that you have created a IAM role with the below permissions
@@ -47,92 +51,135 @@ class VectorSearchWithBedrock():
     """
     This class wraps all the required functions to embed and than later query using Bedrock
     """
-    def __init__(self, index_store="./index/faiss_index"):
+    def __init__(self,
+                 index_store="./index/faiss_index",
+                 max_workers=8,
+                 embedding_cache=None,
+                 index_type="flat",
+                 nprobe=None,
+                 ef_search=None,
+                 quantization=None,
+                 rerank_factor=None):
         """
         In the init method, I am initializing with the index store to localy save the vecrtors.
         In addition, also initialzing the embedding model that will be used to embed the content.
         Note, that I have used the BedrockEmbeddings wrapper of Langchain and passing the client.
         We could have also used credentials_profile_name to pass the aws credentials, but I prefer
-        to do it with client
+        to do it with client. BatchedBedrockEmbeddings embeds max_workers chunks at a time
+        instead of one after another. The embeddings are cached on disk next to the index, so
+        chunks that were embedded by an earlier run are not sent to bedrock again
 
         :param index_store: The default location of the index store
+        :param max_workers: The number of embedding requests in flight while ingesting
+        :param embedding_cache: The EmbeddingCache to use, by default one next to the index store
+        :param index_type: The faiss index built by save_into_vector, flat for exact search,
+        ivf or hnsw for approximate search on large corpora
+        :param nprobe: The number of ivf lists searched per query
+        :param ef_search: The search depth of hnsw
+        :param quantization: How save_into_vector stores the vectors, None for float32,
+        fp16, sq8 or pq for codes that are 2, 4 or about 64 times smaller. The exact
+        vectors are kept on disk to re-rank the best candidates
+        :param rerank_factor: The number of candidates re-ranked against the exact
+        vectors, as a multiple of k, 4 by default
         """
         self.module = "__name__"
         self.bedrock_client = self._get_bedrock_client(assume_role=assumed_role)
 
-        self.embeddings = BedrockEmbeddings(
-            client=self.bedrock_client, region_name="us-east-1")
+        self.index_store = index_store
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(os.path.join(os.path.dirname(index_store), "embedding_cache.db"))
+        self.embedding_cache = embedding_cache
 
-        self.index_store = "./index/faiss_index"
+        self.embeddings = BatchedBedrockEmbeddings(
+            client=self.bedrock_client, region_name="us-east-1", max_workers=max_workers,
+            cache=embedding_cache)
 
     def _get_bedrock_client(self, assume_role, profile_name='default', runtime=True):
         """
-        Get the runtime client
+        Get the runtime client. The client is shared by the whole process and the
+        assumed role credentials are cached and refreshed in the background
         :param assume_role: The role which has access to bedrock service
         :param profile_name: default
         :param runtime: True is default
         :return: Bedrock client
         """
 
-        client_kwargs = {}
-        session_kwargs = {}
-
-        if profile_name:
-            print(f"  Using profile: {profile_name}")
-            session_kwargs["profile_name"] = profile_name
-
-        session = boto3.Session(**session_kwargs)
-        print("profile used is ", profile_name)
-        sts = session.client("sts")
-        response = sts.assume_role(
-            RoleArn=str(assume_role),
-            RoleSessionName="bedrock-session"
-        )
-
-        retry_config = Config(
-            retries={
-                "max_attempts": 10,
-                "mode": "standard",
-            },
-        )
-
-        client_kwargs["aws_access_key_id"] = response["Credentials"]["AccessKeyId"]
-        client_kwargs["aws_secret_access_key"] = response["Credentials"]["SecretAccessKey"]
-        client_kwargs["aws_session_token"] = response["Credentials"]["SessionToken"]
-
         if runtime:
             service_name = 'bedrock-runtime'
         else:
             service_name = 'bedrock'
 
-        bedrock_client = session.client(
-            service_name=service_name,
-            config=retry_config,
-            **client_kwargs
-        )
-
-        return bedrock_client
+        return get_bedrock_client(assume_role=assume_role,
+                                  profile_name=profile_name,
+                                  service_name=service_name)
 
-    def save_into_vector(self, docs):
+    def save_into_vector(self, docs, incremental=False):
         """
         In this function I am saving the vectors locally using FAISS
         :param docs: The documents I need to embed, this is in langchain Document schema
+        :param incremental: If true, only the new and changed chunks of the sources in docs
+        are embedded and added to the existing index, and their removed chunks are deleted.
+        Otherwise the index is rebuilt from docs. Only flat float32 indexes are updated
+        incrementally
         :return: None
         """
-
-        vectorstore_faiss = FAISS.from_documents(
-            docs, self.embeddings, )
+        if incremental:
+            if self.index_type != "flat":
+                raise ValueError(f"Incremental updates need a flat index, not {self.index_type}")
+            if self.quantization is not None:
+                raise ValueError(f"Incremental updates need float32 vectors, not {self.quantization}")
+            changes = IncrementalFaissIndex(self.index_store, self.embeddings).update(docs)
+            print(f"Index updated: {changes}")
+            return
+
+        vectorstore_faiss = build_vector_store(docs, self.embeddings, index_type=self.index_type,
+                                               quantization=self.quantization)
 
         # Here I am storing the embeddings locally
         vectorstore_faiss.save_local(self.index_store)
 
+    def ingest(self, path, chunk_size=500, chunk_overlap=50, parse_workers=None, chunk_tokens=None,
+               overlap_tokens=16):
+        """
+        Streams a pdf or a directory of pdfs into the index. Pages are parsed, chunked,
+        embedded and appended in overlapping stages, so memory stays bounded however
+        large the documents are. Builds a flat index
+        :param path: A pdf file or a directory
+        :param chunk_size: The chunk size of the text splitter
+        :param chunk_overlap: The chunk overlap of the text splitter
+        :param parse_workers: If set, the pdfs are parsed and chunked by that many
+        worker processes, 0 for one per core
+        :param chunk_tokens: If set, chunks of at most that many tokens ending at
+        sentence boundaries are made with TokenChunker instead of chunk_size characters
+        :param overlap_tokens: The token overlap of TokenChunker
+        :return: dict with the pages, chunks, pages per second and peak rss
+        """
+        text_splitter = None
+        if chunk_tokens is not None:
+            text_splitter = TokenChunker(chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+        parser = None
+        if parse_workers is not None:
+            parser = ParallelPdfParser(max_workers=parse_workers or None, chunk_size=chunk_size,
+                                       chunk_overlap=chunk_overlap, text_splitter=text_splitter)
+        pipeline = PdfIngestionPipeline(self.embeddings, self.index_store, chunk_size=chunk_size,
+                                        chunk_overlap=chunk_overlap, parser=parser, text_splitter=text_splitter)
+        return pipeline.run(path)
+
     def load_vector(self):
         """
         This function loads the embedding vectors from the previously stored embedding
-        store
+        store. The index file is memory mapped, so processes searching the same index
+        share its pages instead of each holding a copy
         :return: It returns the previously stored embedding vectors
         """
-        faiss_vectorstore = FAISS.load_local(self.index_store, self.embeddings)
+        faiss_vectorstore = load_mmap_vector_store(self.index_store, self.embeddings,
+                                                   nprobe=self.nprobe, ef_search=self.ef_search,
+                                                   rerank_factor=self.rerank_factor)
 
         return faiss_vectorstore
 
@@ -153,15 +200,17 @@ if __name__ == "__main__":
     # The PDF content that I want to embed
     loader = PyPDFLoader("./data/impact_of_covid.pdf")
     documents = loader.load()
-    # Splitting the document using Langchain text splitte. This is just a training example.
-    # To make a production grade application, we need to experiment with more advanced
-    # chunking and retrieval patterns
-    text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50, separator="\n")
+    # Splitting the document into chunks of at most 128 tokens that end at sentence
+    # boundaries, about the size of the 500 characters of a character splitter but
+    # without cutting sentences in half
+    text_splitter = TokenChunker(chunk_tokens=128, overlap_tokens=16)
     docs = text_splitter.split_documents(documents=documents)
 
     # The next two lines of code are saving the vectors locally
     faiss_chat_bot = VectorSearchWithBedrock()
-    faiss_chat_bot.save_into_vector(docs)
+    faiss_chat_bot.save_into_vector(docs, incremental=True)
+    # For a large collection, stream the whole directory into the index instead
+    # print(faiss_chat_bot.ingest("./data", parse_workers=0))
 
     # Here i am creating the vector store index wrapper by loading the stored vectors from the local file
     wrapper_faiss_chat = VectorStoreIndexWrapper(vectorstore=faiss_chat_bot.load_vector())
@@ -1,8 +1,7 @@
 from abc import abstractmethod
 
-import boto3
-from botocore.config import Config
-
+from clients.async_bedrock_client_factory import get_async_bedrock_client
+from clients.bedrock_client_factory import get_bedrock_client
 from retrieval.base import Retrieval
 
 
@@ -17,50 +16,46 @@ class Generation():
                  retriever:Retrieval):
         pass
 
-    def get_bedrock_client(self,assume_role, profile_name='default', runtime=True):
+    @abstractmethod
+    async def agenerate(self,
+                        model_id,
+                        retriever:Retrieval):
+        pass
+
+    def get_bedrock_client(self, assume_role, profile_name='default', runtime=True):
         """
-        Get the runtime client
+        Get the runtime client. The client is shared by the whole process and the
+        assumed role credentials are cached and refreshed in the background
         :param assume_role: The role which has access to bedrock service
         :param profile_name: default
         :param runtime: True is default
         :return: Bedrock client
         """
 
-        client_kwargs = {}
-        session_kwargs = {}
-
-        if profile_name:
-            print(f"  Using profile: {profile_name}")
-            session_kwargs["profile_name"] = profile_name
-
-        session = boto3.Session(**session_kwargs)
-        print("profile used is ", profile_name)
-        sts = session.client("sts")
-        response = sts.assume_role(
-            RoleArn=str(assume_role),
-            RoleSessionName="bedrock-session"
-        )
+        if runtime:
+            service_name = 'bedrock-runtime'
+        else:
+            service_name = 'bedrock'
 
-        retry_config = Config(
-            retries={
-                "max_attempts": 10,
-                "mode": "standard",
-            },
-        )
+        return get_bedrock_client(assume_role=assume_role,
+                                  profile_name=profile_name,
+                                  service_name=service_name)
 
-        client_kwargs["aws_access_key_id"] = response["Credentials"]["AccessKeyId"]
-        client_kwargs["aws_secret_access_key"] = response["Credentials"]["SecretAccessKey"]
-        client_kwargs["aws_session_token"] = response["Credentials"]["SessionToken"]
+    async def get_async_bedrock_client(self, assume_role, profile_name='default', runtime=True):
+        """
+        Get the asyncio runtime client. Like get_bedrock_client the client is shared,
+        one per event loop, and its connection pool bounds the in flight requests
+        :param assume_role: The role which has access to bedrock service
+        :param profile_name: default
+        :param runtime: True is default
+        :return: aiobotocore Bedrock client
+        """
 
         if runtime:
             service_name = 'bedrock-runtime'
         else:
             service_name = 'bedrock'
 
-        bedrock_client = session.client(
-            service_name=service_name,
-            config=retry_config,
-            **client_kwargs
-        )
-
-        return bedrock_client
\ No newline at end of file
+        return await get_async_bedrock_client(assume_role=assume_role,
+                                              profile_name=profile_name,
+                                              service_name=service_name)
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import os
 
 from dotenv import load_dotenv
@@ -6,6 +8,8 @@ from langchain_core.prompts import PromptTemplate
 
 from callbacks.bedrock_callback import BedRockTokenCounter
 from generation.base import Generation
+from generation.model_formats import build_request_body, parse_response_body
+from generation.streaming import astream_model_response, stream_model_response
 from retrieval.base import Retrieval
 from retrieval.context_retrieval import ContextRetrieval
 
@@ -23,12 +27,29 @@ Answer based on the provided context only.
 answer:
 """
 
+default_question = """ Where is tajmAHAL?
+        """
+
 
 class BedrockGeneration(Generation):
 
-    def __init__(self):
+    def __init__(self, response_cache=None):
+        """
+        Initializes the generation
+        :param response_cache: Optional ResponseCache in front of the model calls of
+        generate and agenerate
+        """
         super().__init__()
         self.module = "BEDROCKGEN"
+        self.response_cache = response_cache
+
+    def format_context(self, hits):
+        """
+        Joins the retrieved chunks into the context of the prompt
+        :param hits: The (Document, score) hits of a retriever
+        :return: The context text
+        """
+        return "\n\n".join(document.page_content for document, _ in hits)
 
     def get_prompt(self, template=prompt_template):
         prompt = PromptTemplate(
@@ -40,12 +61,18 @@ class BedrockGeneration(Generation):
 
     def generate(self,
                  model_id,
-                 retriever:Retrieval):
+                 retriever:Retrieval,
+                 question=default_question,
+                 k=4,
+                 filters=None):
 
-        context = retriever.get_relevant_contex()
+        context = self.format_context(retriever.retrieve(question, k=k, filters=filters))
+
+        if self.response_cache is not None:
+            answer = self.response_cache.get(model_id, prompt_template, context, question)
+            if answer is not None:
+                return answer
 
-        question = """ Where is tajmAHAL?
-        """
         bedrock_client = self.get_bedrock_client(assume_role=assumed_role)
         llm = BedrockLLM(
             client=bedrock_client, model_id=model_id
@@ -55,10 +82,145 @@ class BedrockGeneration(Generation):
 
         chain = prompt | llm
         token_counter = BedRockTokenCounter(llm)
-        print(chain.invoke({"context": context, "question": question}, config={"callbacks": [token_counter]}))
+        answer = chain.invoke({"context": context, "question": question}, config={"callbacks": [token_counter]})
+        print(answer)
         print(token_counter.input_tokens)
         print(token_counter.output_tokens)
 
+        if self.response_cache is not None:
+            self.response_cache.put(model_id, prompt_template, context, question, answer)
+
+        return answer
+
+    def generate_batch(self,
+                       model_id,
+                       retriever:Retrieval,
+                       questions,
+                       k=4,
+                       filters=None):
+        """
+        Answers many questions. The contexts of all questions are retrieved with one
+        retrieve_batch call and the uncached questions are sent with one chain batch
+        :param model_id: The bedrock model id
+        :param retriever: The retriever which returns the context
+        :param questions: The questions to answer
+        :param k: The number of chunks retrieved per question
+        :param filters: Metadata filters of the retrieval
+        :return: list of answers in the order of the questions
+        """
+        contexts = [self.format_context(hits) for hits in retriever.retrieve_batch(questions, k=k, filters=filters)]
+
+        answers = [None] * len(questions)
+        if self.response_cache is not None:
+            answers = [self.response_cache.get(model_id, prompt_template, context, question)
+                       for context, question in zip(contexts, questions)]
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        if not missing:
+            return answers
+
+        bedrock_client = self.get_bedrock_client(assume_role=assumed_role)
+        llm = BedrockLLM(
+            client=bedrock_client, model_id=model_id
+        )
+
+        chain = self.get_prompt() | llm
+        token_counter = BedRockTokenCounter(llm)
+        generated = chain.batch([{"context": contexts[i], "question": questions[i]} for i in missing],
+                                config={"callbacks": [token_counter]})
+        print(token_counter.input_tokens)
+        print(token_counter.output_tokens)
+
+        for i, answer in zip(missing, generated):
+            answers[i] = answer
+            if self.response_cache is not None:
+                self.response_cache.put(model_id, prompt_template, contexts[i], questions[i], answer)
+
+        return answers
+
+    async def agenerate(self,
+                        model_id,
+                        retriever:Retrieval,
+                        question=default_question,
+                        k=4,
+                        filters=None):
+        """
+        asyncio version of generate. The model is called with invoke_model on the
+        shared aiobotocore client, so the event loop is never blocked on bedrock
+        :param model_id: The bedrock model id
+        :param retriever: The retriever which returns the context
+        :param question: The question to answer
+        :param k: The number of chunks retrieved for the context
+        :param filters: Metadata filters of the retrieval
+        :return: The generated answer
+        """
+        context = self.format_context(await retriever.aretrieve(question, k=k, filters=filters))
+
+        if self.response_cache is not None:
+            answer = await asyncio.to_thread(self.response_cache.get, model_id, prompt_template, context, question)
+            if answer is not None:
+                return answer
+
+        prompt = self.get_prompt().format(context=context, question=question)
+
+        bedrock_client = await self.get_async_bedrock_client(assume_role=assumed_role)
+        response = await bedrock_client.invoke_model(
+            body=build_request_body(model_id, prompt),
+            modelId=model_id,
+            accept="application/json",
+            contentType="application/json"
+        )
+        response_body = json.loads(await response["body"].read())
+        answer = parse_response_body(model_id, response_body)
+
+        if self.response_cache is not None:
+            await asyncio.to_thread(self.response_cache.put, model_id, prompt_template, context, question, answer)
+
+        return answer
+
+    def stream(self,
+               model_id,
+               retriever:Retrieval,
+               question=default_question,
+               k=4,
+               filters=None):
+        """
+        Streams the answer with invoke_model_with_response_stream. Iterate the returned
+        stream for the text deltas, its metrics hold the time to first token and the
+        tokens per second of the call once the stream is exhausted
+        :param model_id: The bedrock model id, claude, llama and mistral are supported
+        :param retriever: The retriever which returns the context
+        :param question: The question to answer
+        :param k: The number of chunks retrieved for the context
+        :param filters: Metadata filters of the retrieval
+        :return: ModelStream
+        """
+        context = self.format_context(retriever.retrieve(question, k=k, filters=filters))
+        prompt = self.get_prompt().format(context=context, question=question)
+
+        bedrock_client = self.get_bedrock_client(assume_role=assumed_role)
+        return stream_model_response(bedrock_client, model_id, build_request_body(model_id, prompt))
+
+    async def astream(self,
+                      model_id,
+                      retriever:Retrieval,
+                      question=default_question,
+                      k=4,
+                      filters=None):
+        """
+        asyncio version of stream, iterate the returned stream with async for
+        :param model_id: The bedrock model id, claude, llama and mistral are supported
+        :param retriever: The retriever which returns the context
+        :param question: The question to answer
+        :param k: The number of chunks retrieved for the context
+        :param filters: Metadata filters of the retrieval
+        :return: ModelStream
+        """
+        context = self.format_context(await retriever.aretrieve(question, k=k, filters=filters))
+        prompt = self.get_prompt().format(context=context, question=question)
+
+        bedrock_client = await self.get_async_bedrock_client(assume_role=assumed_role)
+        return await astream_model_response(bedrock_client, model_id, build_request_body(model_id, prompt))
+
 
 if __name__ == "__main__":
     retriever = ContextRetrieval()
@@ -0,0 +1,130 @@
+import json
+
+# Request and response body formats of the bedrock text models used in this repo.
+# They are used wherever we call invoke_model ourselves instead of going through
+# the langchain BedrockLLM wrapper.
+
+
+def get_provider(model_id):
+    """
+    Returns the provider part of the model id
+    :param model_id: The bedrock model id, for example meta.llama2-13b-chat-v1
+    :return: The provider, for example meta
+    """
+    return model_id.split(".")[0]
+
+
+def is_messages_model(model_id):
+    """
+    Claude 3 and later only accept the messages api
+    :param model_id: The bedrock model id
+    :return: True if the model expects a messages body
+    """
+    return get_provider(model_id) == "anthropic" and "claude-3" in model_id
+
+
+def build_request_body(model_id, prompt, max_tokens=512, temperature=0.2, top_p=0.9):
+    """
+    Builds the invoke_model body for the model
+    :param model_id: The bedrock model id
+    :param prompt: The fully formatted prompt
+    :param max_tokens: The maximum number of tokens to generate
+    :param temperature: The sampling temperature
+    :param top_p: The nucleus sampling probability
+    :return: The json encoded body
+    """
+    provider = get_provider(model_id)
+    if is_messages_model(model_id):
+        body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+    elif provider == "anthropic":
+        body = {
+            "prompt": f"\n\nHuman: {prompt}\n\nAssistant:",
+            "max_tokens_to_sample": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+    elif provider == "meta":
+        body = {"prompt": prompt, "max_gen_len": max_tokens, "temperature": temperature, "top_p": top_p}
+    elif provider == "mistral":
+        body = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "top_p": top_p}
+    elif provider == "cohere":
+        body = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature, "p": top_p}
+    elif provider == "amazon":
+        body = {
+            "inputText": prompt,
+            "textGenerationConfig": {
+                "maxTokenCount": max_tokens,
+                "temperature": temperature,
+                "topP": top_p,
+            }
+        }
+    else:
+        raise ValueError(f"Unsupported model {model_id}")
+
+    return json.dumps(body)
+
+
+def parse_response_body(model_id, response_body):
+    """
+    Extracts the generated text from a decoded invoke_model response body
+    :param model_id: The bedrock model id
+    :param response_body: The json decoded response body
+    :return: The generated text
+    """
+    provider = get_provider(model_id)
+    if is_messages_model(model_id):
+        return "".join(block.get("text", "") for block in response_body["content"])
+    elif provider == "anthropic":
+        return response_body["completion"]
+    elif provider == "meta":
+        return response_body["generation"]
+    elif provider == "mistral":
+        return response_body["outputs"][0]["text"]
+    elif provider == "cohere":
+        return response_body["generations"][0]["text"]
+    elif provider == "amazon":
+        return response_body["results"][0]["outputText"]
+
+    raise ValueError(f"Unsupported model {model_id}")
+
+
+def parse_stream_chunk(model_id, chunk):
+    """
+    Extracts the text delta from a decoded invoke_model_with_response_stream chunk
+    :param model_id: The bedrock model id
+    :param chunk: The json decoded chunk
+    :return: The text delta, empty when the chunk carries no text
+    """
+    provider = get_provider(model_id)
+    if is_messages_model(model_id):
+        if chunk.get("type") == "content_block_delta":
+            return chunk["delta"].get("text", "")
+        return ""
+    elif provider == "anthropic":
+        return chunk.get("completion", "")
+    elif provider == "meta":
+        return chunk.get("generation", "")
+    elif provider == "mistral":
+        return "".join(output.get("text", "") for output in chunk.get("outputs", []))
+    elif provider == "cohere":
+        return chunk.get("text", "")
+    elif provider == "amazon":
+        return chunk.get("outputText", "")
+
+    raise ValueError(f"Unsupported model {model_id}")
+
+
+def parse_invocation_metrics(chunk):
+    """
+    Bedrock adds the usage of the call to the last chunk of a stream
+    :param chunk: The json decoded chunk
+    :return: dict with inputTokenCount, outputTokenCount, invocationLatency and
+    firstByteLatency, or None for the other chunks
+    """
+    return chunk.get("amazon-bedrock-invocationMetrics")
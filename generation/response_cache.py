@@ -0,0 +1,248 @@
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embeddings.embedding_cache import normalize_text
+
+
+class ResponseCache():
+    """
+    Persistent cache of generated answers on top of SQLite, shared between threads and,
+    through WAL mode, between processes.
+
+    Answers are keyed by sha256(model id, prompt template, context hash, normalized
+    question). The exact tier looks that key up. The optional semantic tier embeds the
+    question and returns the answer of the most similar cached question asked with the
+    same model, template and context, when the cosine similarity reaches the threshold.
+    Questions are only compared within that scope: the same question asked over other
+    retrieved context is a miss, since its answer may differ.
+    Entries expire after ttl_seconds, and above max_entries the least recently used
+    ones are evicted.
+    """
+
+    def __init__(self,
+                 path="./index/response_cache.db",
+                 ttl_seconds=24 * 3600,
+                 max_entries=100_000,
+                 embed=None,
+                 similarity_threshold=0.95):
+        """
+        Opens or creates the cache
+        :param path: The SQLite file of the cache
+        :param ttl_seconds: Seconds an answer stays valid, None to never expire
+        :param max_entries: The number of answers kept before evicting
+        :param embed: Function returning the embedding of a question, for example
+        TitanEmbedding(...).get_embeddings. None disables the semantic tier
+        :param similarity_threshold: The cosine similarity a cached question needs to
+        be returned by the semantic tier
+        """
+        self.module = "ResponseCache"
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._embed = functools.lru_cache(maxsize=1024)(embed) if embed else None
+        self._lock = threading.Lock()
+        # scope -> (keys, unit question embeddings, created), reloaded when the file changes
+        self._semantic_index = {}
+        self._data_version = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key BLOB PRIMARY KEY, scope BLOB NOT NULL, embedding BLOB, answer TEXT NOT NULL, "
+            "created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._entries = self._count()
+
+    @staticmethod
+    def make_scope(model_id, template, context):
+        """
+        Returns the key of everything except the question
+        :param model_id: The bedrock model id
+        :param template: The prompt template
+        :param context: The retrieved context
+        :return: The 32 byte scope
+        """
+        context_hash = hashlib.sha256(str(context).encode()).hexdigest()
+        return hashlib.sha256(f"{model_id}\0{template}\0{context_hash}".encode()).digest()
+
+    @staticmethod
+    def make_key(scope, question):
+        """
+        Returns the cache key of the question within the scope
+        :param scope: The scope from make_scope
+        :param question: The question
+        :return: The 32 byte key
+        """
+        return hashlib.sha256(scope + normalize_text(question).encode()).digest()
+
+    def get(self, model_id, template, context, question):
+        """
+        Looks up the answer, first exactly, then semantically
+        :param model_id: The bedrock model id
+        :param template: The prompt template
+        :param context: The retrieved context
+        :param question: The question
+        :return: The cached answer or None
+        """
+        scope = self.make_scope(model_id, template, context)
+        key = self.make_key(scope, question)
+        answer = self._get_answer(key)
+        if answer is not None:
+            with self._lock:
+                self.exact_hits += 1
+            return answer
+
+        if self._embed is not None:
+            answer = self._get_similar(scope, self._question_embedding(question))
+            if answer is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model_id, template, context, question, answer):
+        """
+        Stores the answer
+        :param model_id: The bedrock model id
+        :param template: The prompt template
+        :param context: The retrieved context
+        :param question: The question
+        :param answer: The generated answer
+        :return: None
+        """
+        scope = self.make_scope(model_id, template, context)
+        embedding = None
+        if self._embed is not None:
+            embedding = self._question_embedding(question).tobytes()
+
+        key = self.make_key(scope, question)
+        now = time.time()
+        with self._lock:
+            replaced = self._connection.execute(
+                "SELECT 1 FROM responses WHERE key = ?", (key,)
+            ).fetchone() is not None
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, embedding, answer, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, embedding, str(answer), now, now)
+            )
+            self._semantic_index.pop(scope, None)
+            self._entries += not replaced
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of this process
+        :return: dict with exact_hits, semantic_hits, misses, hit_rate and entries
+        """
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": self._entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _question_embedding(self, question):
+        vector = np.asarray(self._embed(normalize_text(question)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired_before(self):
+        return time.time() - self.ttl_seconds if self.ttl_seconds else float("-inf")
+
+    def _get_answer(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT answer, scope, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            answer, scope, created = row
+            if created < self._expired_before():
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._semantic_index.pop(scope, None)
+                self._entries -= 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return answer
+
+    def _get_similar(self, scope, embedding):
+        with self._lock:
+            # data_version changes when another connection commits, in this or any
+            # other process, so the in memory embeddings are reloaded only then
+            data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._semantic_index.clear()
+                self._data_version = data_version
+
+            index = self._semantic_index.get(scope)
+            if index is None:
+                rows = self._connection.execute(
+                    "SELECT key, embedding, created FROM responses "
+                    "WHERE scope = ? AND embedding IS NOT NULL", (scope,)
+                ).fetchall()
+                keys = [row[0] for row in rows]
+                matrix = np.array([np.frombuffer(row[1], dtype=np.float32) for row in rows],
+                                  dtype=np.float32).reshape(len(rows), len(embedding))
+                created = np.array([row[2] for row in rows], dtype=np.float64)
+                index = (keys, matrix, created)
+                self._semantic_index[scope] = index
+
+        keys, matrix, created = index
+        if not keys:
+            return None
+
+        similarities = matrix @ embedding
+        similarities[created < self._expired_before()] = -1.0
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        return self._get_answer(keys[best])
+
+    def _count(self):
+        return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _evict(self):
+        # Must be called with self._lock held. Expired answers go first, then the least
+        # recently used ones until the cache is back at max_entries
+        if self.ttl_seconds:
+            self._connection.execute("DELETE FROM responses WHERE created < ?", (self._expired_before(),))
+        self._entries = self._count()
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            self._entries -= excess
+        self._semantic_index.clear()
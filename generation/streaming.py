@@ -0,0 +1,154 @@
+import json
+import time
+
+from generation.model_formats import parse_invocation_metrics, parse_stream_chunk
+
+
+class StreamMetrics():
+    """
+    Timing and usage of one streamed model call
+    """
+
+    def __init__(self, model_id, started=None):
+        """
+        Initializes the metrics
+        :param model_id: The bedrock model id
+        :param started: perf_counter value when the request was sent
+        """
+        self.module = "StreamMetrics"
+        self.model_id = model_id
+        self.started = started if started is not None else time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.chunks = 0
+        self.input_tokens = None
+        self.output_tokens = None
+
+    @property
+    def time_to_first_token(self):
+        """
+        Seconds from sending the request to the first text delta
+        """
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+
+    @property
+    def total_time(self):
+        """
+        Seconds from sending the request to the end of the stream
+        """
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started
+
+    @property
+    def tokens_per_second(self):
+        """
+        Output tokens per second after the first token. Uses the token count bedrock
+        reports at the end of the stream and falls back to the number of chunks
+        """
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        generation_time = self.finished_at - self.first_token_at
+        tokens = self.output_tokens if self.output_tokens is not None else self.chunks
+        return tokens / generation_time if generation_time > 0 else None
+
+    def on_chunk(self, chunk, text):
+        self.chunks += 1
+        if text and self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        usage = parse_invocation_metrics(chunk)
+        if usage is not None:
+            self.input_tokens = usage.get("inputTokenCount")
+            self.output_tokens = usage.get("outputTokenCount")
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            "model_id": self.model_id,
+            "time_to_first_token": self.time_to_first_token,
+            "total_time": self.total_time,
+            "tokens_per_second": self.tokens_per_second,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "chunks": self.chunks,
+        }
+
+
+class ModelStream():
+    """
+    Iterates over the text deltas of an invoke_model_with_response_stream response.
+    Works as a generator for boto3 responses and as an async iterator for aiobotocore
+    responses. The metrics are complete once the stream is exhausted.
+    """
+
+    def __init__(self, model_id, response, started=None):
+        """
+        Initializes the stream
+        :param model_id: The bedrock model id
+        :param response: The invoke_model_with_response_stream response
+        :param started: perf_counter value when the request was sent
+        """
+        self.module = "ModelStream"
+        self.model_id = model_id
+        self.response = response
+        self.metrics = StreamMetrics(model_id, started)
+
+    def __iter__(self):
+        try:
+            for event in self.response["body"]:
+                text = self._on_event(event)
+                if text:
+                    yield text
+        finally:
+            self.metrics.finish()
+
+    async def __aiter__(self):
+        try:
+            async for event in self.response["body"]:
+                text = self._on_event(event)
+                if text:
+                    yield text
+        finally:
+            self.metrics.finish()
+
+    def _on_event(self, event):
+        if "chunk" not in event:
+            return ""
+        chunk = json.loads(event["chunk"]["bytes"])
+        text = parse_stream_chunk(self.model_id, chunk)
+        self.metrics.on_chunk(chunk, text)
+        return text
+
+
+def stream_model_response(client, model_id, body):
+    """
+    Starts a streamed model call
+    :param client: A boto3 bedrock-runtime client
+    :param model_id: The bedrock model id
+    :param body: The json encoded request body
+    :return: ModelStream, iterate it for the text deltas
+    """
+    started = time.perf_counter()
+    response = client.invoke_model_with_response_stream(
+        body=body, modelId=model_id, accept="application/json", contentType="application/json"
+    )
+    return ModelStream(model_id, response, started)
+
+
+async def astream_model_response(client, model_id, body):
+    """
+    asyncio version of stream_model_response
+    :param client: An aiobotocore bedrock-runtime client
+    :param model_id: The bedrock model id
+    :param body: The json encoded request body
+    :return: ModelStream, iterate it with async for
+    """
+    started = time.perf_counter()
+    response = await client.invoke_model_with_response_stream(
+        body=body, modelId=model_id, accept="application/json", contentType="application/json"
+    )
+    return ModelStream(model_id, response, started)
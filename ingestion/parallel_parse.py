@@ -0,0 +1,103 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+
+from ingestion.pdf_pipeline import iter_pdf_paths
+
+# Text extraction and splitting are pure python and hold the GIL, so threads do not
+# help. The workers of a process pool parse and chunk whole pdfs and send back one
+# compact record per pdf, (source, page count, [(page, chunk text), ...], error),
+# instead of langchain Documents with the full pdf metadata on every chunk. The
+# parent turns the records into Documents with source and page metadata, which is
+# what query_with_sources cites.
+
+_text_splitter = None
+
+
+def _init_worker(chunk_size, chunk_overlap, text_splitter=None):
+    global _text_splitter
+    _text_splitter = text_splitter or CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                            separator="\n")
+
+
+def parse_pdf(path):
+    """
+    Parses and chunks one pdf in a worker process
+    :param path: The pdf path
+    :return: tuple of the path, the number of pages, list of (page, chunk text) and
+    the error message if the pdf could not be parsed
+    """
+    pages = 0
+    chunks = []
+    try:
+        for page in PyPDFLoader(path).lazy_load():
+            pages += 1
+            number = page.metadata.get("page", pages - 1)
+            chunks.extend((number, text) for text in _text_splitter.split_text(page.page_content))
+    except Exception as e:
+        return path, pages, [], str(e)
+    return path, pages, chunks, None
+
+
+class ParallelPdfParser():
+    """
+    Parses and chunks pdfs on all cores. Pdfs are handed to the workers one at a time
+    and at most max_workers * 2 of them are in flight, so a large directory is never
+    listed or held in memory as a whole. Records come back in the order of the paths
+    """
+
+    def __init__(self, max_workers=None, chunk_size=500, chunk_overlap=50, text_splitter=None):
+        """
+        Initializes the parser
+        :param max_workers: The number of worker processes, the number of cores by default
+        :param chunk_size: The chunk size of the text splitter
+        :param chunk_overlap: The chunk overlap of the text splitter
+        :param text_splitter: Optional picklable splitter with split_text used by the
+        workers instead, for example a TokenChunker
+        """
+        self.module = "ParallelPdfParser"
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.text_splitter = text_splitter
+
+    def iter_records(self, path):
+        """
+        Parses a pdf or a directory tree of pdfs
+        :param path: A pdf file or a directory
+        :return: generator of (source, page count, [(page, chunk text), ...], error)
+        """
+        paths = iter_pdf_paths(path)
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                 initargs=(self.chunk_size, self.chunk_overlap, self.text_splitter)) as executor:
+            in_flight = deque()
+            for pdf_path in paths:
+                in_flight.append(executor.submit(parse_pdf, pdf_path))
+                if len(in_flight) >= self.max_workers * 2:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def iter_chunks(self, path, stats=None):
+        """
+        Parses a pdf or a directory tree of pdfs into chunks. A pdf that cannot be
+        parsed is reported and skipped
+        :param path: A pdf file or a directory
+        :param stats: Optional dict counting pdfs, pages and failed pdfs
+        :return: generator of chunk Documents with source and page metadata
+        """
+        for source, pages, chunks, error in self.iter_records(path):
+            if error is not None:
+                print(f"Failed to parse {source}: {error}")
+                if stats is not None:
+                    stats["failed_pdfs"] += 1
+                continue
+            if stats is not None:
+                stats["pdfs"] += 1
+                stats["pages"] += pages
+            for page, text in chunks:
+                yield Document(page_content=text, metadata={"source": source, "page": page})
@@ -0,0 +1,225 @@
+import os
+import queue
+import resource
+import threading
+import time
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_text_splitters import CharacterTextSplitter
+
+_DONE = object()
+
+
+def iter_pdf_paths(path):
+    """
+    Yields the pdf files of a file or directory tree in a stable order, without
+    listing the whole tree up front
+    :param path: A pdf file or a directory
+    :return: generator of paths
+    """
+    if os.path.isfile(path):
+        yield path
+        return
+
+    for directory, subdirectories, files in os.walk(path):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(".pdf"):
+                yield os.path.join(directory, name)
+
+
+def iter_pages(paths, stats=None):
+    """
+    Yields the pages of the pdfs one at a time. A pdf that cannot be parsed is
+    reported and skipped, so one broken file does not stop a large ingestion
+    :param paths: The pdf paths
+    :param stats: Optional dict counting pdfs, pages and failed pdfs
+    :return: generator of langchain Documents, one per page
+    """
+    for path in paths:
+        try:
+            for page in PyPDFLoader(path).lazy_load():
+                if stats is not None:
+                    stats["pages"] += 1
+                yield page
+            if stats is not None:
+                stats["pdfs"] += 1
+        except Exception as e:
+            print(f"Failed to parse {path}: {e}")
+            if stats is not None:
+                stats["failed_pdfs"] += 1
+
+
+def iter_chunks(pages, text_splitter):
+    """
+    Splits page by page, so only one page is held at a time
+    :param pages: The pages
+    :param text_splitter: A langchain text splitter
+    :return: generator of chunk Documents
+    """
+    for page in pages:
+        yield from text_splitter.split_documents([page])
+
+
+def iter_batches(items, batch_size):
+    """
+    Groups the items into lists of batch_size
+    :param items: Any iterable
+    :param batch_size: The size of the lists
+    :return: generator of lists
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the process so far
+    :return: MB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class PdfIngestionPipeline():
+    """
+    Streams pdfs into a FAISS index in four stages, page -> chunk -> embedding batch
+    -> index append. Parsing and chunking run on one thread, embedding on another and
+    the index is appended to on the calling thread. The stages are connected by
+    bounded queues, so parsing the next pdf overlaps with embedding the chunks of the
+    previous one, and at most queue_size batches wait between two stages. Memory is
+    therefore bounded by the batches in flight and the index itself, not by the size
+    of the documents.
+    """
+
+    def __init__(self,
+                 embeddings,
+                 index_store="./index/faiss_index",
+                 chunk_size=500,
+                 chunk_overlap=50,
+                 batch_size=64,
+                 queue_size=4,
+                 parser=None,
+                 text_splitter=None):
+        """
+        Initializes the pipeline
+        :param embeddings: The langchain embeddings, BatchedBedrockEmbeddings embeds
+        every batch concurrently
+        :param index_store: The folder the FAISS index is saved to
+        :param chunk_size: The chunk size of the text splitter
+        :param chunk_overlap: The chunk overlap of the text splitter
+        :param batch_size: The number of chunks embedded and appended at a time
+        :param queue_size: The number of batches buffered between two stages
+        :param parser: Optional ParallelPdfParser, parses and chunks on all cores
+        instead of on the parse thread. It brings its own chunk size and overlap
+        :param text_splitter: Optional splitter with split_documents, for example a
+        TokenChunker. A CharacterTextSplitter of chunk_size and chunk_overlap by default
+        """
+        self.module = "PdfIngestionPipeline"
+        self.embeddings = embeddings
+        self.index_store = index_store
+        self.text_splitter = text_splitter or CharacterTextSplitter(chunk_size=chunk_size,
+                                                                    chunk_overlap=chunk_overlap, separator="\n")
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.parser = parser
+
+    def run(self, path):
+        """
+        Ingests a pdf or a directory tree of pdfs and saves the index
+        :param path: A pdf file or a directory
+        :return: dict with pdfs, failed_pdfs, pages, chunks, seconds, pages_per_second
+        and peak_rss_mb
+        """
+        stats = {"pdfs": 0, "failed_pdfs": 0, "pages": 0, "chunks": 0}
+        start = time.perf_counter()
+        stop = threading.Event()
+        errors = []
+        chunk_batches = queue.Queue(maxsize=self.queue_size)
+        embedded_batches = queue.Queue(maxsize=self.queue_size)
+
+        def parse():
+            if self.parser is not None:
+                chunks = self.parser.iter_chunks(path, stats)
+            else:
+                chunks = iter_chunks(iter_pages(iter_pdf_paths(path), stats), self.text_splitter)
+            for batch in iter_batches(chunks, self.batch_size):
+                if not _put(chunk_batches, batch, stop):
+                    return
+
+        def embed():
+            for batch in _drain(chunk_batches, stop):
+                vectors = self.embeddings.embed_documents([chunk.page_content for chunk in batch])
+                if not _put(embedded_batches, (batch, vectors), stop):
+                    return
+
+        threads = [threading.Thread(target=_run_stage, args=(stage, output, stop, errors), daemon=True)
+                   for stage, output in [(parse, chunk_batches), (embed, embedded_batches)]]
+        for thread in threads:
+            thread.start()
+
+        vectorstore = None
+        try:
+            for batch, vectors in _drain(embedded_batches, stop):
+                text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(batch, vectors)]
+                metadatas = [chunk.metadata for chunk in batch]
+                if vectorstore is None:
+                    vectorstore = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas)
+                else:
+                    vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+                stats["chunks"] += len(batch)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        if vectorstore is not None:
+            vectorstore.save_local(self.index_store)
+
+        stats["seconds"] = time.perf_counter() - start
+        stats["pages_per_second"] = stats["pages"] / stats["seconds"] if stats["seconds"] else 0.0
+        stats["peak_rss_mb"] = peak_rss_mb()
+        return stats
+
+
+def _run_stage(stage, output, stop, errors):
+    # The end marker is always sent, so the next stage never waits on a failed one
+    try:
+        stage()
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(output, _DONE, stop, force=True)
+
+
+def _put(output, item, stop, force=False):
+    while force or not stop.is_set():
+        try:
+            output.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if force and stop.is_set():
+                return False
+    return False
+
+
+def _drain(source, stop):
+    while True:
+        try:
+            item = source.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        yield item
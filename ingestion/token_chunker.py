@@ -0,0 +1,222 @@
+import functools
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+
+# A chunk ends after a sentence (., ! or ? followed by whitespace) or a paragraph (an
+# empty line). The boundaries of a text are found with one regex scan, then the
+# sentences are counted in one tokenizer call and packed greedily into chunks of at
+# most chunk_tokens, so the text is only walked once. The line breaks pypdf puts at
+# the end of every printed line are not boundaries. The pattern starts with one
+# character set, so the regex engine can skip ahead to the candidates.
+_BOUNDARY = re.compile(r"[\n.!?](?:(?<=\n)[ \t]*(\n)\s*|(?<=[.!?])[\"')\]]*(\s+))")
+
+# Without tiktoken, tokens are approximated the way BPE vocabularies split english:
+# every 8 letters of a word and every 3 digits start a token, and so does every
+# punctuation mark. Characters beyond ascii count as letters. The classes are
+# indexed by the code point capped at 128
+_SPACE, _LETTER, _DIGIT, _PUNCTUATION = 0, 1, 2, 3
+_CHARACTER_CLASSES = np.full(129, _PUNCTUATION, dtype=np.int8)
+_CHARACTER_CLASSES[[ord(c) for c in " \t\n\r\f\v"]] = _SPACE
+_CHARACTER_CLASSES[[ord(c) for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"] + [128]] = _LETTER
+_CHARACTER_CLASSES[[ord(c) for c in "0123456789"]] = _DIGIT
+# The characters per token of every class, a run of spaces starts no token
+_TOKEN_LENGTHS = np.array([np.inf, 8, 3, 1])
+
+
+def approximate_token_starts(text):
+    """
+    Returns where the approximate tokens of the text start, in one vectorized pass.
+    The work per character is one class lookup, the rest is done per run of
+    characters of the same class
+    :param text: The text
+    :return: sorted int array of positions, the tokens of text[a:b] are
+    searchsorted(starts, b) - searchsorted(starts, a)
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    classes = _CHARACTER_CLASSES.take(np.minimum(codes, 128))
+    # The start of every run and the end of the text
+    boundaries = np.ones(len(classes) + 1, dtype=bool)
+    np.not_equal(classes[1:], classes[:-1], out=boundaries[1:-1])
+    boundaries = np.flatnonzero(boundaries)
+    run_starts = boundaries[:-1]
+    lengths = _TOKEN_LENGTHS.take(classes.take(run_starts))
+    run_tokens = np.ceil((boundaries[1:] - run_starts) / lengths).astype(np.intp)
+    # Token i of a run starts i token lengths into the run
+    token_runs = np.repeat(np.arange(len(run_starts)), run_tokens)
+    first_tokens = np.cumsum(run_tokens) - run_tokens
+    offsets = (np.arange(len(token_runs)) - first_tokens[token_runs]) * lengths[token_runs]
+    return run_starts[token_runs] + offsets.astype(np.intp)
+
+
+@functools.lru_cache(maxsize=None)
+def _tiktoken():
+    # Imported once per process, whatever the encoding, so the warning is printed once
+    try:
+        import tiktoken
+    except ImportError as e:
+        print(f"Tokenizer unavailable, approximating token counts: {e}")
+        return None
+    return tiktoken
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(encoding):
+    return _tiktoken().get_encoding(encoding)
+
+
+def get_token_counter(encoding="cl100k_base"):
+    """
+    Returns the token counter of the encoding. The counter is called with a text and
+    returns a function counting the tokens of spans of that text. The tiktoken
+    encoding is loaded once per process and counts all spans of a call in one batch,
+    without tiktoken the counts are approximated with approximate_token_starts
+    :param encoding: The tiktoken encoding
+    :return: function of a text returning a function of a list of (start, end) that
+    returns a list of counts
+    """
+    if _tiktoken() is None:
+        def counter(text):
+            starts = approximate_token_starts(text)
+
+            def count(spans):
+                bounds = np.searchsorted(starts, np.array(spans, dtype=np.intp).reshape(-1))
+                return (bounds[1::2] - bounds[0::2]).tolist()
+            return count
+        return counter
+
+    tokenizer = _encoding(encoding)
+
+    def counter(text):
+        return lambda spans: [len(tokens) for tokens in
+                              tokenizer.encode_ordinary_batch([text[start:end] for start, end in spans])]
+    return counter
+
+
+class TokenChunker():
+    """
+    Splits text into chunks of about chunk_tokens tokens that end at sentence or
+    paragraph boundaries. A chunk is closed at a paragraph end once it holds
+    min_tokens, and the sentences at its end that fit in overlap_tokens are repeated
+    at the start of the next one. A sentence longer than chunk_tokens is cut at
+    whitespace. Has the split_text and split_documents of the langchain splitters
+    """
+
+    def __init__(self, chunk_tokens=128, overlap_tokens=16, min_tokens=None, encoding="cl100k_base"):
+        """
+        Initializes the chunker
+        :param chunk_tokens: The most tokens in a chunk
+        :param overlap_tokens: The most tokens repeated from the end of the previous chunk
+        :param min_tokens: The fewest tokens before a paragraph end closes a chunk,
+        half of chunk_tokens by default
+        :param encoding: The tiktoken encoding used to count tokens
+        """
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError(f"overlap_tokens {overlap_tokens} has to be smaller than chunk_tokens {chunk_tokens}")
+        self.module = "TokenChunker"
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = chunk_tokens // 2 if min_tokens is None else min_tokens
+        self.encoding = encoding
+
+    def _sentences(self, text):
+        # (start, end, paragraph end) of every sentence, end excludes the whitespace
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(text):
+            if match.lastindex == 1:
+                end, paragraph_end = match.start(), True
+            else:
+                # A sentence followed by an empty line also ends its paragraph
+                end = match.start(2)
+                paragraph_end = text.count("\n", end, match.end()) > 1
+            while end > start and text[end - 1] in " \t":
+                end -= 1
+            if end > start:
+                sentences.append((start, end, paragraph_end))
+            start = match.end()
+        if start < len(text) and text[start:].strip():
+            sentences.append((start, len(text.rstrip()), True))
+        return sentences
+
+    def _cut(self, text, start, end, tokens, count):
+        # Cuts a sentence that does not fit into a chunk at whitespace near equal
+        # parts, and into more parts while a part is still too long
+        parts = -(-tokens // self.chunk_tokens)
+        while True:
+            spans = []
+            piece_start = start
+            for part in range(parts):
+                target = piece_start + (end - piece_start) // (parts - part)
+                cut = end if part == parts - 1 else text.rfind(" ", piece_start + 1, target)
+                if cut <= piece_start:
+                    cut = target
+                spans.append((piece_start, cut))
+                piece_start = cut
+                while piece_start < end and text[piece_start].isspace():
+                    piece_start += 1
+            counts = count(spans)
+            if max(counts) <= self.chunk_tokens or parts >= end - start:
+                return [span + (tokens,) for span, tokens in zip(spans, counts)]
+            parts += 1
+
+    def iter_spans(self, text):
+        """
+        Yields the character span and token count of every chunk of the text
+        :param text: The text
+        :return: generator of (start, end, tokens)
+        """
+        sentences = self._sentences(text)
+        count = get_token_counter(self.encoding)(text)
+        counts = count([(start, end) for start, end, _ in sentences])
+
+        units = []
+        for (start, end, paragraph_end), tokens in zip(sentences, counts):
+            if tokens > self.chunk_tokens:
+                pieces = self._cut(text, start, end, tokens, count)
+                units.extend((piece_start, piece_end, piece_tokens, False)
+                             for piece_start, piece_end, piece_tokens in pieces[:-1])
+                units.append(pieces[-1] + (paragraph_end,))
+            else:
+                units.append((start, end, tokens, paragraph_end))
+
+        chunk = []
+        chunk_tokens = 0
+        for unit in units:
+            if chunk and chunk_tokens + unit[2] > self.chunk_tokens:
+                yield chunk[0][0], chunk[-1][1], chunk_tokens
+                # Carry the last sentences that fit in the overlap, but leave room for the unit
+                overlap = []
+                overlap_tokens = 0
+                for carried in reversed(chunk):
+                    if overlap_tokens + carried[2] > min(self.overlap_tokens, self.chunk_tokens - unit[2]):
+                        break
+                    overlap.insert(0, carried)
+                    overlap_tokens += carried[2]
+                chunk, chunk_tokens = overlap, overlap_tokens
+
+            chunk.append(unit)
+            chunk_tokens += unit[2]
+            if unit[3] and chunk_tokens >= self.min_tokens:
+                yield chunk[0][0], chunk[-1][1], chunk_tokens
+                chunk, chunk_tokens = [], 0
+        if chunk:
+            yield chunk[0][0], chunk[-1][1], chunk_tokens
+
+    def split_text(self, text):
+        """
+        Splits the text into chunks
+        :param text: The text
+        :return: list of chunk texts
+        """
+        return [text[start:end] for start, end, _ in self.iter_spans(text)]
+
+    def split_documents(self, documents):
+        """
+        Splits every document, the chunks keep the metadata of their document
+        :param documents: The langchain Documents
+        :return: list of chunk Documents
+        """
+        return [Document(page_content=chunk, metadata=dict(document.metadata))
+                for document in documents for chunk in self.split_text(document.page_content)]
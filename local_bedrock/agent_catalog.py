@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+from local_bedrock.errors import ServiceError
+
+# The agents of the stub server for list_agents and list_agent_aliases of the
+# bedrock-agent api, in the shapes and pages of the service. Agent i is STUBAGENT<i>
+# named stub-agent-<i>, with the test alias TSTALIASID on the DRAFT version and the
+# aliases STUBALIAS<j> on version j. Every fourth agent is NOT_PREPARED.
+
+DEFAULT_PAGE_SIZE = 10
+
+
+def _page(items, request, key):
+    offset = int(request.get("nextToken") or 0)
+    limit = int(request.get("maxResults") or DEFAULT_PAGE_SIZE)
+    response = {key: items[offset:offset + limit]}
+    if offset + limit < len(items):
+        response["nextToken"] = str(offset + limit)
+    return response
+
+
+class LocalAgents():
+    """
+    A fixed catalog of agents and their aliases
+    """
+
+    def __init__(self, agents=3, aliases_per_agent=2):
+        """
+        Initializes the catalog
+        :param agents: The number of agents
+        :param aliases_per_agent: The number of aliases of every agent besides the
+        test alias, alias j points to version j
+        """
+        self.module = "LocalAgents"
+        now = datetime.now(timezone.utc).isoformat()
+        self.agents = []
+        self.aliases = {}
+        for i in range(1, agents + 1):
+            agent_id = f"STUBAGENT{i}"
+            self.agents.append({
+                "agentId": agent_id,
+                "agentName": f"stub-agent-{i}",
+                "agentStatus": "NOT_PREPARED" if i % 4 == 0 else "PREPARED",
+                "description": f"Stub agent {i}",
+                "latestAgentVersion": str(aliases_per_agent) if aliases_per_agent else "DRAFT",
+                "updatedAt": now,
+            })
+            aliases = [{"agentAliasId": "TSTALIASID", "agentAliasName": "AgentTestAlias",
+                        "agentAliasStatus": "PREPARED", "routingConfiguration": [{"agentVersion": "DRAFT"}],
+                        "createdAt": now, "updatedAt": now}]
+            for j in range(1, aliases_per_agent + 1):
+                aliases.append({"agentAliasId": f"STUBALIAS{j}", "agentAliasName": f"v{j}",
+                                "agentAliasStatus": "PREPARED", "routingConfiguration": [{"agentVersion": str(j)}],
+                                "createdAt": now, "updatedAt": now})
+            self.aliases[agent_id] = aliases
+
+    def list_agents(self, request):
+        """
+        ListAgents, maxResults agents a page
+        """
+        return _page(self.agents, request, "agentSummaries")
+
+    def list_agent_aliases(self, agent_id, request):
+        """
+        ListAgentAliases, maxResults aliases a page
+        """
+        if agent_id not in self.aliases:
+            raise ServiceError(404, "ResourceNotFoundException", f"Agent {agent_id} not found")
+        return _page(self.aliases[agent_id], request, "agentAliasSummaries")
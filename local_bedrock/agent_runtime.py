@@ -0,0 +1,144 @@
+import base64
+import uuid
+from datetime import datetime, timezone
+
+# Responses of the bedrock-agent-runtime endpoint. invoke_agent answers with the trace
+# steps an agent with a knowledge base goes through, then with the answer in chunks.
+
+STUB_DOCUMENTS = [
+    ("The loan amount is 800,000 USD with an interest rate of 6.75% per annum.",
+     "s3://bedrock-agent01/loan.pdf"),
+    ("The monthly payment of a fixed rate mortgage is M = P*(I*(1 + I)**N) / ((1 + I)**N - 1).",
+     "s3://bedrock-agent01/mortgage.pdf"),
+    ("Homeowners insurance and HOA fees are added to the monthly payment.",
+     "s3://bedrock-agent01/mortgage.pdf"),
+    ("TajMahal is in Agra, Uttar Pradesh.",
+     "s3://bedrock-agent01/travel.pdf"),
+]
+
+AGENT_ANSWER = "The interest rate of the loan is 6.75% per annum."
+
+AGENT_MODEL = "anthropic.claude-3-haiku-20240307-v1:0"
+
+
+def retrieval_results(query, offset=0, limit=5):
+    """
+    Returns the stub documents ranked by the number of words they share with the query
+    :param query: The query text
+    :param offset: The rank to start from
+    :param limit: The number of results
+    :return: list of retrieval results in the shape of the retrieve api
+    """
+    words = set(query.lower().split())
+    ranked = sorted(STUB_DOCUMENTS, key=lambda document: -len(words & set(document[0].lower().split())))
+    results = []
+    for rank, (text, uri) in enumerate(ranked[offset:offset + limit], start=offset):
+        results.append({
+            "content": {"text": text},
+            "location": {"type": "S3", "s3Location": {"uri": uri}},
+            "score": round(0.9 - 0.1 * rank, 4),
+        })
+    return results
+
+
+def retrieve_response(knowledge_base_id, request):
+    """
+    Returns the body of a retrieve response. The results are paginated with the
+    offset of the next page as nextToken
+    :param knowledge_base_id: The knowledge base id
+    :param request: The decoded request body
+    :return: The response body as a dict
+    """
+    limit = request.get("retrievalConfiguration", {}).get("vectorSearchConfiguration", {}).get("numberOfResults", 5)
+    next_token = request.get("nextToken", "0")
+    offset = int(next_token) if next_token.isdigit() else 0
+    response = {"retrievalResults": retrieval_results(request["retrievalQuery"]["text"], offset, limit)}
+    if offset + limit < len(STUB_DOCUMENTS):
+        response["nextToken"] = str(offset + limit)
+    return response
+
+
+def agent_events(agent_id, agent_alias_id, session_id, input_text, answer=AGENT_ANSWER):
+    """
+    Yields the events of an invoke_agent response, trace parts for pre processing,
+    orchestration with a knowledge base lookup and post processing, then the answer
+    one word per chunk. The event time of every trace is taken when it is yielded,
+    model outputs and knowledge base lookups get the start, end and total time of the
+    step in their metadata
+    :param agent_id: The agent id
+    :param agent_alias_id: The agent alias id
+    :param session_id: The session id
+    :param input_text: The user input
+    :param answer: The final answer
+    :return: generator of (event type, payload dict)
+    """
+    trace_id = str(uuid.uuid4())
+    references = retrieval_results(input_text, limit=2)
+    steps = [
+        {"preProcessingTrace": {"modelInvocationInput": {
+            "traceId": f"{trace_id}-pre-0", "type": "PRE_PROCESSING", "foundationModel": AGENT_MODEL,
+            "text": input_text}}},
+        {"preProcessingTrace": {"modelInvocationOutput": {
+            "traceId": f"{trace_id}-pre-0",
+            "parsedResponse": {"isValid": True, "rationale": "The question is about the loan."},
+            "metadata": {"usage": {"inputTokens": len(input_text.split()) + 200, "outputTokens": 30}}}}},
+        {"orchestrationTrace": {"modelInvocationInput": {
+            "traceId": f"{trace_id}-0", "type": "ORCHESTRATION", "foundationModel": AGENT_MODEL,
+            "text": input_text}}},
+        {"orchestrationTrace": {"modelInvocationOutput": {
+            "traceId": f"{trace_id}-0",
+            "metadata": {"usage": {"inputTokens": len(input_text.split()) + 400, "outputTokens": 40}}}}},
+        {"orchestrationTrace": {"rationale": {
+            "traceId": f"{trace_id}-0", "text": "I should search the knowledge base."}}},
+        {"orchestrationTrace": {"invocationInput": {
+            "traceId": f"{trace_id}-0", "invocationType": "KNOWLEDGE_BASE",
+            "knowledgeBaseLookupInput": {"knowledgeBaseId": "STUBKB0001", "text": input_text}}}},
+        {"orchestrationTrace": {"observation": {
+            "traceId": f"{trace_id}-0", "type": "KNOWLEDGE_BASE",
+            "knowledgeBaseLookupOutput": {"retrievedReferences": [
+                {"content": result["content"], "location": result["location"]} for result in references]}}}},
+        {"orchestrationTrace": {"modelInvocationInput": {
+            "traceId": f"{trace_id}-1", "type": "ORCHESTRATION", "foundationModel": AGENT_MODEL,
+            "text": input_text}}},
+        {"orchestrationTrace": {"modelInvocationOutput": {
+            "traceId": f"{trace_id}-1",
+            "metadata": {"usage": {"inputTokens": 600, "outputTokens": len(answer.split())}}}}},
+        {"orchestrationTrace": {"observation": {
+            "traceId": f"{trace_id}-1", "type": "FINISH", "finalResponse": {"text": answer}}}},
+        {"postProcessingTrace": {"modelInvocationInput": {
+            "traceId": f"{trace_id}-post-0", "type": "POST_PROCESSING", "foundationModel": AGENT_MODEL,
+            "text": answer}}},
+        {"postProcessingTrace": {"modelInvocationOutput": {
+            "traceId": f"{trace_id}-post-0", "parsedResponse": {"text": answer},
+            "metadata": {"usage": {"inputTokens": 150, "outputTokens": len(answer.split())}}}}},
+    ]
+    model_started = lookup_started = None
+    for step in steps:
+        now = datetime.now(timezone.utc)
+        part = next(iter(step.values()))
+        # Model calls and knowledge base lookups carry their times like the service
+        if "modelInvocationInput" in part:
+            model_started = now
+        elif "invocationInput" in part:
+            lookup_started = now
+        for output, started in ((part.get("modelInvocationOutput"), model_started),
+                                (part.get("observation", {}).get("knowledgeBaseLookupOutput"), lookup_started)):
+            if output is not None and started is not None:
+                output.setdefault("metadata", {}).update({
+                    "startTime": started.isoformat(),
+                    "endTime": now.isoformat(),
+                    "totalTimeMs": round((now - started).total_seconds() * 1000),
+                })
+        yield "trace", {
+            "agentId": agent_id,
+            "agentAliasId": agent_alias_id,
+            "agentVersion": "1",
+            "sessionId": session_id,
+            "eventTime": now.isoformat(),
+            "trace": step,
+        }
+
+    words = answer.split(" ")
+    for i, word in enumerate(words):
+        text = word if i == len(words) - 1 else word + " "
+        yield "chunk", {"bytes": base64.b64encode(text.encode()).decode()}
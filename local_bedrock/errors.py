@@ -0,0 +1,10 @@
+class ServiceError(Exception):
+    """
+    An error of a stub operation in the shape of the service, the stub server answers
+    it with status and error_type as the x-amzn-ErrorType
+    """
+
+    def __init__(self, status, error_type, message):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
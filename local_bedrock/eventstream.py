@@ -0,0 +1,43 @@
+import base64
+import binascii
+import json
+import struct
+
+
+def encode_event(headers, payload):
+    """
+    Encodes one message of the vnd.amazon.eventstream binary format
+    :param headers: dict of string headers
+    :param payload: The payload bytes
+    :return: The encoded message
+    """
+    encoded_headers = b""
+    for name, value in headers.items():
+        name, value = name.encode(), value.encode()
+        encoded_headers += struct.pack("!B", len(name)) + name + struct.pack("!BH", 7, len(value)) + value
+
+    total_length = 12 + len(encoded_headers) + len(payload) + 4
+    prelude = struct.pack("!II", total_length, len(encoded_headers))
+    message = prelude + struct.pack("!I", binascii.crc32(prelude)) + encoded_headers + payload
+    return message + struct.pack("!I", binascii.crc32(message))
+
+
+def encode_json_event(event_type, body):
+    """
+    Encodes an event with a json payload
+    :param event_type: The member of the event stream union, for example chunk or trace
+    :param body: The payload as a dict
+    :return: The encoded message
+    """
+    return encode_event({":event-type": event_type,
+                         ":content-type": "application/json",
+                         ":message-type": "event"}, json.dumps(body).encode())
+
+
+def encode_chunk_event(chunk):
+    """
+    Encodes a model chunk the way invoke_model_with_response_stream sends it
+    :param chunk: The chunk dict
+    :return: The encoded message
+    """
+    return encode_json_event("chunk", {"bytes": base64.b64encode(json.dumps(chunk).encode()).decode()})
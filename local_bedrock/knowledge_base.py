@@ -0,0 +1,460 @@
+import hashlib
+import json
+import os
+import random
+import re
+import string
+import threading
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+from local_bedrock.errors import ServiceError
+from local_bedrock.latency import LatencyModel
+
+# Knowledge bases on the local machine for the stub server. create_knowledge_base,
+# create_data_source, start_ingestion_job, get_ingestion_job and retrieve take and
+# return the shapes of the bedrock-agent and bedrock-agent-runtime apis. An S3 data
+# source reads the folder bucket_root/<bucket name>, with the same inclusion prefixes
+# and <file>.metadata.json metadata files as S3. Ingestion runs in the background
+# and moves through STARTING, IN_PROGRESS and COMPLETE or FAILED. Chunks are embedded
+# with hashed bag-of-words vectors, so similar texts are close without a model, and
+# kept in one numpy matrix per knowledge base. Everything is kept in memory.
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md", ".html", ".csv", ".json")
+DEFAULT_CHUNKING = {"maxTokens": 300, "overlapPercentage": 20}
+
+_WORD = re.compile(r"\w+")
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _resource_id():
+    # Ten upper case letters and digits like the ids the service hands out
+    return "".join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+def embed_text(text, dimensions=256):
+    """
+    Returns a hashed bag-of-words vector of unit length
+    :param text: The text
+    :param dimensions: The vector size
+    :return: float32 numpy vector
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vector[digest % dimensions] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def chunk_text(text, chunking_configuration):
+    """
+    Splits text like the chunking strategies of a data source. Tokens are counted as
+    words
+    :param text: The document text
+    :param chunking_configuration: The chunkingConfiguration of the data source
+    :return: list of chunk texts
+    """
+    strategy = chunking_configuration.get("chunkingStrategy", "FIXED_SIZE")
+    words = text.split()
+    if not words:
+        return []
+    if strategy == "NONE":
+        return [" ".join(words)]
+
+    fixed_size = chunking_configuration.get("fixedSizeChunkingConfiguration", DEFAULT_CHUNKING)
+    size = max(1, fixed_size["maxTokens"])
+    step = max(1, size - size * fixed_size["overlapPercentage"] // 100)
+    return [" ".join(words[start:start + size]) for start in range(0, max(1, len(words) - size + step), step)]
+
+
+def read_document(path):
+    """
+    Returns the text of a document of the bucket
+    :param path: The file path
+    :return: The text
+    """
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        return "\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def filter_matches(metadata, retrieval_filter):
+    """
+    Evaluates a RetrievalFilter of the retrieve api on the metadata of a chunk
+    :param metadata: The chunk metadata
+    :param retrieval_filter: The filter
+    :return: True if the chunk passes
+    """
+    if not retrieval_filter:
+        return True
+    (operator, argument), = retrieval_filter.items()
+    if operator == "andAll":
+        return all(filter_matches(metadata, condition) for condition in argument)
+    if operator == "orAll":
+        return any(filter_matches(metadata, condition) for condition in argument)
+
+    value = metadata.get(argument["key"])
+    expected = argument["value"]
+    if operator == "equals":
+        return value == expected
+    if operator == "notEquals":
+        return value != expected
+    if operator == "in":
+        return value in expected
+    if operator == "notIn":
+        return value not in expected
+    if value is None:
+        return False
+    if operator == "greaterThan":
+        return value > expected
+    if operator == "greaterThanOrEquals":
+        return value >= expected
+    if operator == "lessThan":
+        return value < expected
+    if operator == "lessThanOrEquals":
+        return value <= expected
+    if operator == "startsWith":
+        return str(value).startswith(expected)
+    if operator == "stringContains":
+        return expected in str(value)
+    if operator == "listContains":
+        return expected in value
+    raise ServiceError(400, "ValidationException", f"Unsupported filter operator {operator}")
+
+
+class _KnowledgeBaseIndex():
+    """
+    The chunks of one knowledge base. Every document keeps its own chunks and
+    vectors, so ingesting a document costs its own size. Searches use a snapshot of
+    all chunks with their vectors stacked into one matrix, rebuilt after a change
+    """
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self.documents = {}
+        self._snapshot = None
+
+    def replace_document(self, data_source_id, uri, content_hash, chunks, vectors, metadata):
+        entries = []
+        for text in chunks:
+            entry = dict(metadata)
+            entry.update({"x-amz-bedrock-kb-source-uri": uri,
+                          "x-amz-bedrock-kb-chunk-id": str(uuid.uuid4()),
+                          "x-amz-bedrock-kb-data-source-id": data_source_id})
+            entries.append((text, entry))
+        self.documents[uri] = {"dataSourceId": data_source_id, "hash": content_hash, "chunks": entries,
+                               "vectors": vectors.reshape(-1, self.dimensions)}
+        self._snapshot = None
+
+    def remove_document(self, uri):
+        if self.documents.pop(uri, None) is not None:
+            self._snapshot = None
+
+    def snapshot(self):
+        if self._snapshot is None:
+            chunks, uris = [], []
+            for uri, document in self.documents.items():
+                chunks.extend(document["chunks"])
+                uris.extend([uri] * len(document["chunks"]))
+            vectors = [document["vectors"] for document in self.documents.values()]
+            matrix = np.vstack(vectors) if vectors else np.zeros((0, self.dimensions), dtype=np.float32)
+            self._snapshot = (chunks, uris, matrix)
+        return self._snapshot
+
+
+class LocalKnowledgeBases():
+    """
+    The knowledge bases, data sources and ingestion jobs of the stub server
+    """
+
+    def __init__(self, bucket_root="./local_buckets", dimensions=256, job_step_latency=0.5):
+        """
+        Initializes the emulator
+        :param bucket_root: The folder holding one folder per S3 bucket
+        :param dimensions: The size of the chunk vectors
+        :param job_step_latency: Seconds or LatencyModel an ingestion job stays in
+        STARTING, and a knowledge base in CREATING
+        """
+        self.module = "LocalKnowledgeBases"
+        self.bucket_root = bucket_root
+        self.dimensions = dimensions
+        self.job_step_latency = LatencyModel.of(job_step_latency)
+        self.knowledge_bases = {}
+        self.data_sources = {}
+        self.jobs = {}
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def create_knowledge_base(self, request):
+        """
+        CreateKnowledgeBase, the knowledge base is CREATING for job_step_latency
+        :param request: The request body
+        :return: The response body
+        """
+        knowledge_base_id = _resource_id()
+        knowledge_base = {
+            "knowledgeBaseId": knowledge_base_id,
+            "name": request["name"],
+            "knowledgeBaseArn": f"arn:aws:bedrock:us-east-1:123456789012:knowledge-base/{knowledge_base_id}",
+            "description": request.get("description", ""),
+            "roleArn": request["roleArn"],
+            "knowledgeBaseConfiguration": request["knowledgeBaseConfiguration"],
+            "storageConfiguration": request.get("storageConfiguration", {}),
+            "status": "CREATING",
+            "createdAt": _now(),
+            "updatedAt": _now(),
+        }
+        with self.lock:
+            self.knowledge_bases[knowledge_base_id] = knowledge_base
+            self.indexes[knowledge_base_id] = _KnowledgeBaseIndex(self.dimensions)
+        self._later(self.job_step_latency.sample(), self._set_status, knowledge_base, "ACTIVE")
+        return {"knowledgeBase": dict(knowledge_base)}
+
+    def get_knowledge_base(self, knowledge_base_id):
+        """
+        GetKnowledgeBase
+        :param knowledge_base_id: The knowledge base id
+        :return: The response body
+        """
+        with self.lock:
+            return {"knowledgeBase": dict(self._knowledge_base(knowledge_base_id))}
+
+    def create_data_source(self, knowledge_base_id, request):
+        """
+        CreateDataSource, only S3 data sources are supported
+        :param knowledge_base_id: The knowledge base id
+        :param request: The request body
+        :return: The response body
+        """
+        configuration = request["dataSourceConfiguration"]
+        if configuration.get("type") != "S3":
+            raise ServiceError(400, "ValidationException", "Only S3 data sources are emulated")
+
+        data_source_id = _resource_id()
+        data_source = {
+            "knowledgeBaseId": knowledge_base_id,
+            "dataSourceId": data_source_id,
+            "name": request["name"],
+            "status": "AVAILABLE",
+            "description": request.get("description", ""),
+            "dataSourceConfiguration": configuration,
+            "vectorIngestionConfiguration": request.get("vectorIngestionConfiguration", {}),
+            "dataDeletionPolicy": request.get("dataDeletionPolicy", "DELETE"),
+            "createdAt": _now(),
+            "updatedAt": _now(),
+        }
+        with self.lock:
+            self._knowledge_base(knowledge_base_id)
+            self.data_sources[(knowledge_base_id, data_source_id)] = data_source
+        return {"dataSource": dict(data_source)}
+
+    def start_ingestion_job(self, knowledge_base_id, data_source_id, request):
+        """
+        StartIngestionJob, the job runs in a background thread
+        :param knowledge_base_id: The knowledge base id
+        :param data_source_id: The data source id
+        :param request: The request body
+        :return: The response body
+        """
+        with self.lock:
+            data_source = self._data_source(knowledge_base_id, data_source_id)
+            job_id = _resource_id()
+            job = {
+                "knowledgeBaseId": knowledge_base_id,
+                "dataSourceId": data_source_id,
+                "ingestionJobId": job_id,
+                "description": request.get("description", ""),
+                "status": "STARTING",
+                "statistics": {name: 0 for name in (
+                    "numberOfDocumentsScanned", "numberOfMetadataDocumentsScanned",
+                    "numberOfNewDocumentsIndexed", "numberOfModifiedDocumentsIndexed",
+                    "numberOfMetadataDocumentsModified", "numberOfDocumentsDeleted",
+                    "numberOfDocumentsFailed", "numberOfDocumentsSkipped")},
+                "startedAt": _now(),
+                "updatedAt": _now(),
+            }
+            self.jobs[(knowledge_base_id, data_source_id, job_id)] = job
+            response = {"ingestionJob": json.loads(json.dumps(job))}
+        self._later(self.job_step_latency.sample(), self._ingest, job, data_source)
+        return response
+
+    def get_ingestion_job(self, knowledge_base_id, data_source_id, job_id):
+        """
+        GetIngestionJob
+        :return: The response body
+        """
+        with self.lock:
+            job = self.jobs.get((knowledge_base_id, data_source_id, job_id))
+            if job is None:
+                raise ServiceError(404, "ResourceNotFoundException", f"No ingestion job {job_id}")
+            return {"ingestionJob": json.loads(json.dumps(job))}
+
+    def has_knowledge_base(self, knowledge_base_id):
+        with self.lock:
+            return knowledge_base_id in self.knowledge_bases
+
+    def retrieve(self, knowledge_base_id, request):
+        """
+        Retrieve, ranks the chunks by cosine similarity to the query. HYBRID search
+        adds the share of query words found in the chunk
+        :param knowledge_base_id: The knowledge base id
+        :param request: The request body
+        :return: The response body, paginated with the offset of the next page as nextToken
+        """
+        configuration = request.get("retrievalConfiguration", {}).get("vectorSearchConfiguration", {})
+        limit = configuration.get("numberOfResults", 5)
+        next_token = request.get("nextToken", "0")
+        offset = int(next_token) if next_token.isdigit() else 0
+        query = request["retrievalQuery"]["text"]
+
+        with self.lock:
+            self._knowledge_base(knowledge_base_id)
+            chunks, uris, vectors = self.indexes[knowledge_base_id].snapshot()
+
+        retrieval_filter = configuration.get("filter")
+        if retrieval_filter:
+            positions = np.array([i for i, (_, metadata) in enumerate(chunks)
+                                  if filter_matches(metadata, retrieval_filter)], dtype=np.int64)
+        else:
+            positions = np.arange(len(chunks))
+        scores = vectors[positions] @ embed_text(query, self.dimensions)
+        if configuration.get("overrideSearchType") == "HYBRID" and len(positions):
+            words = set(_WORD.findall(query.lower()))
+            overlap = np.array([len(words & set(_WORD.findall(chunks[i][0].lower()))) / max(1, len(words))
+                                for i in positions], dtype=np.float32)
+            scores = (scores + overlap) / 2
+
+        # Only the ranks up to the end of the requested page are sorted
+        end = min(offset + limit, len(positions))
+        if end < len(positions):
+            top = np.argpartition(-scores, end - 1)[:end] if end else np.zeros(0, dtype=np.int64)
+        else:
+            top = np.arange(len(positions))
+        top = top[np.argsort(-scores[top], kind="stable")][offset:end]
+
+        results = []
+        for i in top:
+            text, metadata = chunks[positions[i]]
+            results.append({
+                "content": {"text": text},
+                "location": {"type": "S3", "s3Location": {"uri": uris[positions[i]]}},
+                "metadata": metadata,
+                "score": round(float(scores[i]), 6),
+            })
+        response = {"retrievalResults": results}
+        if end < len(positions):
+            response["nextToken"] = str(end)
+        return response
+
+    def _ingest(self, job, data_source):
+        # Runs on a timer thread, nobody would see an error it raises and the job
+        # would stay IN_PROGRESS
+        try:
+            self._run_ingestion(job, data_source)
+        except Exception as e:
+            self._update_job(job, status="FAILED", failureReasons=[f"{type(e).__name__}: {e}"])
+
+    def _run_ingestion(self, job, data_source):
+        self._update_job(job, status="IN_PROGRESS")
+        knowledge_base_id = job["knowledgeBaseId"]
+        configuration = data_source["dataSourceConfiguration"]["s3Configuration"]
+        bucket = configuration["bucketArn"].split(":::")[-1]
+        folder = os.path.join(self.bucket_root, bucket)
+        if not os.path.isdir(folder):
+            self._update_job(job, status="FAILED", failureReasons=[f"The bucket {bucket} does not exist"])
+            return
+
+        chunking = data_source["vectorIngestionConfiguration"].get("chunkingConfiguration", {})
+        prefixes = configuration.get("inclusionPrefixes") or [""]
+        index = self.indexes[knowledge_base_id]
+        # Counted here and published as a copy under the lock, get_ingestion_job may be
+        # reading the job at the same time
+        statistics = dict(job["statistics"])
+        failures = []
+        seen = set()
+        for key in self._list_bucket(folder, prefixes):
+            uri = f"s3://{bucket}/{key}"
+            path = os.path.join(folder, key)
+            if not key.lower().endswith(SUPPORTED_EXTENSIONS):
+                statistics["numberOfDocumentsSkipped"] += 1
+                continue
+            statistics["numberOfDocumentsScanned"] += 1
+            seen.add(uri)
+            try:
+                metadata = {}
+                if os.path.exists(path + ".metadata.json"):
+                    statistics["numberOfMetadataDocumentsScanned"] += 1
+                    with open(path + ".metadata.json") as f:
+                        metadata = json.load(f).get("metadataAttributes", {})
+                with open(path, "rb") as f:
+                    content_hash = hashlib.sha256(f.read() + json.dumps(metadata, sort_keys=True).encode()).hexdigest()
+                previous = index.documents.get(uri)
+                if previous is not None and previous["hash"] == content_hash:
+                    continue
+                chunks = chunk_text(read_document(path), chunking)
+                vectors = np.array([embed_text(text, self.dimensions) for text in chunks], dtype=np.float32)
+                with self.lock:
+                    index.replace_document(data_source["dataSourceId"], uri, content_hash, chunks, vectors,
+                                           metadata)
+                name = "numberOfNewDocumentsIndexed" if previous is None else "numberOfModifiedDocumentsIndexed"
+                statistics[name] += 1
+            except Exception as e:
+                statistics["numberOfDocumentsFailed"] += 1
+                failures.append(f"{uri}: {e}")
+            self._update_job(job, statistics=dict(statistics))
+
+        with self.lock:
+            gone = [uri for uri, document in index.documents.items()
+                    if document["dataSourceId"] == data_source["dataSourceId"] and uri not in seen]
+            for uri in gone:
+                index.remove_document(uri)
+        statistics["numberOfDocumentsDeleted"] += len(gone)
+        self._update_job(job, status="COMPLETE", statistics=statistics,
+                         **({"failureReasons": failures} if failures else {}))
+
+    def _list_bucket(self, folder, prefixes):
+        # Keys in the order S3 lists them, metadata files are not documents
+        keys = []
+        for directory, _, files in os.walk(folder):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), folder).replace(os.sep, "/")
+                if not key.endswith(".metadata.json") and any(key.startswith(prefix) for prefix in prefixes):
+                    keys.append(key)
+        return sorted(keys)
+
+    def _update_job(self, job, **changes):
+        with self.lock:
+            job.update(changes)
+            job["updatedAt"] = _now()
+
+    def _set_status(self, resource, status):
+        with self.lock:
+            resource["status"] = status
+            resource["updatedAt"] = _now()
+
+    def _later(self, delay, function, *args):
+        timer = threading.Timer(delay, function, args)
+        timer.daemon = True
+        timer.start()
+
+    def _knowledge_base(self, knowledge_base_id):
+        knowledge_base = self.knowledge_bases.get(knowledge_base_id)
+        if knowledge_base is None:
+            raise ServiceError(404, "ResourceNotFoundException", f"No knowledge base {knowledge_base_id}")
+        return knowledge_base
+
+    def _data_source(self, knowledge_base_id, data_source_id):
+        self._knowledge_base(knowledge_base_id)
+        data_source = self.data_sources.get((knowledge_base_id, data_source_id))
+        if data_source is None:
+            raise ServiceError(404, "ResourceNotFoundException", f"No data source {data_source_id}")
+        return data_source
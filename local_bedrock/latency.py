@@ -0,0 +1,62 @@
+import math
+import random
+import time
+
+DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class LatencyModel():
+    """
+    Draws the latencies of the stub endpoints. A fixed latency hides queueing and tail
+    effects, so the stub can also draw them from a distribution with the given mean
+    """
+
+    def __init__(self, mean=0.0, distribution="fixed", sigma=0.5, seed=None):
+        """
+        Initializes the model
+        :param mean: The mean latency in seconds
+        :param distribution: fixed, uniform (0 to 2 * mean), exponential or lognormal
+        :param sigma: The shape of the lognormal distribution, larger means a longer tail
+        :param seed: Seed for reproducible runs
+        """
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {distribution}, use one of {DISTRIBUTIONS}")
+        self.mean = mean
+        self.distribution = distribution
+        self.sigma = sigma
+        self._random = random.Random(seed)
+
+    @classmethod
+    def of(cls, latency):
+        """
+        Returns latency if it already is a LatencyModel, else a fixed one
+        :param latency: A LatencyModel or seconds
+        :return: LatencyModel
+        """
+        return latency if isinstance(latency, LatencyModel) else cls(latency or 0.0)
+
+    def sample(self):
+        """
+        Draws one latency
+        :return: Seconds
+        """
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return self._random.uniform(0, 2 * self.mean)
+        if self.distribution == "exponential":
+            return self._random.expovariate(1 / self.mean)
+        if self.distribution == "lognormal":
+            # mu is chosen so the distribution keeps the configured mean
+            mu = math.log(self.mean) - self.sigma ** 2 / 2
+            return self._random.lognormvariate(mu, self.sigma)
+        return self.mean
+
+    def sleep(self):
+        """
+        Sleeps for one drawn latency
+        :return: None
+        """
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
@@ -0,0 +1,38 @@
+import secrets
+from datetime import datetime, timedelta, timezone
+
+ASSUME_ROLE_RESPONSE = """<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <Credentials>
+      <AccessKeyId>{access_key}</AccessKeyId>
+      <SecretAccessKey>{secret_key}</SecretAccessKey>
+      <SessionToken>{token}</SessionToken>
+      <Expiration>{expiration}</Expiration>
+    </Credentials>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROASTUB:{session_name}</AssumedRoleId>
+      <Arn>{role_arn}/{session_name}</Arn>
+    </AssumedRoleUser>
+  </AssumeRoleResult>
+  <ResponseMetadata>
+    <RequestId>stub-request</RequestId>
+  </ResponseMetadata>
+</AssumeRoleResponse>"""
+
+
+def assume_role_response(params):
+    """
+    Returns the xml body of an sts AssumeRole response with fresh random credentials
+    :param params: The decoded form parameters of the request
+    :return: The response body
+    """
+    duration = int(params.get("DurationSeconds", 3600))
+    expiration = datetime.now(timezone.utc) + timedelta(seconds=duration)
+    return ASSUME_ROLE_RESPONSE.format(
+        access_key="ASIA" + secrets.token_hex(8).upper(),
+        secret_key=secrets.token_hex(20),
+        token=secrets.token_hex(64),
+        expiration=expiration.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        session_name=params.get("RoleSessionName", "stub-session"),
+        role_arn=params.get("RoleArn", "arn:aws:iam::000000000000:role/stub").replace(":role/", ":assumed-role/"),
+    )
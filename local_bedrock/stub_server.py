@@ -0,0 +1,456 @@
+# A local stand-in for the bedrock-runtime, bedrock-agent-runtime, bedrock-agent and sts
+# endpoints, so clients and benchmarks can run without AWS. Supported are invoke_model,
+# invoke_model_with_response_stream, invoke_agent, retrieve, AssumeRole, list_agents and
+# list_agent_aliases of local_bedrock.agent_catalog and the knowledge base operations of
+# local_bedrock.knowledge_base. Point the clients at it with
+# endpoint_url or with the AWS_ENDPOINT_URL environment variable.
+#
+# python -m local_bedrock.stub_server --port 8765 --latency 0.05 --latency-distribution lognormal
+# python -m local_bedrock.stub_server --port 8765 --bucket-root ./local_buckets
+import argparse
+import functools
+import hashlib
+import json
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote
+
+import numpy as np
+
+from local_bedrock.agent_catalog import LocalAgents
+from local_bedrock.agent_runtime import agent_events, retrieve_response
+from local_bedrock.eventstream import encode_chunk_event, encode_json_event
+from local_bedrock.errors import ServiceError
+from local_bedrock.knowledge_base import LocalKnowledgeBases
+from local_bedrock.latency import DISTRIBUTIONS, LatencyModel
+from local_bedrock.sts import assume_role_response
+
+INVOKE_MODEL_PATH = re.compile(r"^/model/(?P<model_id>[^/]+)/(?P<action>invoke|invoke-with-response-stream)$")
+INVOKE_AGENT_PATH = re.compile(
+    r"^/agents/(?P<agent_id>[^/]+)/agentAliases/(?P<agent_alias_id>[^/]+)/sessions/(?P<session_id>[^/]+)/text$"
+)
+AGENTS_PATH = re.compile(r"^/agents/?$")
+AGENT_ALIASES_PATH = re.compile(r"^/agents/(?P<agent_id>[^/]+)/agentaliases/?$")
+RETRIEVE_PATH = re.compile(r"^/knowledgebases/(?P<knowledge_base_id>[^/]+)/retrieve$")
+KNOWLEDGE_BASES_PATH = re.compile(r"^/knowledgebases/?$")
+KNOWLEDGE_BASE_PATH = re.compile(r"^/knowledgebases/(?P<knowledge_base_id>[^/]+)$")
+DATA_SOURCES_PATH = re.compile(r"^/knowledgebases/(?P<knowledge_base_id>[^/]+)/datasources/?$")
+INGESTION_JOBS_PATH = re.compile(
+    r"^/knowledgebases/(?P<knowledge_base_id>[^/]+)/datasources/(?P<data_source_id>[^/]+)/ingestionjobs/?$"
+)
+INGESTION_JOB_PATH = re.compile(
+    r"^/knowledgebases/(?P<knowledge_base_id>[^/]+)/datasources/(?P<data_source_id>[^/]+)"
+    r"/ingestionjobs/(?P<ingestion_job_id>[^/]+)$"
+)
+STUB_ANSWER = "TajMahal is in Agra, Uttar Pradesh."
+
+
+@functools.lru_cache(maxsize=1024)
+def _embedding(text, dimensions):
+    # Deterministic per text, so caches and indexes built on the stub behave. Unit
+    # vectors in random directions, so different texts get different neighbours
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return tuple((vector / np.linalg.norm(vector)).tolist())
+
+
+def model_response(model_id, request_body, embedding_dimensions=1536):
+    """
+    Returns a response body in the format of the model
+    :param model_id: The bedrock model id
+    :param request_body: The decoded invoke_model request body
+    :param embedding_dimensions: The size of the returned embedding vectors
+    :return: The response body as a dict
+    """
+    text = STUB_ANSWER
+    if "embed" in model_id:
+        input_text = request_body.get("inputText", "")
+        embedding = _embedding(input_text, embedding_dimensions)
+        return {"embedding": embedding, "inputTextTokenCount": len(input_text.split())}
+    elif model_id.startswith("anthropic.") and "claude-3" in model_id:
+        return {"content": [{"type": "text", "text": text}], "stop_reason": "end_turn"}
+    elif model_id.startswith("anthropic."):
+        return {"completion": text, "stop_reason": "stop_sequence"}
+    elif model_id.startswith("meta."):
+        return {"generation": text, "stop_reason": "stop"}
+    elif model_id.startswith("mistral."):
+        return {"outputs": [{"text": text, "stop_reason": "stop"}]}
+    elif model_id.startswith("cohere."):
+        return {"generations": [{"text": text}]}
+
+    return {"results": [{"outputText": text, "completionReason": "FINISH"}]}
+
+
+def stream_chunks(model_id, input_tokens, text=STUB_ANSWER):
+    """
+    Returns the chunks of a streamed response in the format of the model, one word
+    per chunk. The last chunk carries the invocation metrics like the service does
+    :param model_id: The bedrock model id
+    :param input_tokens: The input token count reported in the metrics
+    :param text: The generated text
+    :return: list of chunk dicts
+    """
+    words = [word + " " for word in text.split()]
+    if model_id.startswith("anthropic.") and "claude-3" in model_id:
+        chunks = [{"type": "message_start", "message": {"role": "assistant", "content": []}},
+                  {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}]
+        chunks += [{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}}
+                   for word in words]
+        chunks += [{"type": "content_block_stop", "index": 0},
+                   {"type": "message_stop"}]
+    elif model_id.startswith("anthropic."):
+        chunks = [{"completion": word, "stop_reason": None} for word in words]
+    elif model_id.startswith("meta."):
+        chunks = [{"generation": word, "stop_reason": None} for word in words]
+    elif model_id.startswith("mistral."):
+        chunks = [{"outputs": [{"text": word, "stop_reason": None}]} for word in words]
+    elif model_id.startswith("cohere."):
+        chunks = [{"text": word, "is_finished": False} for word in words]
+    else:
+        chunks = [{"outputText": word, "index": 0} for word in words]
+
+    chunks[-1]["amazon-bedrock-invocationMetrics"] = {
+        "inputTokenCount": input_tokens,
+        "outputTokenCount": len(words),
+        "invocationLatency": 0,
+        "firstByteLatency": 0,
+    }
+    return chunks
+
+
+class BedrockStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_body = self.rfile.read(length)
+        path = unquote(self.path.split("?")[0])
+
+        if path == "/":
+            params = dict(parse_qsl(request_body.decode()))
+            if params.get("Action") == "AssumeRole":
+                self.server.latency.sleep()
+                self._send(200, assume_role_response(params).encode(), "text/xml")
+                return
+        elif INVOKE_MODEL_PATH.match(path):
+            self._invoke_model(INVOKE_MODEL_PATH.match(path), json.loads(request_body or b"{}"))
+            return
+        elif INVOKE_AGENT_PATH.match(path):
+            self._invoke_agent(INVOKE_AGENT_PATH.match(path), json.loads(request_body or b"{}"))
+            return
+        elif RETRIEVE_PATH.match(path):
+            self._retrieve(RETRIEVE_PATH.match(path), json.loads(request_body or b"{}"))
+            return
+        elif AGENTS_PATH.match(path):
+            self._service_call(200, self.server.agents.list_agents, json.loads(request_body or b"{}"))
+            return
+        elif AGENT_ALIASES_PATH.match(path):
+            self._service_call(200, self.server.agents.list_agent_aliases,
+                                      AGENT_ALIASES_PATH.match(path).group("agent_id"),
+                                      json.loads(request_body or b"{}"))
+            return
+
+        self._send_json(404, {"message": f"Unknown path {self.path}"},
+                        {"x-amzn-ErrorType": "ResourceNotFoundException"})
+
+    def do_PUT(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        path = unquote(self.path.split("?")[0])
+        knowledge_bases = self.server.knowledge_bases
+
+        if KNOWLEDGE_BASES_PATH.match(path):
+            self._service_call(202, knowledge_bases.create_knowledge_base, request)
+        elif DATA_SOURCES_PATH.match(path):
+            self._service_call(200, knowledge_bases.create_data_source,
+                                      DATA_SOURCES_PATH.match(path).group("knowledge_base_id"), request)
+        elif INGESTION_JOBS_PATH.match(path):
+            self._service_call(202, knowledge_bases.start_ingestion_job,
+                                      *INGESTION_JOBS_PATH.match(path).groups(), request)
+        else:
+            self._send_json(404, {"message": f"Unknown path {self.path}"},
+                            {"x-amzn-ErrorType": "ResourceNotFoundException"})
+
+    def do_GET(self):
+        path = unquote(self.path.split("?")[0])
+        knowledge_bases = self.server.knowledge_bases
+
+        if KNOWLEDGE_BASE_PATH.match(path):
+            self._service_call(200, knowledge_bases.get_knowledge_base,
+                                      KNOWLEDGE_BASE_PATH.match(path).group("knowledge_base_id"))
+        elif INGESTION_JOB_PATH.match(path):
+            self._service_call(200, knowledge_bases.get_ingestion_job, *INGESTION_JOB_PATH.match(path).groups())
+        else:
+            self._send_json(404, {"message": f"Unknown path {self.path}"},
+                            {"x-amzn-ErrorType": "ResourceNotFoundException"})
+
+    def _service_call(self, status, operation, *args):
+        self.server.latency.sleep()
+        try:
+            response = operation(*args)
+        except ServiceError as e:
+            self._send_json(e.status, {"message": str(e)}, {"x-amzn-ErrorType": e.error_type})
+            return
+        self._send_json(status, response, {})
+
+    def _invoke_model(self, match, request):
+        model_id = match.group("model_id")
+        if not self._admit(model_id):
+            return
+
+        self.server.latency.sleep()
+        input_tokens = len(json.dumps(request).split())
+        if match.group("action") == "invoke-with-response-stream":
+            self._send_events(encode_chunk_event(chunk) for chunk in stream_chunks(model_id, input_tokens))
+            return
+
+        response = model_response(model_id, request, self.server.embedding_dimensions)
+        self._send_json(200, response, {
+            "x-amzn-bedrock-input-token-count": str(input_tokens),
+            "x-amzn-bedrock-output-token-count": str(len(json.dumps(response).split())),
+        })
+
+    def _invoke_agent(self, match, request):
+        agent_id, agent_alias_id, session_id = match.group("agent_id", "agent_alias_id", "session_id")
+        if not self._admit(f"agent/{agent_id}/{agent_alias_id}"):
+            return
+
+        self.server.latency.sleep()
+        events = agent_events(agent_id, agent_alias_id, session_id, request.get("inputText", ""))
+
+        def encoded():
+            for event_type, payload in events:
+                yield encode_json_event(event_type, payload)
+                # The time until the next event is the duration of the next step
+                if event_type == "trace":
+                    self.server.step_latency.sleep()
+
+        self._send_events(encoded(), {"x-amz-bedrock-agent-session-id": session_id,
+                                      "x-amzn-bedrock-agent-content-type": "application/json"})
+
+    def _retrieve(self, match, request):
+        knowledge_base_id = match.group("knowledge_base_id")
+        if not self._admit(f"knowledgebase/{knowledge_base_id}"):
+            return
+
+        knowledge_bases = self.server.knowledge_bases
+        if knowledge_bases.has_knowledge_base(knowledge_base_id):
+            self._service_call(200, knowledge_bases.retrieve, knowledge_base_id, request)
+            return
+
+        # Knowledge bases that were not created on the stub answer with the stub documents
+        self.server.latency.sleep()
+        self._send_json(200, retrieve_response(knowledge_base_id, request), {})
+
+    def _admit(self, resource):
+        if self.server.admit(resource):
+            return True
+        self._send_json(429, {"message": "Too many requests, please wait before trying again."},
+                        {"x-amzn-ErrorType": "ThrottlingException"})
+        return False
+
+    def _send(self, status, payload, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("x-amzn-RequestId", "stub-request")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, body, headers):
+        self._send(status, json.dumps(body).encode(), "application/json", headers)
+
+    def _send_events(self, events, headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("x-amzn-RequestId", "stub-request")
+        self.send_header("x-amzn-bedrock-content-type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        for i, event in enumerate(events):
+            if i:
+                self.server.chunk_interval.sleep()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BedrockStubServer(ThreadingHTTPServer):
+    """
+    Threaded http server answering the supported operations after a latency drawn from
+    a LatencyModel. Streamed responses and agent responses send their events
+    chunk_interval apart, and agent trace steps take step_latency each.
+    With quota_rps set, it throttles each model, agent and knowledge base above that
+    many requests per second the way the service enforces its quotas. throttle_rate
+    throttles that share of the requests at random on top. Knowledge bases created on
+    the server read their documents from the bucket folders under bucket_root.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self,
+                 host="127.0.0.1",
+                 port=0,
+                 latency=0.0,
+                 embedding_dimensions=1536,
+                 quota_rps=None,
+                 chunk_interval=0.0,
+                 throttle_rate=0.0,
+                 step_latency=0.0,
+                 seed=None,
+                 bucket_root="./local_buckets",
+                 ingestion_step_latency=0.5,
+                 agents=3):
+        """
+        Initializes the server
+        :param host: The interface to listen on
+        :param port: The port to listen on, 0 picks a free port
+        :param latency: Seconds or LatencyModel, the time to the first byte of a response
+        :param embedding_dimensions: The size of the returned embedding vectors
+        :param quota_rps: Requests per second allowed per resource, None for no quota
+        :param chunk_interval: Seconds or LatencyModel between the events of a stream
+        :param throttle_rate: The share of requests throttled at random
+        :param step_latency: Seconds or LatencyModel every agent trace step takes
+        :param seed: Seed for reproducible throttling
+        :param bucket_root: The folder holding one folder per emulated S3 bucket
+        :param ingestion_step_latency: Seconds or LatencyModel an ingestion job stays
+        in STARTING and a new knowledge base in CREATING
+        :param agents: The number of agents list_agents returns
+        """
+        super().__init__((host, port), BedrockStubHandler)
+        self.latency = LatencyModel.of(latency)
+        self.embedding_dimensions = embedding_dimensions
+        self.quota_rps = quota_rps
+        self.chunk_interval = LatencyModel.of(chunk_interval)
+        self.throttle_rate = throttle_rate
+        self.step_latency = LatencyModel.of(step_latency)
+        self.knowledge_bases = LocalKnowledgeBases(bucket_root, job_step_latency=ingestion_step_latency)
+        self.agents = LocalAgents(agents)
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._quota_lock = threading.Lock()
+        self._buckets = {}
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self, resource):
+        """
+        Token bucket per resource with one second of burst, plus random throttling
+        :param resource: The model id, or agent/ and knowledgebase/ followed by the ids
+        :return: False if the request is throttled
+        """
+        if not self.quota_rps and not self.throttle_rate:
+            return True
+
+        with self._quota_lock:
+            admitted = self._random.random() >= self.throttle_rate
+            if admitted and self.quota_rps:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(resource, (self.quota_rps, now))
+                tokens = min(self.quota_rps, tokens + (now - last) * self.quota_rps)
+                admitted = tokens >= 1
+                if admitted:
+                    tokens -= 1
+                self._buckets[resource] = (tokens, now)
+            if not admitted:
+                self.throttled += 1
+
+        return admitted
+
+    def start(self):
+        """
+        Serves in a daemon thread
+        :return: The server
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def start_stub_process(latency=0.0,
+                       latency_distribution="fixed",
+                       chunk_interval=0.0,
+                       step_latency=0.0,
+                       quota_rps=None,
+                       throttle_rate=0.0,
+                       bucket_root="./local_buckets",
+                       ingestion_step_latency=0.5,
+                       agents=3):
+    """
+    Runs the stub in its own process, so it does not compete with the measured
+    clients for the GIL
+    :param latency: The mean time to the first byte of a response
+    :param latency_distribution: The distribution of all latencies, see LatencyModel
+    :param chunk_interval: The mean time between the events of a stream
+    :param step_latency: The mean time every agent trace step takes
+    :param quota_rps: Requests per second allowed per resource
+    :param throttle_rate: The share of requests throttled at random
+    :param bucket_root: The folder holding one folder per emulated S3 bucket
+    :param ingestion_step_latency: The time an ingestion job stays in STARTING
+    :param agents: The number of agents list_agents returns
+    :return: The process and the endpoint url
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    command = [sys.executable, "-m", "local_bedrock.stub_server", "--port", str(port),
+               "--latency", str(latency), "--latency-distribution", latency_distribution,
+               "--chunk-interval", str(chunk_interval), "--step-latency", str(step_latency),
+               "--throttle-rate", str(throttle_rate), "--bucket-root", bucket_root,
+               "--ingestion-step-latency", str(ingestion_step_latency), "--agents", str(agents)]
+    if quota_rps:
+        command += ["--quota-rps", str(quota_rps)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    process.stdout.readline()
+    return process, f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--latency-distribution", choices=DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--chunk-interval", type=float, default=0.0)
+    parser.add_argument("--step-latency", type=float, default=0.0)
+    parser.add_argument("--quota-rps", type=float, default=None)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bucket-root", default="./local_buckets")
+    parser.add_argument("--ingestion-step-latency", type=float, default=0.5)
+    parser.add_argument("--agents", type=int, default=3)
+    args = parser.parse_args()
+
+    def latency_model(mean):
+        return LatencyModel(mean, args.latency_distribution, args.latency_sigma, args.seed)
+
+    server = BedrockStubServer(args.host,
+                               args.port,
+                               latency=latency_model(args.latency),
+                               quota_rps=args.quota_rps,
+                               chunk_interval=latency_model(args.chunk_interval),
+                               throttle_rate=args.throttle_rate,
+                               step_latency=latency_model(args.step_latency),
+                               seed=args.seed,
+                               bucket_root=args.bucket_root,
+                               ingestion_step_latency=args.ingestion_step_latency,
+                               agents=args.agents)
+    print(f"bedrock stub listening on {server.endpoint_url}", flush=True)
+    server.serve_forever()
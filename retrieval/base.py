@@ -1,9 +1,73 @@
-from langchain_core.documents import Document
+import asyncio
+from abc import abstractmethod
+
+
+def matches(metadata, filters):
+    """
+    Checks the metadata of a chunk against filters in the form langchain FAISS takes,
+    a dict of key to value or list of allowed values, or a function of the metadata
+    :param metadata: The chunk metadata
+    :param filters: The filters, None matches everything
+    :return: True if the chunk passes
+    """
+    if filters is None:
+        return True
+    if callable(filters):
+        return filters(metadata)
+    for key, allowed in filters.items():
+        value = metadata.get(key)
+        if isinstance(allowed, (list, tuple, set)):
+            if value not in allowed:
+                return False
+        elif value != allowed:
+            return False
+    return True
 
 
 class Retrieval():
+    """
+    The retrieval contract. retrieve returns the k best chunks for a query as scored
+    hits, (Document, score) pairs best first where a higher score is better.
+    retrieve_batch does the same for many queries, retrievers backed by an index
+    override it to search all queries at once
+    """
+
     def __init__(self):
         self.module = "__name__"
 
-    def get_relevant_contex(self):
-        pass
\ No newline at end of file
+    @abstractmethod
+    def retrieve(self, query, k=4, filters=None):
+        """
+        Returns the best chunks for one query
+        :param query: The query text
+        :param k: The number of hits
+        :param filters: Metadata filters, a dict of key to value or list of values, or
+        a function of the metadata
+        :return: list of (Document, score), best first
+        """
+        pass
+
+    def retrieve_batch(self, queries, k=4, filters=None):
+        """
+        Returns the best chunks for every query, by default one retrieve per query
+        :param queries: The query texts
+        :param k: The number of hits per query
+        :param filters: Metadata filters applied to every query
+        :return: list with one list of (Document, score) per query
+        """
+        return [self.retrieve(query, k=k, filters=filters) for query in queries]
+
+    async def aretrieve(self, query, k=4, filters=None):
+        """
+        asyncio version of retrieve. Retrievers that do blocking io should override
+        it, the default runs retrieve in a worker thread
+        :return: list of (Document, score), best first
+        """
+        return await asyncio.to_thread(self.retrieve, query, k, filters)
+
+    async def aretrieve_batch(self, queries, k=4, filters=None):
+        """
+        asyncio version of retrieve_batch, runs it in a worker thread
+        :return: list with one list of (Document, score) per query
+        """
+        return await asyncio.to_thread(self.retrieve_batch, queries, k, filters)
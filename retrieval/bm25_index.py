@@ -0,0 +1,328 @@
+import json
+import os
+import re
+import shutil
+import uuid
+from collections import Counter
+
+import numpy as np
+
+# Keyword index for HybridRetrieval. The index is a list of immutable segments, each
+# a directory of numpy arrays that are memory mapped on load:
+#   offsets.npy  int64, the postings of term t are docs[offsets[t]:offsets[t + 1]]
+#   docs.npy     uint32, the segment local chunk numbers, sorted per term
+#   tfs.npy      uint16, the term frequency of every posting
+#   lengths.npy  uint32, the number of terms of every chunk
+#   terms.json   the vocabulary, term t is terms[t]
+#   ids.json     the chunk ids, chunk n is ids[n]
+# add writes a new segment, delete only records the deleted chunk numbers of every
+# segment in the manifest, found in an in-memory map of every live id to its segment
+# and chunk number. Once there are more than max_segments segments they are
+# merged into one, dropping the deleted chunks, so an update costs the size of the
+# change and not the size of the corpus.
+
+MANIFEST_NAME = "segments.json"
+
+# Words, numbers and identifiers such as LN-2024-00042 or policy/77.3, kept whole
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:#][a-z0-9]+)*")
+_PARTS = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    Splits text into lower case terms. An identifier is indexed whole and also by
+    its parts, so LN-2024-00042 is found by the full id and by 00042
+    :param text: The text
+    :return: list of terms
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(_PARTS.findall(token))
+    return terms
+
+
+def tokenize_query(text, is_indexed):
+    """
+    Splits a query into terms. An identifier that is indexed whole is looked up
+    whole, its parts such as LN are common and would only add long postings
+    :param text: The query
+    :param is_indexed: Function telling if a term is in the index
+    :return: list of distinct terms
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token.isalnum() or is_indexed(token):
+            terms.append(token)
+        else:
+            terms.extend(_PARTS.findall(token))
+    return list(dict.fromkeys(terms))
+
+
+class _Segment():
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(directory, "docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(directory, "tfs.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(directory, "lengths.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "terms.json")) as f:
+            self.terms = json.load(f)
+        with open(os.path.join(directory, "ids.json")) as f:
+            self.ids = json.load(f)
+        self.term_numbers = {term: number for number, term in enumerate(self.terms)}
+        self.live = np.ones(len(self.ids), dtype=bool)
+
+    def postings(self, term):
+        number = self.term_numbers.get(term)
+        if number is None:
+            return None, None
+        start, end = self.offsets[number], self.offsets[number + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def document_frequency(self, term):
+        number = self.term_numbers.get(term)
+        return 0 if number is None else int(self.offsets[number + 1] - self.offsets[number])
+
+    def triples(self):
+        # The postings as (term, chunk, tf) arrays, used when segments are merged
+        term_numbers = np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))
+        return term_numbers, np.asarray(self.docs), np.asarray(self.tfs)
+
+
+def _write_segment(directory, ids, terms, term_numbers, docs, tfs, lengths):
+    order = np.lexsort((docs, term_numbers))
+    term_numbers = term_numbers[order]
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_numbers, minlength=len(terms)), out=offsets[1:])
+
+    os.makedirs(directory)
+    np.save(os.path.join(directory, "offsets.npy"), offsets)
+    np.save(os.path.join(directory, "docs.npy"), docs[order].astype(np.uint32))
+    np.save(os.path.join(directory, "tfs.npy"), np.minimum(tfs[order], np.iinfo(np.uint16).max).astype(np.uint16))
+    np.save(os.path.join(directory, "lengths.npy"), np.asarray(lengths, dtype=np.uint32))
+    with open(os.path.join(directory, "terms.json"), "w") as f:
+        json.dump(terms, f)
+    with open(os.path.join(directory, "ids.json"), "w") as f:
+        json.dump(ids, f)
+
+
+class BM25Index():
+    """
+    Compact on-disk BM25 index over chunk ids. The scores of the postings of the
+    query terms are summed per chunk with bincount, so a lookup costs the length of
+    those postings. Rare terms such as loan ids or policy numbers have short postings
+    and are looked up in well under a millisecond on a million chunks
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75, max_segments=8):
+        """
+        Opens or creates the index
+        :param path: The folder of the index
+        :param k1: The term frequency saturation of BM25
+        :param b: The document length normalization of BM25
+        :param max_segments: The segments are merged into one when there are more
+        """
+        self.module = "BM25Index"
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.manifest_path = os.path.join(path, MANIFEST_NAME)
+        self._load()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def ids(self):
+        """
+        Returns the ids of the live chunks
+        :return: set of ids
+        """
+        return set(self._locations)
+
+    def add(self, ids, texts):
+        """
+        Indexes new chunks in a new segment. Adding an id that is already indexed
+        replaces its text
+        :param ids: The chunk ids
+        :param texts: The chunk texts
+        :return: None
+        """
+        if not ids:
+            return
+        self._delete(ids)
+
+        vocabulary = {}
+        term_numbers, docs, tfs, lengths = [], [], [], []
+        for doc, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                term_numbers.append(vocabulary.setdefault(term, len(vocabulary)))
+                docs.append(doc)
+                tfs.append(tf)
+
+        name = f"segment-{uuid.uuid4().hex}"
+        _write_segment(os.path.join(self.path, name), list(ids), list(vocabulary),
+                       np.array(term_numbers, dtype=np.int64), np.array(docs, dtype=np.int64),
+                       np.array(tfs, dtype=np.int64), lengths)
+        self.segments.append(_Segment(os.path.join(self.path, name)))
+        self._locate(self.segments[-1])
+        if len(self.segments) > self.max_segments:
+            self.merge()
+        else:
+            self._save()
+
+    def delete(self, ids):
+        """
+        Removes chunks from the results. The postings are dropped at the next merge
+        :param ids: The chunk ids
+        :return: The number of removed chunks
+        """
+        removed = self._delete(ids)
+        if removed:
+            self._save()
+        return removed
+
+    def merge(self):
+        """
+        Rewrites all segments as one without the deleted chunks
+        :return: None
+        """
+        vocabulary = {}
+        ids, lengths = [], []
+        all_terms, all_docs, all_tfs = [], [], []
+        for segment in self.segments:
+            term_numbers, docs, tfs = segment.triples()
+            keep = segment.live[docs]
+            # New chunk numbers are the ranks of the live chunks in the merged segment
+            renumber = np.cumsum(segment.live) - 1 + len(ids)
+            mapping = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in segment.terms],
+                               dtype=np.int64)
+            all_terms.append(mapping[term_numbers[keep]])
+            all_docs.append(renumber[docs[keep]])
+            all_tfs.append(tfs[keep].astype(np.int64))
+            ids.extend(id_ for id_, live in zip(segment.ids, segment.live) if live)
+            lengths.append(np.asarray(segment.lengths)[segment.live])
+
+        old = self.segments
+        self.segments = []
+        self._locations = {}
+        if ids:
+            name = f"segment-{uuid.uuid4().hex}"
+            _write_segment(os.path.join(self.path, name), ids, list(vocabulary),
+                           np.concatenate(all_terms), np.concatenate(all_docs), np.concatenate(all_tfs),
+                           np.concatenate(lengths))
+            self.segments.append(_Segment(os.path.join(self.path, name)))
+            self._locate(self.segments[-1])
+        self._save()
+        for segment in old:
+            shutil.rmtree(segment.directory, ignore_errors=True)
+
+    def search(self, query, k=4, accept=None):
+        """
+        Returns the best chunks for the query by BM25
+        :param query: The query text
+        :param k: The number of results
+        :param accept: Optional function of the chunk id, only accepted chunks are returned
+        :return: list of (id, score), best first
+        """
+        terms = tokenize_query(query, lambda term: any(term in segment.term_numbers for segment in self.segments))
+        total = sum(len(segment.ids) for segment in self.segments)
+        if not terms or not total:
+            return []
+
+        average_length = sum(float(np.sum(segment.lengths)) for segment in self.segments) / total
+        idf = {}
+        for term in terms:
+            frequency = sum(segment.document_frequency(term) for segment in self.segments)
+            if frequency:
+                idf[term] = np.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+
+        candidates = []
+        for number, segment in enumerate(self.segments):
+            postings = []
+            for term, weight in idf.items():
+                docs, tfs = segment.postings(term)
+                if docs is None:
+                    continue
+                tfs = tfs.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * segment.lengths[docs] / average_length)
+                postings.append((docs, weight * tfs * (self.k1 + 1) / (tfs + norm)))
+            if not postings:
+                continue
+
+            docs = np.concatenate([docs for docs, _ in postings])
+            contributions = np.concatenate([contribution for _, contribution in postings])
+            if len(docs) < len(segment.ids) // 16:
+                # Short postings, rare terms and ids, are summed without a dense array
+                docs, positions = np.unique(docs, return_inverse=True)
+                scores = np.bincount(positions, weights=contributions).astype(np.float32)
+            else:
+                scores = np.bincount(docs, weights=contributions, minlength=len(segment.ids)).astype(np.float32)
+                docs = np.flatnonzero(scores)
+                scores = scores[docs]
+            live = segment.live[docs]
+            docs, scores = docs[live], scores[live]
+            if accept is None and len(docs) > k:
+                # Without a filter only the top k of a segment can make the overall top k
+                top = np.argpartition(-scores, k - 1)[:k]
+                docs, scores = docs[top], scores[top]
+            candidates.append((np.full(len(docs), number), docs, scores))
+
+        if not candidates:
+            return []
+        segments, docs, scores = (np.concatenate(column) for column in zip(*candidates))
+        results = []
+        # Ids are only looked up for the candidates that are walked, best first
+        for position in np.argsort(-scores, kind="stable"):
+            id_ = self.segments[segments[position]].ids[docs[position]]
+            if accept is None or accept(id_):
+                results.append((id_, float(scores[position])))
+                if len(results) == k:
+                    break
+        return results
+
+    def _delete(self, ids):
+        removed = 0
+        for id_ in set(ids):
+            location = self._locations.pop(id_, None)
+            if location is not None:
+                segment, doc = location
+                segment.live[doc] = False
+                removed += 1
+        return removed
+
+    def _locate(self, segment):
+        # Maps the live chunks of the segment, an id given twice keeps its last chunk
+        for doc in np.flatnonzero(segment.live).tolist():
+            id_ = segment.ids[doc]
+            previous = self._locations.get(id_)
+            if previous is not None:
+                previous[0].live[previous[1]] = False
+            self._locations[id_] = (segment, doc)
+
+    def _load(self):
+        self.segments = []
+        self._locations = {}
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        for entry in manifest["segments"]:
+            segment = _Segment(os.path.join(self.path, entry["name"]))
+            segment.live[entry["deleted"]] = False
+            self.segments.append(segment)
+            self._locate(segment)
+
+    def _save(self):
+        os.makedirs(self.path, exist_ok=True)
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"segments": [{"name": os.path.basename(segment.directory),
+                                     "deleted": np.flatnonzero(~segment.live).tolist()}
+                                    for segment in self.segments]}, f)
+        os.replace(temporary_path, self.manifest_path)
@@ -1,6 +1,6 @@
 from langchain_core.documents import Document
 
-from retrieval.base import Retrieval
+from retrieval.base import Retrieval, matches
 
 
 class ContextRetrieval(Retrieval):
@@ -8,6 +8,9 @@ class ContextRetrieval(Retrieval):
         super().__init__()
         self.module ="__name__"
 
-    def get_relevant_contex(self):
-        documents = Document(page_content="TajMahal is in Agra, Uttar Pradesh", metadata={"source":"wikipedia"})
-        return documents
\ No newline at end of file
+    def retrieve(self, query, k=4, filters=None):
+        documents = [Document(page_content="TajMahal is in Agra, Uttar Pradesh", metadata={"source":"wikipedia"})]
+        return [(document, 1.0) for document in documents if matches(document.metadata, filters)][:k]
+
+    async def aretrieve(self, query, k=4, filters=None):
+        return self.retrieve(query, k=k, filters=filters)
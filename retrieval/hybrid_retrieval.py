@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+
+from retrieval.base import Retrieval, matches
+from retrieval.bm25_index import BM25Index
+from retrieval.vector_retrieval import search_vectors
+from vectorstore.incremental_faiss import IncrementalFaissIndex
+
+
+def _normalize(scores):
+    # Min-max to 0..1, so BM25 and vector scores can be added
+    if not scores:
+        return {}
+    values = np.array(list(scores.values()), dtype=np.float32)
+    low, high = values.min(), values.max()
+    if high == low:
+        return {id_: 1.0 for id_ in scores}
+    return {id_: float((score - low) / (high - low)) for id_, score in scores.items()}
+
+
+class HybridRetrieval(Retrieval):
+    """
+    Retrieves chunks by keywords and by meaning. A BM25 index over the chunk texts
+    finds exact terms such as loan ids and policy numbers that vector search misses,
+    the FAISS index finds paraphrases. Both return fetch_k candidates, their scores
+    are min-max normalized and fused as alpha * vector + (1 - alpha) * keyword.
+    Both indexes are kept under index_store and updated incrementally by update.
+    A batch of queries is embedded at once and searched with one FAISS search
+    """
+
+    def __init__(self, index_store, embeddings, k=4, fetch_k=50, alpha=0.5, model_id=None):
+        """
+        Initializes the retrieval
+        :param index_store: The folder of the FAISS index, the BM25 index is kept in
+        its bm25 subfolder
+        :param embeddings: The langchain embeddings
+        :param k: The default number of results
+        :param fetch_k: The number of candidates taken from each index
+        :param alpha: The weight of the vector score, 1 - alpha is the weight of BM25
+        :param model_id: The embedding model, see IncrementalFaissIndex
+        """
+        super().__init__()
+        self.module = "HybridRetrieval"
+        self.embeddings = embeddings
+        self.k = k
+        self.fetch_k = fetch_k
+        self.alpha = alpha
+        self.vector_index = IncrementalFaissIndex(index_store, embeddings, model_id=model_id)
+        self.keyword_index = BM25Index(os.path.join(index_store, "bm25"))
+        self.vectorstore = self.vector_index.load()
+        self._sync_keywords()
+
+    def update(self, docs):
+        """
+        Adds the new and changed chunks of the sources in docs to both indexes and
+        removes the chunks of those sources that are gone
+        :param docs: The current chunks of one or more sources
+        :return: dict with the number of added, removed and unchanged chunks
+        """
+        changes = self.vector_index.update(docs)
+        self.vectorstore = self.vector_index.vectorstore
+        self._sync_keywords()
+        return changes
+
+    def remove_sources(self, sources):
+        """
+        Removes every chunk of the sources from both indexes
+        :param sources: The sources, the source metadata of the chunks
+        :return: The number of removed chunks
+        """
+        removed = self.vector_index.remove_sources(sources)
+        self.vectorstore = self.vector_index.vectorstore
+        self._sync_keywords()
+        return removed
+
+    def retrieve(self, query, k=None, filters=None):
+        """
+        Returns the best chunks for the query
+        :param query: The query text
+        :param k: The number of results, self.k by default
+        :param filters: Metadata filters, a dict of key to value or list of values, or
+        a function of the metadata
+        :return: list of (Document, score), best first, the score is between 0 and 1
+        """
+        return self.retrieve_batch([query], k=k, filters=filters)[0]
+
+    def retrieve_batch(self, queries, k=None, filters=None):
+        """
+        Returns the best chunks for every query. The queries are embedded together
+        and the vector candidates of all of them come from one FAISS search
+        :param queries: The query texts
+        :param k: The number of results per query, self.k by default
+        :param filters: Metadata filters applied to every query
+        :return: list with one list of (Document, score) per query
+        """
+        k = k or self.k
+        if not queries:
+            return []
+        if self.vectorstore is None:
+            return [[] for _ in queries]
+        docstore = self.vectorstore.docstore
+
+        def accept(id_):
+            return matches(docstore.search(id_).metadata, filters)
+
+        vectors = self.embeddings.embed_documents(list(queries))
+        vector_hits = search_vectors(self.vectorstore, vectors, self.fetch_k, filters)
+
+        results = []
+        for query, hits in zip(queries, vector_hits):
+            keyword_scores = dict(self.keyword_index.search(query, self.fetch_k,
+                                                            accept=accept if filters is not None else None))
+            # L2 distance to a similarity, higher is better
+            vector_scores = {id_: -distance for id_, distance, _ in hits}
+
+            keyword_scores = _normalize(keyword_scores)
+            vector_scores = _normalize(vector_scores)
+            fused = {id_: self.alpha * vector_scores.get(id_, 0.0) + (1 - self.alpha) * keyword_scores.get(id_, 0.0)
+                     for id_ in vector_scores.keys() | keyword_scores.keys()}
+            best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+            results.append([(docstore.search(id_), score) for id_, score in best])
+        return results
+
+    def _sync_keywords(self):
+        # The FAISS index is the source of truth, this also repairs a BM25 index that
+        # missed an update because the process stopped in between
+        stored = set() if self.vectorstore is None else set(self.vectorstore.index_to_docstore_id.values())
+        indexed = self.keyword_index.ids()
+        if indexed - stored:
+            self.keyword_index.delete(indexed - stored)
+        new = sorted(stored - indexed)
+        if new:
+            self.keyword_index.add(new, [self.vectorstore.docstore.search(id_).page_content for id_ in new])
@@ -0,0 +1,216 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from langchain_core.documents import Document
+
+from clients.bedrock_client_factory import get_bedrock_client
+from retrieval.base import Retrieval
+
+# The operators of a bedrock RetrievalFilter, a filter dict using one of them is
+# passed to the service as it is
+FILTER_OPERATORS = {"andAll", "equals", "greaterThan", "greaterThanOrEquals", "in", "lessThan",
+                    "lessThanOrEquals", "listContains", "notEquals", "notIn", "orAll", "startsWith",
+                    "stringContains"}
+
+
+def to_retrieval_filter(filters):
+    """
+    Converts the dict filters of the Retrieval contract, key to value or list of
+    values, into a bedrock RetrievalFilter
+    :param filters: The filters, a RetrievalFilter is returned unchanged
+    :return: The RetrievalFilter, None if there is nothing to filter on the service
+    """
+    if not filters or callable(filters):
+        return None
+    if len(filters) == 1 and next(iter(filters)) in FILTER_OPERATORS:
+        return filters
+
+    conditions = []
+    for key, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            conditions.append({"in": {"key": key, "value": list(value)}})
+        else:
+            conditions.append({"equals": {"key": key, "value": value}})
+    return conditions[0] if len(conditions) == 1 else {"andAll": conditions}
+
+
+class _CoalescingTTLCache():
+    """
+    Cache of results that expire after ttl_seconds. Identical requests that arrive
+    while the first one is in flight wait for its result instead of calling again
+    """
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_call(self, key, call):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        # Whatever ends the call, KeyboardInterrupt included, the waiters are released
+        # and the key is freed for the next caller
+        error = None
+        try:
+            value = call()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if error is None:
+                    self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class KnowledgeBaseRetrieval(Retrieval):
+    """
+    Retrieves chunks from a bedrock knowledge base with the retrieve api. Pages are
+    fetched lazily, the next page is only requested when the caller reads past the
+    current one. Every page is cached for ttl_seconds by knowledge base, query,
+    retrieval configuration and nextToken, and identical concurrent requests share
+    one call to the service
+    """
+
+    def __init__(self,
+                 knowledge_base_id,
+                 client=None,
+                 region_name="us-east-1",
+                 search_type=None,
+                 ttl_seconds=300,
+                 max_entries=1024):
+        """
+        Initializes the retrieval
+        :param knowledge_base_id: The knowledge base id
+        :param client: The bedrock-agent-runtime client, the shared one by default
+        :param region_name: The region of the shared client
+        :param search_type: The default search type, HYBRID or SEMANTIC, None lets
+        the knowledge base decide
+        :param ttl_seconds: How long a page stays cached
+        :param max_entries: The most pages cached, the least recently used are dropped
+        """
+        super().__init__()
+        self.module = "KnowledgeBaseRetrieval"
+        self.knowledge_base_id = knowledge_base_id
+        self.client = client or get_bedrock_client(service_name="bedrock-agent-runtime", region_name=region_name)
+        self.search_type = search_type
+        self.cache = _CoalescingTTLCache(ttl_seconds, max_entries)
+
+    def iter_results(self, query, page_size=10, filters=None, search_type=None):
+        """
+        Yields the retrieval results of the query page by page, following nextToken
+        :param query: The query text
+        :param page_size: The numberOfResults of every page
+        :param filters: A bedrock RetrievalFilter, or the dict filters of the Retrieval
+        contract. Function filters are applied to the metadata of the results
+        :param search_type: HYBRID or SEMANTIC, the default of the retrieval if None
+        :return: generator of retrieval results in the shape of the retrieve api
+        """
+        configuration = {"numberOfResults": page_size}
+        retrieval_filter = to_retrieval_filter(filters)
+        if retrieval_filter is not None:
+            configuration["filter"] = retrieval_filter
+        search_type = search_type or self.search_type
+        if search_type is not None:
+            configuration["overrideSearchType"] = search_type
+
+        next_token = None
+        while True:
+            page = self.retrieve_page(query, configuration, next_token)
+            for result in page["retrievalResults"]:
+                if not callable(filters) or filters(result.get("metadata", {})):
+                    yield result
+            next_token = page.get("nextToken")
+            if not next_token:
+                return
+
+    def retrieve_page(self, query, configuration, next_token=None):
+        """
+        Returns one page of the retrieve api, from the cache if possible. Every call
+        gets its own copy of the page, so callers may change it
+        :param query: The query text
+        :param configuration: The vectorSearchConfiguration
+        :param next_token: The nextToken of the previous page
+        :return: dict with retrievalResults and nextToken if there are more results
+        """
+        key = (self.knowledge_base_id, query, json.dumps(configuration, sort_keys=True), next_token)
+
+        def call():
+            request = {
+                "knowledgeBaseId": self.knowledge_base_id,
+                "retrievalQuery": {"text": query},
+                "retrievalConfiguration": {"vectorSearchConfiguration": configuration},
+            }
+            if next_token:
+                request["nextToken"] = next_token
+            response = self.client.retrieve(**request)
+            page = {"retrievalResults": response["retrievalResults"]}
+            if response.get("nextToken"):
+                page["nextToken"] = response["nextToken"]
+            return page
+
+        return copy.deepcopy(self.cache.get_or_call(key, call))
+
+    def retrieve(self, query, k=4, filters=None):
+        """
+        Returns the best chunks for the query
+        :param query: The query text
+        :param k: The number of results
+        :param filters: A bedrock RetrievalFilter or the filters of the Retrieval contract
+        :return: list of (Document, score), best first
+        """
+        hits = []
+        for result in self.iter_results(query, page_size=k, filters=filters):
+            metadata = dict(result.get("metadata", {}))
+            location = result.get("location", {})
+            if location.get("type") == "S3":
+                metadata.setdefault("source", location["s3Location"]["uri"])
+            hits.append((Document(page_content=result["content"]["text"], metadata=metadata),
+                         result.get("score", 0.0)))
+            if len(hits) == k:
+                break
+        return hits
+
+    def stats(self):
+        """
+        Returns the cache counters
+        :return: dict with hits, misses and coalesced requests
+        """
+        with self.cache.lock:
+            return {"hits": self.cache.hits, "misses": self.cache.misses, "coalesced": self.cache.coalesced}
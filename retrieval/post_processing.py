@@ -0,0 +1,123 @@
+import numpy as np
+
+
+def select_diverse(query_vector,
+                   candidate_vectors,
+                   k=4,
+                   lambda_mult=0.5,
+                   score_threshold=None,
+                   duplicate_threshold=None,
+                   sources=None,
+                   max_per_source=None):
+    """
+    Selects up to k candidates by maximal marginal relevance. Every step scores all
+    remaining candidates at once, lambda_mult * similarity to the query minus
+    (1 - lambda_mult) * highest similarity to an already selected candidate, and
+    updates that highest similarity with one matrix-vector product. The candidate
+    matrix is never copied or normalized, the products are divided by the norms
+    :param query_vector: The query embedding
+    :param candidate_vectors: The candidate embeddings, one row per candidate
+    :param k: The number of candidates to select
+    :param lambda_mult: 1 ranks by relevance only, 0 by diversity only
+    :param score_threshold: Candidates whose cosine similarity to the query is lower
+    are dropped
+    :param duplicate_threshold: Candidates whose cosine similarity to a selected
+    candidate reaches it are dropped as near duplicates
+    :param sources: The source of every candidate, needed for max_per_source
+    :param max_per_source: The most candidates selected from one source
+    :return: list of the selected candidate positions, in selection order
+    """
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    if len(candidates) == 0 or k <= 0:
+        return []
+    norms = np.maximum(np.sqrt(np.einsum("ij,ij->i", candidates, candidates)), 1e-12)
+    query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    relevance = candidates @ query_vector / (norms * max(np.linalg.norm(query_vector), 1e-12))
+
+    available = np.ones(len(candidates), dtype=bool)
+    if score_threshold is not None:
+        available &= relevance >= score_threshold
+    if max_per_source is not None and sources is not None:
+        numbers = {}
+        source_numbers = np.array([numbers.setdefault(source, len(numbers)) for source in sources], dtype=np.int64)
+        source_counts = np.zeros(len(numbers), dtype=np.int64)
+    else:
+        source_numbers = None
+
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    selected = []
+    while len(selected) < k and available.any():
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+
+        similarity = candidates @ candidates[best] / (norms * norms[best])
+        np.maximum(redundancy, similarity, out=redundancy)
+        if duplicate_threshold is not None:
+            available &= similarity < duplicate_threshold
+        if source_numbers is not None:
+            source = source_numbers[best]
+            source_counts[source] += 1
+            if source_counts[source] >= max_per_source:
+                available &= source_numbers != source
+    return selected
+
+
+class MMRPostProcessor():
+    """
+    Cuts a list of retrieved candidates down to the chunks worth putting into the
+    prompt: relevant enough, not near duplicates of each other and not too many from
+    one pdf page or document. All candidates are handled as one matrix, see
+    select_diverse
+    """
+
+    def __init__(self,
+                 lambda_mult=0.5,
+                 score_threshold=None,
+                 duplicate_threshold=0.95,
+                 max_per_source=None,
+                 source_key="source"):
+        """
+        Initializes the post processor
+        :param lambda_mult: 1 ranks by relevance only, 0 by diversity only
+        :param score_threshold: The lowest cosine similarity to the query that is kept
+        :param duplicate_threshold: The cosine similarity from which two chunks are
+        near duplicates
+        :param max_per_source: The most chunks kept from one source
+        :param source_key: The metadata key of the source, for example source, or a
+        function of the metadata such as lambda m: (m["source"], m["page"]) for pages
+        """
+        self.module = "MMRPostProcessor"
+        self.lambda_mult = lambda_mult
+        self.score_threshold = score_threshold
+        self.duplicate_threshold = duplicate_threshold
+        self.max_per_source = max_per_source
+        self.source_key = source_key
+
+    def process(self, query_vector, hits, candidate_vectors, k=4):
+        """
+        Selects the hits to keep
+        :param query_vector: The query embedding
+        :param hits: The (Document, score) candidates of a retriever
+        :param candidate_vectors: The embeddings of the candidates, in the same order
+        :param k: The number of hits to keep
+        :return: list of (Document, score), in selection order
+        """
+        sources = None
+        if self.max_per_source is not None:
+            if callable(self.source_key):
+                sources = [self.source_key(document.metadata) for document, _ in hits]
+            else:
+                sources = [document.metadata.get(self.source_key) for document, _ in hits]
+        selected = select_diverse(query_vector, candidate_vectors, k=k,
+                                  lambda_mult=self.lambda_mult,
+                                  score_threshold=self.score_threshold,
+                                  duplicate_threshold=self.duplicate_threshold,
+                                  sources=sources,
+                                  max_per_source=self.max_per_source)
+        return [hits[position] for position in selected]
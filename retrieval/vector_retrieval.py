@@ -0,0 +1,94 @@
+import numpy as np
+
+from retrieval.base import Retrieval, matches
+from vectorstore.mmap_faiss import enable_reconstruct
+
+
+def search_vectors(vectorstore, vectors, k, filters=None, overfetch=4):
+    """
+    Searches a langchain FAISS store for many query vectors with one index search
+    over the query matrix
+    :param vectorstore: The FAISS vector store
+    :param vectors: The query vectors, one row per query
+    :param k: The number of hits per query
+    :param filters: Metadata filters, see retrieval.base.matches
+    :param overfetch: With filters, k * overfetch candidates are searched per query
+    :return: list with one list of (docstore id, L2 distance, index position) per
+    query, nearest first
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = vectorstore.index
+    fetch_k = min(k if filters is None else k * overfetch, index.ntotal)
+    if fetch_k == 0:
+        return [[] for _ in vectors]
+
+    distances, positions = index.search(vectors, fetch_k)
+    results = []
+    for row_distances, row_positions in zip(distances, positions):
+        hits = []
+        for distance, position in zip(row_distances, row_positions):
+            if position < 0:
+                continue
+            id_ = vectorstore.index_to_docstore_id[position]
+            if filters is None or matches(vectorstore.docstore.search(id_).metadata, filters):
+                hits.append((id_, float(distance), int(position)))
+                if len(hits) == k:
+                    break
+        results.append(hits)
+    return results
+
+
+class VectorRetrieval(Retrieval):
+    """
+    Retrieves chunks from a langchain FAISS store. A batch of queries is embedded
+    with one embed_documents call, BatchedBedrockEmbeddings embeds them concurrently,
+    and searched with one FAISS search over the query matrix. With a post processor
+    fetch_k candidates are searched and the post processor picks k of them, with
+    their vectors read back from the index
+    """
+
+    def __init__(self, vectorstore, embeddings=None, post_processor=None, fetch_k=20):
+        """
+        Initializes the retrieval
+        :param vectorstore: The FAISS vector store, for example VectorSearchWithBedrock.load_vector()
+        :param embeddings: The langchain embeddings of the queries, those of the store by default
+        :param post_processor: Optional MMRPostProcessor applied to the candidates.
+        The index must then be able to reconstruct its vectors, see
+        vectorstore.mmap_faiss.enable_reconstruct, else ValueError is raised
+        :param fetch_k: The number of candidates searched per query for the post processor
+        """
+        super().__init__()
+        self.module = "VectorRetrieval"
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings or vectorstore.embeddings
+        self.post_processor = post_processor
+        self.fetch_k = fetch_k
+        if post_processor is not None:
+            enable_reconstruct(vectorstore.index)
+
+    def retrieve(self, query, k=4, filters=None):
+        return self.retrieve_batch([query], k=k, filters=filters)[0]
+
+    def retrieve_batch(self, queries, k=4, filters=None):
+        """
+        Returns the best chunks for every query. The score is 1 / (1 + L2 distance)
+        :param queries: The query texts
+        :param k: The number of hits per query
+        :param filters: Metadata filters applied to every query
+        :return: list with one list of (Document, score) per query
+        """
+        if not queries:
+            return []
+        vectors = self.embeddings.embed_documents(list(queries))
+        docstore = self.vectorstore.docstore
+        fetch_k = k if self.post_processor is None else max(k, self.fetch_k)
+
+        results = []
+        for vector, hits in zip(vectors, search_vectors(self.vectorstore, vectors, fetch_k, filters)):
+            scored = [(docstore.search(id_), 1 / (1 + distance)) for id_, distance, _ in hits]
+            if self.post_processor is not None and scored:
+                candidate_vectors = self.vectorstore.index.reconstruct_batch(
+                    np.array([position for _, _, position in hits], dtype=np.int64))
+                scored = self.post_processor.process(vector, scored, candidate_vectors, k=k)
+            results.append(scored)
+        return results
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+
+from langchain_community.vectorstores.faiss import FAISS
+
+MANIFEST_NAME = "manifest.json"
+
+
+def chunk_ids(docs):
+    """
+    Returns the content address of every chunk, sha256 of its source, text and
+    metadata. Identical chunks of one source get an occurrence suffix, so they are
+    kept as often as they appear, the way FAISS.from_documents keeps them
+    :param docs: The chunks in langchain Document schema
+    :return: list of ids
+    """
+    ids = []
+    seen = {}
+    for doc in docs:
+        content = f"{doc.metadata.get('source', '')}\0{doc.page_content}\0" \
+                  f"{json.dumps(doc.metadata, sort_keys=True, default=str)}"
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{digest}:{occurrence}")
+    return ids
+
+
+class IncrementalFaissIndex():
+    """
+    Keeps a FAISS index in sync with a changing set of chunks. Next to the index a
+    manifest records the content hash and the source of every stored chunk. An update
+    embeds only the chunks whose hash is not in the manifest and removes the chunks of
+    the updated sources that are gone, so its cost follows the size of the change and
+    not the size of the corpus. Sources that are not part of an update stay untouched,
+    use remove_sources to drop a whole document. Vectors of another embedding model
+    cannot be kept, when the model changes every call raises until rebuild is given
+    the whole corpus.
+    """
+
+    def __init__(self, index_store, embeddings, model_id=None):
+        """
+        Initializes the index
+        :param index_store: The folder of the FAISS index and the manifest
+        :param embeddings: The langchain embeddings used for new chunks
+        :param model_id: The embedding model, the index has to be rebuilt when it
+        changes. Taken from embeddings.model_id by default
+        """
+        self.module = "IncrementalFaissIndex"
+        self.index_store = index_store
+        self.embeddings = embeddings
+        self.model_id = model_id or getattr(embeddings, "model_id", None)
+        self.manifest_path = os.path.join(index_store, MANIFEST_NAME)
+        # The store as of the last load, update, rebuild or remove_sources
+        self.vectorstore = None
+
+    def update(self, docs):
+        """
+        Adds the new and changed chunks of the sources in docs and removes the
+        chunks of those sources that are no longer there
+        :param docs: The current chunks of one or more sources
+        :return: dict with the number of added, removed and unchanged chunks
+        """
+        ids = chunk_ids(docs)
+        vectorstore, manifest = self._load()
+        self.vectorstore = vectorstore
+        if vectorstore is None:
+            if docs:
+                vectorstore = FAISS.from_documents(docs, self.embeddings, ids=ids)
+                self._save(vectorstore, {id_: doc.metadata.get("source", "") for id_, doc in zip(ids, docs)})
+            return {"added": len(docs), "removed": 0, "unchanged": 0}
+
+        sources = {doc.metadata.get("source", "") for doc in docs}
+        current = set(ids)
+        stale = [id_ for id_, source in manifest.items() if source in sources and id_ not in current]
+        new = [(id_, doc) for id_, doc in zip(ids, docs) if id_ not in manifest]
+
+        if stale:
+            vectorstore.delete(stale)
+            for id_ in stale:
+                del manifest[id_]
+        if new:
+            vectorstore.add_documents([doc for _, doc in new], ids=[id_ for id_, _ in new])
+            manifest.update((id_, doc.metadata.get("source", "")) for id_, doc in new)
+        if stale or new:
+            self._save(vectorstore, manifest)
+
+        return {"added": len(new), "removed": len(stale), "unchanged": len(docs) - len(new)}
+
+    def rebuild(self, docs):
+        """
+        Replaces the index with one of docs, embedding every chunk. Use it when the
+        embedding model changed
+        :param docs: Every chunk of the corpus, the chunks of sources that are not in
+        docs are gone afterwards
+        :return: dict with the number of added, removed and unchanged chunks
+        """
+        if not docs:
+            raise ValueError("A rebuild needs the chunks of the whole corpus, docs is empty")
+        stored = self._stored_manifest()
+        ids = chunk_ids(docs)
+        vectorstore = FAISS.from_documents(docs, self.embeddings, ids=ids)
+        self._save(vectorstore, {id_: doc.metadata.get("source", "") for id_, doc in zip(ids, docs)})
+        return {"added": len(docs), "removed": len(stored["chunks"]) if stored else 0, "unchanged": 0}
+
+    def remove_sources(self, sources):
+        """
+        Removes every chunk of the sources
+        :param sources: The sources, the source metadata of the chunks
+        :return: The number of removed chunks
+        """
+        vectorstore, manifest = self._load()
+        self.vectorstore = vectorstore
+        if vectorstore is None:
+            return 0
+
+        sources = set(sources)
+        stale = [id_ for id_, source in manifest.items() if source in sources]
+        if stale:
+            vectorstore.delete(stale)
+            for id_ in stale:
+                del manifest[id_]
+            self._save(vectorstore, manifest)
+
+        return len(stale)
+
+    def load(self):
+        """
+        Loads the index, raises ValueError if it was embedded with another model
+        :return: The FAISS vector store, None if nothing was stored yet
+        """
+        self.vectorstore = self._load()[0]
+        return self.vectorstore
+
+    def _load(self):
+        if not os.path.exists(os.path.join(self.index_store, "index.faiss")):
+            return None, {}
+
+        manifest = {}
+        stored = self._stored_manifest()
+        if stored is not None:
+            if stored.get("model_id") != self.model_id:
+                # Rebuilding from the docs of one update would drop every other source
+                raise ValueError(f"The index at {self.index_store} was embedded with {stored.get('model_id')}, "
+                                 f"not {self.model_id}. Call rebuild with every chunk of the corpus")
+            manifest = stored["chunks"]
+
+        # The index was written by this class, deserializing its docstore is safe
+        vectorstore = FAISS.load_local(self.index_store, self.embeddings, allow_dangerous_deserialization=True)
+        if len(manifest) != vectorstore.index.ntotal:
+            # Missing, or the process stopped between saving the index and the manifest
+            manifest = {id_: vectorstore.docstore.search(id_).metadata.get("source", "")
+                        for id_ in vectorstore.index_to_docstore_id.values()}
+
+        return vectorstore, manifest
+
+    def _stored_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _save(self, vectorstore, manifest):
+        self.vectorstore = vectorstore
+        vectorstore.save_local(self.index_store)
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"model_id": self.model_id, "chunks": manifest}, f)
+        os.replace(temporary_path, self.manifest_path)
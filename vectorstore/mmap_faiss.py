@@ -0,0 +1,226 @@
+import math
+import os
+import uuid
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.faiss import FAISS
+
+# Vector store backend for indexes that are too big to load into every process.
+# The index is read with IO_FLAG_MMAP_IFC, so the vectors stay in the file and the
+# operating system page cache is shared by every process that searches it. Flat
+# search is exact, IVF and HNSW trade recall for latency, see
+# benchmarks/bench_vector_index.py for the numbers.
+#
+# Any index type can also store quantized codes instead of float32 vectors: fp16
+# halves the memory, sq8 (8 bit scalar quantization) quarters it and pq (product
+# quantization) keeps one byte per subvector. With rerank the exact vectors are
+# written next to the codes, the search scans the codes and re-ranks the best
+# rerank_factor * k candidates against the exact vectors. Read memory mapped, only
+# the rows of those candidates are paged in, so the codes are all that has to stay
+# resident. See benchmarks/bench_quantization.py for memory against recall.
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = (None, "fp16", "sq8", "pq")
+SCALAR_QUANTIZERS = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+MMAP_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def _pq_shape(count, dimensions, pq_m):
+    # The number of subquantizers has to divide the dimensions, by default one byte
+    # per 16 dimensions. Small corpora get fewer bits, k-means needs a point per code
+    if pq_m is None:
+        pq_m = next(m for m in range(max(1, dimensions // 16), 0, -1) if dimensions % m == 0)
+    elif dimensions % pq_m:
+        raise ValueError(f"pq_m {pq_m} does not divide the {dimensions} dimensions")
+    return pq_m, max(1, min(8, int(math.log2(max(count, 2)))))
+
+
+def build_faiss_index(vectors,
+                      index_type="flat",
+                      nlist=None,
+                      hnsw_m=32,
+                      ef_construction=200,
+                      quantization=None,
+                      pq_m=None,
+                      rerank=True,
+                      rerank_factor=4):
+    """
+    Builds an L2 index over the vectors, the metric langchain FAISS uses by default
+    :param vectors: float32 matrix, one row per chunk
+    :param index_type: flat (exact), ivf (inverted lists) or hnsw (graph)
+    :param nlist: The number of ivf lists, about 4 * sqrt(n) by default
+    :param hnsw_m: The number of graph neighbours per vector of hnsw
+    :param ef_construction: The search depth used while building hnsw
+    :param quantization: None stores float32 vectors, fp16, sq8 or pq store codes
+    :param pq_m: The number of pq subquantizers, one byte each, dimensions / 16 by default
+    :param rerank: If true the exact vectors are stored too and the best candidates
+    of a quantized search are re-ranked against them
+    :param rerank_factor: The number of candidates re-ranked, as a multiple of k
+    :return: The faiss index
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dimensions = vectors.shape
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization}, use one of {QUANTIZATIONS}")
+    if quantization == "pq":
+        pq_m, pq_bits = _pq_shape(count, dimensions, pq_m)
+
+    if index_type == "flat":
+        if quantization is None:
+            index = faiss.IndexFlatL2(dimensions)
+        elif quantization == "pq":
+            index = faiss.IndexPQ(dimensions, pq_m, pq_bits)
+        else:
+            index = faiss.IndexScalarQuantizer(dimensions, SCALAR_QUANTIZERS[quantization])
+    elif index_type == "ivf":
+        # faiss wants about 39 training points per list
+        nlist = nlist or max(1, min(int(4 * math.sqrt(count)), count // 39))
+        coarse_quantizer = faiss.IndexFlatL2(dimensions)
+        if quantization is None:
+            index = faiss.IndexIVFFlat(coarse_quantizer, dimensions, nlist)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(coarse_quantizer, dimensions, nlist, pq_m, pq_bits)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(coarse_quantizer, dimensions, nlist,
+                                                  SCALAR_QUANTIZERS[quantization])
+    elif index_type == "hnsw":
+        if quantization is None:
+            index = faiss.IndexHNSWFlat(dimensions, hnsw_m)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dimensions, pq_m, hnsw_m, pq_bits)
+        else:
+            index = faiss.IndexHNSWSQ(dimensions, SCALAR_QUANTIZERS[quantization], hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"Unknown index type {index_type}, use one of {INDEX_TYPES}")
+
+    if quantization is not None and rerank:
+        index = faiss.IndexRefineFlat(index)
+        index.k_factor = rerank_factor
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def base_index(index):
+    """
+    Returns the index that is searched first, the quantized index of a re-ranking index
+    :param index: The faiss index
+    :return: The faiss index
+    """
+    if isinstance(index, faiss.IndexRefine):
+        return faiss.downcast_index(index.base_index)
+    return index
+
+
+def code_size(index):
+    """
+    Returns the bytes stored per vector by the searched index, without the graph of
+    hnsw, the ivf list ids and the exact vectors kept for re-ranking
+    :param index: The faiss index
+    :return: The number of bytes
+    """
+    index = base_index(index)
+    if hasattr(index, "storage"):
+        index = faiss.downcast_index(index.storage)
+    return index.code_size
+
+
+def read_mmap_index(path):
+    """
+    Memory maps an index written with faiss.write_index. The index is read only
+    :param path: The index file
+    :return: The faiss index
+    """
+    return faiss.read_index(path, MMAP_FLAGS)
+
+
+def configure_search(index, nprobe=None, ef_search=None, rerank_factor=None):
+    """
+    Sets the recall/latency knobs of the approximate indexes, flat ignores them
+    :param index: The faiss index
+    :param nprobe: The number of ivf lists searched per query
+    :param ef_search: The search depth of hnsw
+    :param rerank_factor: The number of candidates re-ranked against the exact
+    vectors, as a multiple of k. Only used by quantized indexes built with rerank
+    :return: The index
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = nprobe
+    searched = base_index(index)
+    if hasattr(searched, "hnsw") and ef_search:
+        searched.hnsw.efSearch = ef_search
+    if isinstance(index, faiss.IndexRefine) and rerank_factor:
+        index.k_factor = rerank_factor
+    return index
+
+
+def enable_reconstruct(index):
+    """
+    Makes the stored vectors readable with reconstruct. An ivf index needs a direct
+    map from ids to list entries for that, it is built in memory, 8 bytes per
+    vector, also for a memory mapped index
+    :param index: The faiss index
+    :return: The index, raises ValueError if it cannot reconstruct
+    """
+    if index.ntotal == 0:
+        return index
+    try:
+        index.reconstruct(0)
+        return index
+    except RuntimeError:
+        pass
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    try:
+        index.reconstruct(0)
+    except RuntimeError as e:
+        raise ValueError(f"{type(index).__name__} cannot reconstruct its vectors: {e}") from e
+    return index
+
+
+def build_vector_store(docs, embeddings, index_type="flat", **index_options):
+    """
+    Embeds the documents and builds a langchain FAISS store on the chosen index type
+    :param docs: The chunks in langchain Document schema
+    :param embeddings: The langchain embeddings
+    :param index_type: flat, ivf or hnsw
+    :param index_options: Passed on to build_faiss_index, for example quantization
+    :return: The FAISS vector store, save it with save_local
+    """
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+    index = build_faiss_index(vectors, index_type, **index_options)
+    ids = [str(uuid.uuid4()) for _ in docs]
+
+    return FAISS(embedding_function=embeddings,
+                 index=index,
+                 docstore=InMemoryDocstore(dict(zip(ids, docs))),
+                 index_to_docstore_id=dict(enumerate(ids)))
+
+
+def load_mmap_vector_store(index_store, embeddings, nprobe=None, ef_search=None, rerank_factor=None):
+    """
+    Loads a store saved with save_local with its index memory mapped. The docstore
+    is still unpickled into the process
+    :param index_store: The folder the store was saved to
+    :param embeddings: The langchain embeddings for the queries
+    :param nprobe: The number of ivf lists searched per query
+    :param ef_search: The search depth of hnsw
+    :param rerank_factor: The number of candidates re-ranked by a quantized index,
+    as a multiple of k
+    :return: The read only FAISS vector store
+    """
+    if not os.path.exists(os.path.join(index_store, "index.faiss")):
+        raise FileNotFoundError(f"No index in {index_store}")
+
+    # The store is written by this repo, deserializing its docstore is safe
+    vectorstore = FAISS.load_local(index_store, embeddings, allow_dangerous_deserialization=True,
+                                   io_flags=MMAP_FLAGS)
+    configure_search(vectorstore.index, nprobe=nprobe, ef_search=ef_search, rerank_factor=rerank_factor)
+    return vectorstore